@@ -1,4 +1,5 @@
 from typing import TypedDict
+from app.RequestContext import RequestContext
 
 class AgentState(TypedDict):
     """
@@ -9,8 +10,14 @@ class AgentState(TypedDict):
         output (str): The output or response generated by the agent.
         username (str): The identifier of the user associated with this state.
         reminder (str): A reminder or additional context the agent needs to keep.
+        reminder_timings (dict): Per-source status and latency of the reminder check.
+        trace (dict): Span context of the chat turn (app.Tracing), parent of the node spans.
+        context (RequestContext): Patient record, managers and LLM client shared by the nodes of the turn.
     """
     input: str
     output: str
     username: str
-    reminder: str
\ No newline at end of file
+    reminder: str
+    reminder_timings: dict
+    trace: dict
+    context: RequestContext
\ No newline at end of file
@@ -31,4 +31,10 @@ def handle_chat(state: AgentState) -> AgentState:
         "output": full_response,
         "username": username,
         "reminder": ""
-    }
\ No newline at end of file
+    }
+
+async def ahandle_chat(state: AgentState) -> AgentState:
+    """
+    Async version of handle_chat for the async graph. The reply needs no I/O.
+    """
+    return handle_chat(state)
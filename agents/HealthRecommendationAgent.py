@@ -1,16 +1,40 @@
+import asyncio
 import json
 import re
 import textwrap
 from app.GroqChat import GroqChat
 from typing import List, Dict, Optional
-import requests
-from bs4 import BeautifulSoup
 import streamlit as st
 from datetime import datetime
 
-from app.MedicalRecordManager import MedicalRecordManager
-from app.SymptomManager import SymptomManager
-from app.ChatHistoryManager import ChatHistoryManager
+from app.RequestContext import get_request_context
+from app.NHSGuidanceIndex import get_nhs_index, parse_nhs_links, parse_page_text
+from app.NHSPageFetcher import get_nhs_fetcher
+
+NHS_PASSAGES = 6
+
+def build_patient_record(medical_record_manager):
+    """
+    Builds the patient context passed to HealthRecommendationAgent.
+
+    Args:
+        medical_record_manager (MedicalRecordManager): Manager with a loaded record.
+
+    Returns:
+        dict: Patient fields used by the recommendation prompts.
+    """
+    record = medical_record_manager.record
+    return {
+        "name": record.get("name", "Unknown"),
+        "gender": record.get("gender", "unknown"),
+        "age": record.get("age", "unknown"),
+        "surgery": medical_record_manager.get_surgery_info().get("surgery", ""),
+        "pre_existing_conditions": medical_record_manager.get_pre_existing_conditions(),
+        "allergies": record.get("allergies", []),
+        "medications": medical_record_manager.get_medications(),
+        "past_medical_history": record.get("past_medical_history", ""),
+        "social_history": record.get("social_history", ""),
+    }
 
 def handle_recommendation_query(state):
     """
@@ -18,70 +42,82 @@ def handle_recommendation_query(state):
     medical records, recent symptoms, and chat context.
     """    
     user_input = state["input"]
-    username = st.session_state["username"]    
+    username = state.get("username") or st.session_state["username"]
+
+    context = get_request_context(state, username)
 
     # Build patient record
-    medical_record_manager = MedicalRecordManager(username)
-    patient_record = {
-        "name": medical_record_manager.record.get("name", "Unknown"),
-        "gender": medical_record_manager.record.get("gender", "unknown"),
-        "age": medical_record_manager.record.get("age", "unknown"),
-        "surgery": medical_record_manager.get_surgery_info().get("surgery", ""),
-        "pre_existing_conditions": medical_record_manager.get_pre_existing_conditions(),
-        "allergies": medical_record_manager.record.get("allergies", []),
-        "medications": medical_record_manager.get_medications(),
-        "past_medical_history": medical_record_manager.record.get("past_medical_history", ""),
-        "social_history": medical_record_manager.record.get("social_history", ""),
-    }
-    # Get recent symptoms and chat history
-    symptom_manager = SymptomManager(username)
-    stored_symptoms = symptom_manager.filter_recent_symptoms(3)
-    chat_history_manager  = ChatHistoryManager(username)
-    chat_context = chat_history_manager.load()
+    patient_record = build_patient_record(context.medical_record_manager)
+    # Get recent symptoms and chat context (recent turns plus a summary of older ones)
+    stored_symptoms = context.symptom_manager.filter_recent_symptoms(3)
+    chat_context = context.chat_context.build_context()
 
     # Generate recommendation
-    agent = HealthRecommendationAgent(patient_record)
+    agent = HealthRecommendationAgent(patient_record, groq=context.groq)
     recommendation = agent.generate_recommendation(stored_symptoms, chat_context=chat_context,  user_query=user_input)
     recommendation = f"📋 " + recommendation                
     return {"output": recommendation, "username": username}
 
+async def ahandle_recommendation_query(state):
+    """
+    Async version of handle_recommendation_query. The record, symptoms, chat
+    context and NHS guidance are loaded concurrently.
+    """
+    user_input = state["input"]
+    username = state["username"]
+    context = get_request_context(state, username)
+    medical_record_manager, stored_symptoms, chat_context = await asyncio.gather(
+        context.amedical_record_manager(),
+        context.symptom_manager.afilter_recent_symptoms(3),
+        context.chat_context.abuild_context(),
+    )
+    agent = HealthRecommendationAgent(build_patient_record(medical_record_manager), groq=context.groq)
+    recommendation = await agent.agenerate_recommendation(stored_symptoms, chat_context=chat_context, user_query=user_input)
+    return {"output": f"📋 " + recommendation, "username": username}
+
 def handle_recommendation_query_with_symptoms(state):
     """
     Generates a recommendation including all stored symptoms.
     """
     user_input = state["input"]
-    username = st.session_state["username"]
-    medical_record_manager = MedicalRecordManager(username)
-    patient_record = {
-        "name": medical_record_manager.record.get("name", "Unknown"),
-        "gender": medical_record_manager.record.get("gender", "unknown"),
-        "age": medical_record_manager.record.get("age", "unknown"),
-        "surgery": medical_record_manager.get_surgery_info().get("surgery", ""),
-        "pre_existing_conditions": medical_record_manager.get_pre_existing_conditions(),
-        "allergies": medical_record_manager.record.get("allergies", []),
-        "medications": medical_record_manager.get_medications(),
-        "past_medical_history": medical_record_manager.record.get("past_medical_history", ""),
-        "social_history": medical_record_manager.record.get("social_history", ""),
-    }
+    username = state.get("username") or st.session_state["username"]
+    context = get_request_context(state, username)
+    patient_record = build_patient_record(context.medical_record_manager)
     # Include all stored symptoms
-    symptom_manager = SymptomManager(username)
-    stored_symptoms = symptom_manager.get_all()    
-    agent = HealthRecommendationAgent(patient_record)
+    stored_symptoms = context.symptom_manager.get_all("prompt")
+    agent = HealthRecommendationAgent(patient_record, groq=context.groq)
     recommendation = agent.generate_recommendation_with_symptoms(stored_symptoms,  user_query=user_input)
     return {"output": recommendation, "username": username}
 
+async def ahandle_recommendation_query_with_symptoms(state):
+    """
+    Async version of handle_recommendation_query_with_symptoms.
+    """
+    user_input = state["input"]
+    username = state["username"]
+    context = get_request_context(state, username)
+    medical_record_manager, stored_symptoms = await asyncio.gather(
+        context.amedical_record_manager(),
+        context.symptom_manager.aget_all("prompt"),
+    )
+    agent = HealthRecommendationAgent(build_patient_record(medical_record_manager), groq=context.groq)
+    recommendation = await agent.agenerate_recommendation_with_symptoms(stored_symptoms, user_query=user_input)
+    return {"output": recommendation, "username": username}
+
 class HealthRecommendationAgent:
     """
     Generates health recommendations using patient records,
     symptoms, chat context, and NHS guidelines.
     """
-    def __init__(self, patient_record: Dict):
+    def __init__(self, patient_record: Dict, groq: GroqChat = None):
         self.patient_record = patient_record
-        self.groq = GroqChat()        
+        self.groq = groq or GroqChat()
 
-    def build_prompt(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query = "") -> str:
+    def build_prompt(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query = "",
+                     nhs_context: Optional[str] = None) -> str:
         """
         Build the prompt with patient context, symptoms, and NHS guidance.
+        NHS guidance is fetched synchronously unless nhs_context is given.
         """
         # Flatten historical symptom records
         flat = []
@@ -104,7 +140,10 @@ class HealthRecommendationAgent:
         # JSON serialization
         patient_json = json.dumps(patient_ctx, ensure_ascii=False, separators=(",", ":"))
         symptoms_json = json.dumps(flat, ensure_ascii=False, separators=(",", ":"))
-        nhs_context = self.get_nhs_recommendations(self.patient_record.get("surgery", ""))
+        if nhs_context is None:
+            nhs_context = self.get_nhs_recommendations(
+                self.patient_record.get("surgery", ""), query=self.nhs_query(symptoms, user_query)
+            )
         nhs_ctx = (nhs_context or "")[:4000]
         patient_name = self.patient_record.get("name", "Patient")
         prompt = textwrap.dedent(f"""
@@ -144,9 +183,11 @@ class HealthRecommendationAgent:
             prompt += f"\n\nThe patient's current question is:\n\"{user_query.strip()}\"\n"
         return prompt
     
-    def build_prompt_with_symptoms(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query = "") -> str:
+    def build_prompt_with_symptoms(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query = "",
+                                   nhs_context: Optional[str] = None) -> str:
         """
         Build the prompt with detailed symptoms included.
+        NHS guidance is fetched synchronously unless nhs_context is given.
         """
         # Flatten historical symptom records
         flat = []
@@ -171,7 +212,10 @@ class HealthRecommendationAgent:
         # JSON serialization
         patient_json = json.dumps(patient_ctx, ensure_ascii=False, separators=(",", ":"))
         symptoms_json = json.dumps(flat, ensure_ascii=False, separators=(",", ":"))
-        nhs_context = self.get_nhs_recommendations(self.patient_record.get("surgery", ""))
+        if nhs_context is None:
+            nhs_context = self.get_nhs_recommendations(
+                self.patient_record.get("surgery", ""), query=self.nhs_query(symptoms, user_query)
+            )
         nhs_ctx = (nhs_context or "")[:4000]
 
         patient_name = self.patient_record.get("name", "Patient")
@@ -216,13 +260,31 @@ class HealthRecommendationAgent:
     def generate_recommendation_with_symptoms(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query="") -> str:
         """Generate a recommendation including detailed symptoms."""
         prompt = self.build_prompt_with_symptoms(symptoms, chat_context, user_query)
-        response = self.groq.get_chat_response(prompt)
+        response = self.groq.get_chat_response(prompt, reply=True)
         return response.strip()
     
     def generate_recommendation(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query="") -> str:
         """Generate a recommendation without including symptom details."""
         prompt = self.build_prompt(symptoms, chat_context, user_query)
-        response = self.groq.get_chat_response(prompt)
+        response = self.groq.get_chat_response(prompt, reply=True)
+        return response.strip()
+
+    async def agenerate_recommendation_with_symptoms(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query="") -> str:
+        """Async version of generate_recommendation_with_symptoms."""
+        nhs_context = await self.aget_nhs_recommendations(
+            self.patient_record.get("surgery", ""), query=self.nhs_query(symptoms, user_query)
+        )
+        prompt = self.build_prompt_with_symptoms(symptoms, chat_context, user_query, nhs_context=nhs_context)
+        response = await self.groq.aget_chat_response(prompt, reply=True)
+        return response.strip()
+
+    async def agenerate_recommendation(self, symptoms: List[Dict], chat_context: Optional[str] = None, user_query="") -> str:
+        """Async version of generate_recommendation."""
+        nhs_context = await self.aget_nhs_recommendations(
+            self.patient_record.get("surgery", ""), query=self.nhs_query(symptoms, user_query)
+        )
+        prompt = self.build_prompt(symptoms, chat_context, user_query, nhs_context=nhs_context)
+        response = await self.groq.aget_chat_response(prompt, reply=True)
         return response.strip()
 
     def build_nhs_search_url(self, surgery_name: str) -> str:
@@ -232,48 +294,83 @@ class HealthRecommendationAgent:
 
     def fetch_top_nhs_links(self, url: str, n: int = 2) -> List[str]:
         """Fetch the top NHS guideline links related to recovery/complications."""
-        resp = requests.get(url)
-        soup = BeautifulSoup(resp.text, "html.parser")        
-        anchors = soup.select("a.app-search-results-item")
-        keywords = ["recovery", "recover", "complication", "complicate", "problem", "issue", "risk"]        
-        urls = []
-        for a in anchors:
-            href = a.get("href")
-            if not href:
-                continue
-            # Extract final URL if it's a tracking link
-            match = re.search(r"url=([^&]+)", href)
-            if match:
-                clean_path = requests.utils.unquote(match.group(1))
-                # Check if the clean path has the expected structure
-                if "/tests-and-treatments/" not in clean_path:
-                    continue
-                full_url = "https://www.nhs.uk" + clean_path
-                # Check if any keyword is in the clean URL
-                if any(kw in clean_path.lower() for kw in keywords):
-                    urls.append(full_url)
-            if len(urls) >= n:
-                break
-        return urls
+        return self.parse_nhs_links(get_nhs_fetcher().fetch(url), n)
+
+    def parse_nhs_links(self, html: str, n: int = 2) -> List[str]:
+        """Pick the top recovery/complication guideline links from an NHS search page."""
+        return parse_nhs_links(html, n)
 
     def fetch_page_text(self, url: str) -> str:
         """Extract readable text from an NHS page."""
-        resp = requests.get(url)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        paragraphs = soup.select("article p, article li, article h2")
-        return "\n".join(p.get_text() for p in paragraphs)
+        return self.parse_page_text(get_nhs_fetcher().fetch(url))
+
+    def parse_page_text(self, html: str) -> str:
+        """Extract the article paragraphs, list items and headings from an NHS page."""
+        return parse_page_text(html)
+
+    def nhs_query(self, symptoms: List[Dict], user_query: str = "") -> str:
+        """
+        Builds the guidance index query from the reported symptom names and
+        the patient's question (the surgery is added by the lookup).
+        """
+        names = []
+        for item in symptoms or []:
+            entries = item.get("symptoms", [item]) if isinstance(item, dict) else [item]
+            for entry in entries:
+                if isinstance(entry, dict):
+                    names.append(entry.get("name") or entry.get("symptom") or "")
+                else:
+                    names.append(str(entry))
+        return " ".join([*names, user_query or ""]).strip()
+
+    def _indexed_guidance(self, surgery_name: str, query: str) -> Optional[str]:
+        index = get_nhs_index()
+        if index is None:
+            return None
+        return index.context_for(f"{surgery_name} {query}", k=NHS_PASSAGES) or None
+
+    def get_nhs_recommendations(self, surgery_name: str, n: int = 2, query: str = "") -> str:
+        """
+        Retrieve NHS recommendations for a given surgery. The passages most
+        relevant to the surgery and query come from the local guidance index;
+        nhs.uk is only scraped (and truncated) when no index has been built.
+        """
+        if not surgery_name:
+            return "No NHS information available for unknown surgery."
+        indexed = self._indexed_guidance(surgery_name, query)
+        if indexed:
+            return indexed
+        try:
+            links = self.fetch_top_nhs_links(self.build_nhs_search_url(surgery_name), n)
+        except Exception as e:
+            print(f"Error searching NHS guidance: {e}")
+            return ""
+        return self._join_pages(links, get_nhs_fetcher().fetch_many(links))
 
-    def get_nhs_recommendations(self, surgery_name: str, n: int = 2) -> str:
-        """Retrieve and truncate NHS recommendations for a given surgery."""
+    async def aget_nhs_recommendations(self, surgery_name: str, n: int = 2, query: str = "") -> str:
+        """
+        Async version of get_nhs_recommendations. Without a local index the
+        guideline pages are fetched concurrently through the loop's shared
+        httpx.AsyncClient and the page cache.
+        """
         if not surgery_name:
             return "No NHS information available for unknown surgery."
-        search_url = self.build_nhs_search_url(surgery_name)
-        links = self.fetch_top_nhs_links(search_url, n)
+        indexed = self._indexed_guidance(surgery_name, query)
+        if indexed:
+            return indexed
+        fetcher = get_nhs_fetcher()
+        try:
+            links = self.parse_nhs_links(await fetcher.afetch(self.build_nhs_search_url(surgery_name)), n)
+        except Exception as e:
+            print(f"Error searching NHS guidance: {e}")
+            return ""
+        return self._join_pages(links, await fetcher.afetch_many(links))
+
+    def _join_pages(self, links: List[str], pages: list) -> str:
         all_text = ""
-        for link in links:
-            try:
-                all_text += self.fetch_page_text(link) + "\n\n"
-            except Exception as e:
-                all_text += f"[Error retrieving content from {link}]: {e}\n\n"
-        truncated = all_text[:4000]  # Prevent token overflow to the model
-        return truncated
+        for link, page in zip(links, pages):
+            if isinstance(page, Exception):
+                all_text += f"[Error retrieving content from {link}]: {page}\n\n"
+            else:
+                all_text += self.parse_page_text(page) + "\n\n"
+        return all_text[:4000]  # Prevent token overflow to the model
@@ -2,8 +2,7 @@ from agents.AgentState import AgentState
 from app.GroqChat import GroqChat
 from typing import Dict, List, Optional
 
-from app.MedicalRecordManager import MedicalRecordManager
-from app.SymptomManager import SymptomManager
+from app.RequestContext import get_request_context
 
 agent_instance = None  # cache global
 
@@ -22,18 +21,18 @@ def handle_medical_record_query(state: AgentState) -> AgentState:
     username = state["username"]
     user_input = state["input"]
     reminder = state.get("reminder", "")
+    context = get_request_context(state, username)
     # Load patient medical record
-    record_manager = MedicalRecordManager(username)
-    medical_history = record_manager.record  # todo el JSON como dict
+    medical_history = context.record  # todo el JSON como dict
     if not medical_history:
         response = "⚠️ No medical record found for this user."
     else:
         # Load patient symptoms and build an agent
-        symptom_manager = SymptomManager(username)
-        symptoms = symptom_manager.get_all()
+        symptoms = context.symptom_manager.get_all("prompt")
         agent = MedicalRecordAgent(
             medical_history=medical_history,
-            symptoms_history=symptoms
+            symptoms_history=symptoms,
+            groq=context.groq
         )
         response = agent.answer_question(user_input)
 
@@ -45,15 +44,42 @@ def handle_medical_record_query(state: AgentState) -> AgentState:
         "reminder": state.get("reminder", "")
     }
 
+async def ahandle_medical_record_query(state: AgentState) -> AgentState:
+    """
+    Async version of handle_medical_record_query, used by the async graph.
+    """
+    username = state["username"]
+    user_input = state["input"]
+    reminder = state.get("reminder", "")
+    context = get_request_context(state, username)
+    record_manager = await context.amedical_record_manager()
+    medical_history = record_manager.record
+    if not medical_history:
+        response = "⚠️ No medical record found for this user."
+    else:
+        symptoms = await context.symptom_manager.aget_all("prompt")
+        agent = MedicalRecordAgent(
+            medical_history=medical_history,
+            symptoms_history=symptoms,
+            groq=context.groq
+        )
+        response = await agent.aanswer_question(user_input)
+    return {
+        "input": user_input,
+        "output": f"{reminder}{response}",
+        "username": username,
+        "reminder": reminder
+    }
+
 class MedicalRecordAgent:
     """
     Agent for answering questions based on a patient's medical record
     and symptom history.
     """
-    def __init__(self, medical_history: Dict, symptoms_history: List[Dict]):
+    def __init__(self, medical_history: Dict, symptoms_history: List[Dict], groq: GroqChat = None):
         self.medical_history = medical_history
         self.symptoms_history = symptoms_history
-        self.groq = GroqChat()
+        self.groq = groq or GroqChat()
 
     def build_prompt(self, user_question: str) -> str:
         """
@@ -100,5 +126,11 @@ class MedicalRecordAgent:
     def answer_question(self, user_question: str) -> str:
         """Generates an answer to the user’s question using the language model."""
         prompt = self.build_prompt(user_question)
-        response = self.groq.get_chat_response(prompt)
+        response = self.groq.get_chat_response(prompt, reply=True)
+        return response.strip()
+
+    async def aanswer_question(self, user_question: str) -> str:
+        """Async version of answer_question."""
+        prompt = self.build_prompt(user_question)
+        response = await self.groq.aget_chat_response(prompt, reply=True)
         return response.strip()
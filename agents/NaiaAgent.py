@@ -1,6 +1,9 @@
+import asyncio
 from app.GroqChat import GroqChat
+from app.IntentPreClassifier import get_intent_classifier
 from agents.HealthRecommendationAgent import handle_recommendation_query
 from agents.HealthRecommendationAgent import handle_recommendation_query_with_symptoms
+from agents.HealthRecommendationAgent import ahandle_recommendation_query_with_symptoms
 import streamlit as st
 
 router = GroqChat()
@@ -9,8 +12,11 @@ class NaiaAgent:
     """
     Agent responsible for handling patient interactions related to symptoms.
     """
-    def __init__(self, medical_record: dict):
+    def __init__(self, medical_record: dict, username: str = None, context=None):
         self.medical_record = medical_record
+        self.username = username
+        # RequestContext of the turn, so the recommendation reuses its record and clients
+        self.context = context
 
     def handle_symptom_notification(self, symptom: str, severity: str):
         """
@@ -24,26 +30,57 @@ class NaiaAgent:
             str: The generated recommendation for the symptom.
         """
         print(f"📬 NaiaAgent received the symptom '{symptom}' con severidad '{severity}'")
+        response = handle_recommendation_query_with_symptoms(self._symptom_state(symptom, severity))
+        return response.get("output", "")
+
+    async def ahandle_symptom_notification(self, symptom: str, severity: str):
+        """Async version of handle_symptom_notification."""
+        response = await ahandle_recommendation_query_with_symptoms(self._symptom_state(symptom, severity))
+        return response.get("output", "")
+
+    def _symptom_state(self, symptom: str, severity: str) -> dict:
         state = {
             "input": f"I have the symptom '{symptom}' classified as '{severity}'. What medical recommendations are there?",
-            "username": st.session_state.get("username")
+            "username": self.username or st.session_state.get("username")
         }
-        response = handle_recommendation_query_with_symptoms(state)
-        return response.get("output", "")
+        if self.context is not None:
+            state["context"] = self.context
+        return state
 
 def classify_intent(state: dict) -> str:
     """
     Classifies the user's input into a specific agent type
     (e.g., symptom_agent, reminder_agent, medical_record_agent).
 
+    Confident cases are routed by the local IntentPreClassifier; the LLM
+    is only called below its confidence threshold.
+
     Args:
         state (dict): Current interaction state containing the user input.
 
     Returns:
         str: The selected agent category.
     """
-    user_input = state["input"]
+    return get_intent_classifier().classify(state["input"], _llm_route)
+
+def _llm_route(user_input: str) -> str:
+    return router.get_chat_response(_routing_prompt(user_input)).strip().lower()
 
+async def aclassify_intent(state: dict) -> str:
+    """
+    Async version of classify_intent, used by the async graph.
+    """
+    classifier = get_intent_classifier()
+    user_input = state["input"]
+    label, guess = classifier.route(user_input)
+    shadow = label is not None and classifier.should_shadow()
+    if label is None or shadow:
+        result, from_llm = classifier.resolve_label(await router.aget_chat_response(_routing_prompt(user_input)), guess)
+        await asyncio.to_thread(classifier.record_llm_label, user_input, result, guess, shadow, from_llm)
+        label = label or result
+    return label
+
+def _routing_prompt(user_input: str) -> str:
     prompt = f"""
     You are a routing assistant for a multi-agent healthcare assistant.
 
@@ -78,8 +115,5 @@ def classify_intent(state: dict) -> str:
 
     User message: "{user_input}"
     """
-
-    result = router.get_chat_response(prompt)  
-    print("Routing to:", result)  
-    return result.strip().lower()
+    return prompt
 
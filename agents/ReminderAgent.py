@@ -1,11 +1,15 @@
+import asyncio
 import os
 import json
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from app.GroqChat import GroqChat
-from app.MedicationScheduleManager import MedicationScheduleManager
-from app.RecoveryCheckUpScheduleManager import RecoveryCheckUpScheduleManager
+from app.ReminderCandidates import select_rows
+from app.RequestContext import get_request_context
 
+MEDICATION_KEYWORDS = ["take medicine", "take my meds", "medication", "meds", "reminder", "medication schedule",
+    "pill", "pills", "medicine time", "what medicine", "what meds", "when do i take",
+    "pending medication", "missed dose", "medicine due", "medicine pending",
+    "did i take", "track medication", "medication tracker", "medicine reminder"]
 
 def handle_reminder_medication_query(state):
     """
@@ -22,14 +26,15 @@ def handle_reminder_medication_query(state):
     """
     user_input = state["input"]
     username = state.get("username", "user1")  # default fallback
-    medicationScheduleManager = MedicationScheduleManager(username)
-    tracker = medicationScheduleManager.load_tracker()
+    context = get_request_context(state, username)
+    medicationScheduleManager = context.medication_manager
+    tracker = medicationScheduleManager.load_tracker("prompt")
     if not tracker:
         return {"output": "There is no medication data available to display."}
     now = datetime.now(ZoneInfo("Europe/London"))
     today_str = now.strftime("%Y-%m-%d")
     tracker_today = [t for t in tracker if t.get("date") == today_str]
-    chat = GroqChat()
+    chat = context.groq
     taken_med = chat.extract_taken_medication(user_input)
     if taken_med != "none":
         updated, already_taken = medicationScheduleManager.mark_medication_as_taken(taken_med)
@@ -39,11 +44,7 @@ def handle_reminder_medication_query(state):
             return {"output": f"📌 Noted! You've already marked **{taken_med}** as taken earlier."}
         else:
             return {"output": f"⚠️ I understood you took **{taken_med}**, but couldn't find it in your schedule."}
-    keywords = ["take medicine", "take my meds", "medication", "meds", "reminder", "medication schedule",
-    "pill", "pills", "medicine time", "what medicine", "what meds", "when do i take",
-    "pending medication", "missed dose", "medicine due", "medicine pending",
-    "did i take", "track medication", "medication tracker", "medicine reminder"]
-    if any(word in user_input.lower() for word in keywords):
+    if any(word in user_input.lower() for word in MEDICATION_KEYWORDS):
         response = chat.answer_medication_question(user_input, tracker_today)
         return {"output": response}
     return {
@@ -65,9 +66,10 @@ def handle_reminder_recovery_query(state):
     """
     user_input = state["input"]
     username = state.get("username", "user1")
-    recoveryManager = RecoveryCheckUpScheduleManager(username)
-    all_reminders = recoveryManager.load_tracker()
-    chat = GroqChat()
+    context = get_request_context(state, username)
+    recoveryManager = context.recovery_manager
+    all_reminders = recoveryManager.load_tracker("prompt")
+    chat = context.groq
     referenced_reminder = chat.find_reminder_mentioned(user_input, all_reminders)
     if referenced_reminder == "none":
         return {"output": "This message doesn't seem related to any reminders."}
@@ -79,15 +81,8 @@ def handle_reminder_recovery_query(state):
             print(f"User wants to consult about reminder: {reminder_name}")
             if not all_reminders:
                 return {"output": "There are no recovery tasks scheduled."}  
-            now = datetime.now(ZoneInfo("Europe/London"))  
-            today_str = now.strftime("%Y-%m-%d")
-            # tracker_today = [t for t in all_reminders if t.get("date") == today_str]
-
-            tracker_today = [
-                {k: v for k, v in t.items() if k != "_id"} 
-                for t in all_reminders 
-                if t.get("date") == today_str
-            ]
+            # Rows of the day asked about (today by default), narrowed to the activities named
+            tracker_today = select_rows(user_input, all_reminders)
             is_recovery_related = chat.is_recovery_related(user_input, tracker_today)
             if is_recovery_related:
                 response = chat.answer_recovery_question(user_input, tracker_today)
@@ -121,6 +116,74 @@ def handle_reminder_recovery_query(state):
         else:
             return {"output": "This message doesn't seem related to any reminders."}
 
+async def ahandle_reminder_medication_query(state):
+    """
+    Async version of handle_reminder_medication_query, used by the async graph.
+    """
+    user_input = state["input"]
+    context = get_request_context(state, state.get("username", "user1"))
+    medicationScheduleManager = context.medication_manager
+    chat = context.groq
+    tracker, taken_med = await asyncio.gather(
+        medicationScheduleManager.aload_tracker("prompt"),
+        chat.aextract_taken_medication(user_input),
+    )
+    if not tracker:
+        return {"output": "There is no medication data available to display."}
+    today_str = datetime.now(ZoneInfo("Europe/London")).strftime("%Y-%m-%d")
+    tracker_today = [t for t in tracker if t.get("date") == today_str]
+    if taken_med != "none":
+        updated, already_taken = await medicationScheduleManager.amark_medication_as_taken(taken_med)
+        if updated:
+            return {"output": f"✅ Got it! I've marked **{taken_med}** as taken."}
+        elif already_taken:
+            return {"output": f"📌 Noted! You've already marked **{taken_med}** as taken earlier."}
+        else:
+            return {"output": f"⚠️ I understood you took **{taken_med}**, but couldn't find it in your schedule."}
+    if any(word in user_input.lower() for word in MEDICATION_KEYWORDS):
+        return {"output": await chat.aanswer_medication_question(user_input, tracker_today)}
+    return {
+        "output": f"📌 Reminder not recognized, but I'll save it as a note: '{user_input}'"
+    }
+
+async def ahandle_reminder_recovery_query(state):
+    """
+    Async version of handle_reminder_recovery_query, used by the async graph.
+    """
+    user_input = state["input"]
+    context = get_request_context(state, state.get("username", "user1"))
+    recoveryManager = context.recovery_manager
+    all_reminders = await recoveryManager.aload_tracker("prompt")
+    chat = context.groq
+    referenced_reminder = await chat.afind_reminder_mentioned(user_input, all_reminders)
+    if referenced_reminder == "none":
+        return {"output": "This message doesn't seem related to any reminders."}
+    action, *reminder_name_parts = referenced_reminder.split("|")
+    reminder_name = reminder_name_parts[0] if reminder_name_parts else None
+    if action == "consult_existing":
+        if not all_reminders:
+            return {"output": "There are no recovery tasks scheduled."}
+        tracker_today = select_rows(user_input, all_reminders)
+        if await chat.ais_recovery_related(user_input, tracker_today):
+            return {"output": await chat.aanswer_recovery_question(user_input, tracker_today)}
+        return {"output": f"Reminder not recognized, do you want to create it? Please specify activity, time, period"}
+    elif action == "mark_done_existing":
+        if not all_reminders:
+            return {"output": "There are no recovery tasks scheduled."}
+        done_task = reminder_name
+        if done_task != "none":
+            updated, already_done = await recoveryManager.amark_task_as_done(done_task)
+            if updated:
+                return {"output": f"✅ Got it! I've marked **{done_task}** as done."}
+            elif already_done:
+                return {"output": f"📌 You already marked **{done_task}** as done earlier."}
+            else:
+                return {"output": f"⚠️ I understood you did **{done_task}**, but couldn't find it in your schedule."}
+        return {"output": f"⚠️ I couldn't find **{done_task}** in your pending tasks."}
+    elif action == "reminder_crud":
+        return await ahandle_crud_reminder(state, all_reminders)
+    return {"output": "This message doesn't seem related to any reminders."}
+
 def handle_crud_reminder (state, all_reminders):
     """
     Handles CRUD operations (create, update, delete) for recovery reminders.
@@ -133,111 +196,149 @@ def handle_crud_reminder (state, all_reminders):
         dict: {"output": str} with the assistant's response.
     """
     user_input = state["input"]
-    username = state.get("username", "user1")    
-    recoveryManager = RecoveryCheckUpScheduleManager(username)
-    
-    chat = GroqChat()
+    context = get_request_context(state, state.get("username", "user1"))
+    recoveryManager = context.recovery_manager
+    chat = context.groq
     classify_reminder = chat.get_reminder_information(user_input, all_reminders)
     print("classify reminder ------------------------------ ", classify_reminder)
     if "NO" in classify_reminder:
         json_str = chat.extract_reminder_info_simple(user_input)
         reminder_info = json.loads(json_str)
         print("reminder info", reminder_info)
-        activity = reminder_info.get("activity", "").strip().capitalize()
+        is_ongoing, checkups = plan_reminder_checkups(reminder_info)
+        if is_ongoing:
+            result = recoveryManager.save_checkup(checkups[0], True)
+            return reminder_created_output(reminder_info, result)
+        count = 0
+        for new_checkup in checkups:
+            if recoveryManager.save_checkup(new_checkup, False) == False:
+                return reminder_created_output(reminder_info, False)
+            count += 1
+        return reminder_created_output(reminder_info, True, count)
+    return reminder_classification_output(classify_reminder)
+
+async def ahandle_crud_reminder(state, all_reminders):
+    """
+    Async version of handle_crud_reminder.
+    """
+    user_input = state["input"]
+    context = get_request_context(state, state.get("username", "user1"))
+    recoveryManager = context.recovery_manager
+    chat = context.groq
+    classify_reminder = await chat.aget_reminder_information(user_input, all_reminders)
+    if "NO" in classify_reminder:
+        reminder_info = json.loads(await chat.aextract_reminder_info_simple(user_input))
+        is_ongoing, checkups = plan_reminder_checkups(reminder_info)
+        if is_ongoing:
+            result = await recoveryManager.asave_checkup(checkups[0], True)
+            return reminder_created_output(reminder_info, result)
+        count = 0
+        for new_checkup in checkups:
+            if not await recoveryManager.asave_checkup(new_checkup, False):
+                return reminder_created_output(reminder_info, False)
+            count += 1
+        return reminder_created_output(reminder_info, True, count)
+    return reminder_classification_output(classify_reminder)
+
+def plan_reminder_checkups(reminder_info):
+    """
+    Turns the reminder details extracted by the LLM into check-up entries.
+
+    A reminder without a usable schedule becomes a single ongoing entry with
+    no time. Otherwise one entry is planned per preferred time (or per
+    default slot 09:00, 14:00, 19:00... for the daily frequency) for today
+    and each of the following total_days, skipping times already past.
+
+    Args:
+        reminder_info (dict): Extracted 'activity', 'frequency_per_day',
+            'duration_minutes', 'total_days', 'preferred_times' and 'notes'.
+
+    Returns:
+        tuple: (is_ongoing (bool), list[dict] of check-up entries to save)
+    """
+    activity = reminder_info.get("activity", "").strip().capitalize()
+    frequency_per_day = reminder_info.get("frequency_per_day", 0)
+    duration_minutes = reminder_info.get("duration_minutes", 0)
+    total_days = reminder_info.get("total_days", 0)
+    preferred_times = reminder_info.get("preferred_times", [])
+    notes = reminder_info.get("notes", "")
+    date = datetime.today()
+    tz = ZoneInfo("Europe/London")
+    now = datetime.now(tz)
+    if ((frequency_per_day == 0 and not preferred_times) 
+            or ( frequency_per_day == 0 and total_days == 0)
+            or (not preferred_times and total_days == 0)):
+        return True, [{
+            "activity": activity,
+            "date": date.strftime("%Y-%m-%d"),
+            "time": None,
+            "total_days": total_days,
+            "preferred_times": preferred_times,
+            "frequency": frequency_per_day,
+            "duration_minutes": duration_minutes,
+            "completed": False,
+            "is_ongoing": True,
+            "notes": notes,
+            "type": "personal" 
+        }]
+    # Ej: 09:00, 14:00, 19:00...
+    times = preferred_times or [f"{9 + j * 5:02d}:00" for j in range(frequency_per_day)]
+    checkups = []
+    for i in range(max(total_days + 1, 1)):
+        dateTo = date + timedelta(days=i)
+        for time_str in times:
+            reminder_dt = datetime.strptime(
+                f"{dateTo.strftime('%Y-%m-%d')} {time_str}", "%Y-%m-%d %H:%M"
+            ).replace(tzinfo=tz)
+            if reminder_dt <= now:
+                continue
+            checkups.append({
+                "activity": activity,
+                "date": dateTo.strftime("%Y-%m-%d"),
+                "time": time_str,
+                "duration_minutes": duration_minutes,
+                "completed": False,
+                "type": "personal" 
+            })
+    return False, checkups
+
+def reminder_created_output(reminder_info, result, count=None):
+    """
+    Builds the reply after saving a new reminder.
+
+    Args:
+        reminder_info (dict): Extracted reminder details.
+        result (bool): Whether every entry was saved.
+        count (int, optional): Number of recurrent entries created; None for an ongoing reminder.
+
+    Returns:
+        dict: {"output": str} with the assistant's response.
+    """
+    if not result:
+        return {"output": "⚠️ There was an error creating your reminder. Please try again."}
+    activity = reminder_info.get("activity", "").strip().capitalize()
+    confirmation_message = f"Your reminder for **\"{activity}\"** has been successfully created.\n\n"
+    if count is not None:
         frequency_per_day = reminder_info.get("frequency_per_day", 0)
-        duration_minutes = reminder_info.get("duration_minutes", 0)
-        total_days = reminder_info.get("total_days", 0)
-        preferred_times = reminder_info.get("preferred_times", [])
-        notes = reminder_info.get("notes", "")
-        date = datetime.today()
-        # now = datetime.now()
-        tz = ZoneInfo("Europe/London")
-        now = datetime.now(tz)
-        if ((frequency_per_day == 0 and not preferred_times) 
-                or ( frequency_per_day == 0 and total_days == 0)
-                or (not preferred_times and total_days == 0)):
-                new_checkup = {
-                    "activity": activity,
-                    "date": date.strftime("%Y-%m-%d"),
-                    "time": None,
-                    "total_days": total_days,
-                    "preferred_times": preferred_times,
-                    "frequency": frequency_per_day,
-                    "duration_minutes": duration_minutes,
-                    "completed": False,
-                    "is_ongoing": True,
-                    "notes": notes,
-                    "type": "personal" 
-                }
-                result = recoveryManager.save_checkup(new_checkup, True)
-                if result:
-                    confirmation_message = (
-                        f"Your reminder for **\"{activity}\"** has been successfully created.\n\n"                       
-                    )
-                    return {"output": f"⏰ {confirmation_message}"}
-                else:
-                    return {"output": "⚠️ There was an error creating your reminder. Please try again."}
-        else: 
-            result = True 
-            count = 0
-            for i in range(max(total_days + 1, 1)):
-                dateTo = date + timedelta(days=i)
-                if preferred_times:
-                    for time_str in preferred_times:
-                        reminder_dt = datetime.strptime(
-                            f"{dateTo.strftime('%Y-%m-%d')} {time_str}", "%Y-%m-%d %H:%M"
-                        ).replace(tzinfo=tz)                        
-                        if reminder_dt <= now:
-                            continue
-                        new_checkup = {
-                            "activity": activity,
-                            "date": dateTo.strftime("%Y-%m-%d"),
-                            "time": time_str,
-                            "duration_minutes": duration_minutes,
-                            "completed": False,
-                            "type": "personal" 
-                        }
-                        if recoveryManager.save_checkup(new_checkup, False) == False:
-                            result = False
-                            break
-                        else:
-                            count += 1
-                else:
-                    for j in range(frequency_per_day):
-                        time_str = f"{9 + j * 5:02d}:00"  # Ej: 09:00, 14:00, 19:00...
-                        reminder_dt = datetime.strptime(
-                            f"{dateTo.strftime('%Y-%m-%d')} {time_str}", "%Y-%m-%d %H:%M"
-                        ).replace(tzinfo=tz)
-                        if reminder_dt <= now:
-                            continue
-                        new_checkup = {
-                            "activity": activity,
-                            "date": dateTo.strftime("%Y-%m-%d"),
-                            "time": time_str,
-                            "duration_minutes": duration_minutes,
-                            "completed": False,
-                            "type": "personal" 
-                        }
-                        if recoveryManager.save_checkup(new_checkup, False) == False:
-                            result = False
-                            break
-                        else:
-                            count += 1
-            if result:
-                confirmation_message = (
-                    f"Your reminder for **\"{activity}\"** has been successfully created.\n\n"
-                    f"- {count} recurrent reminders were created \n"
-                    f"- Frequency: {frequency_per_day if frequency_per_day else 'Not specified'}\n"
-                )
-                return {"output": f"⏰ {confirmation_message}"}
-            else:
-                return {"output": "⚠️ There was an error creating your reminder. Please try again."}
-    elif "YES|PERSONAL" in classify_reminder:
+        confirmation_message += (
+            f"- {count} recurrent reminders were created \n"
+            f"- Frequency: {frequency_per_day if frequency_per_day else 'Not specified'}\n"
+        )
+    return {"output": f"⏰ {confirmation_message}"}
+
+def reminder_classification_output(classify_reminder):
+    """
+    Builds the reply when the message refers to an existing reminder.
+
+    Args:
+        classify_reminder (str): Result of GroqChat.get_reminder_information.
+
+    Returns:
+        dict: {"output": str} with the assistant's response.
+    """
+    if "YES|PERSONAL" in classify_reminder:
         return {"output": "📝 This is a personal reminder. What do you want to do — create, or delete a reminder?"}
-    
     elif "YES|DOCTOR" in classify_reminder:
         return {"output": "⚠️ This reminder was set by your doctor and cannot be modified. You can only view it."}
     else:
         return {"output": "Sorry, I couldn't process your request."}
-
-    
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from zoneinfo import ZoneInfo
 from app.GroqChat import GroqChat
@@ -5,9 +6,15 @@ from datetime import datetime
 import streamlit as st
 import re
 
-from app.MedicalRecordManager import MedicalRecordManager
+from app.RequestContext import get_request_context
 from app.SymptomManager import SymptomManager
 
+URGENT_MESSAGE = (
+    "🚨 **Potentially urgent symptoms detected.**\n"
+    "Please call emergency services or go to the hospital immediately.\n"
+    "If you are already in the hospital, inform the medical staff about these symptoms."
+)
+
 def handle_symptom_query(state):
     """
     Handles a user's symptom query, evaluating severity and returning recommendations.
@@ -21,10 +28,11 @@ def handle_symptom_query(state):
     # import local to avoid circular dependency
     from agents.NaiaAgent import NaiaAgent  
     user_input = state["input"]
-    username = st.session_state["username"]
+    username = state.get("username") or st.session_state["username"]
+    context = get_request_context(state, username)
     try:
-        # Load medical history
-        medical_record_manager = MedicalRecordManager(username)
+        # Load medical history (once per turn, shared with the recommendation step)
+        medical_record_manager = context.medical_record_manager
         medical_data = medical_record_manager.record
         # Prepare patient data for symptom evaluation
         patient_data = {
@@ -33,8 +41,9 @@ def handle_symptom_query(state):
             "pre_existing_conditions": medical_record_manager.get_pre_existing_conditions(),
         }
         # Naia instance and pass its function as callback
-        naia_agent = NaiaAgent(medical_data)
-        agent = SymptomAgent(patient_data, notify_fn=naia_agent.handle_symptom_notification)
+        naia_agent = NaiaAgent(medical_data, username=username, context=context)
+        agent = SymptomAgent(patient_data, notify_fn=naia_agent.handle_symptom_notification, username=username,
+                             symptom_manager=context.symptom_manager, groq=context.groq)
         # Evaluate the symptom and generate recommendations
         severity, reco_text = agent.process_symptom(user_input, duration_days=1)
         output = f"🔎 The symptom was evaluated as: **{severity}**."
@@ -49,6 +58,34 @@ def handle_symptom_query(state):
         }
     
     
+async def ahandle_symptom_query(state):
+    """
+    Async version of handle_symptom_query, used by the async graph.
+    The username comes from the state because st.session_state is not
+    available on the background event loop.
+    """
+    from agents.NaiaAgent import NaiaAgent
+    user_input = state["input"]
+    username = state["username"]
+    context = get_request_context(state, username)
+    medical_record_manager = await context.amedical_record_manager()
+    if not medical_record_manager.record:
+        return {"output": "No medical history found for this user.", "username": username}
+    patient_data = {
+        "surgery": medical_record_manager.get_surgery_info().get("surgery"),
+        "medications": medical_record_manager.get_medications(),
+        "pre_existing_conditions": medical_record_manager.get_pre_existing_conditions(),
+    }
+    naia_agent = NaiaAgent(medical_record_manager.record, username=username, context=context)
+    agent = SymptomAgent(patient_data, notify_fn=naia_agent.ahandle_symptom_notification, username=username,
+                         symptom_manager=context.symptom_manager, groq=context.groq)
+    severity, reco_text = await agent.aprocess_symptom(user_input, duration_days=1)
+    output = f"🔎 The symptom was evaluated as: **{severity}**."
+    if reco_text:
+        output += f"\n\n🩺:\n{reco_text}"
+    return {"output": output, "username": username}
+
+
 class SymptomAgent:
     """
     Agent responsible for analyzing symptoms, classifying severity, 
@@ -60,20 +97,26 @@ class SymptomAgent:
         notify_fn (callable): Optional callback function for notifications.
         username (str): Current user.
         symptom_manager (SymptomManager): Handles storage of symptom entries.
+        groq (GroqChat): LLM client used for extraction and classification.
     """
-    def __init__(self, patient_record, notify_fn=None):
+    def __init__(self, patient_record, notify_fn=None, username=None, symptom_manager=None, groq=None):
         """
         Initializes the SymptomAgent with patient data and optional callback.
 
         Args:
             patient_record (dict): Medical info about the patient.
             notify_fn (callable, optional): Function to notify external agent.
+                A coroutine function is awaited by aprocess_symptom.
+            username (str, optional): Current user. Defaults to the Streamlit session user.
+            symptom_manager (SymptomManager, optional): Existing manager to reuse.
+            groq (GroqChat, optional): Existing LLM client to reuse.
         """
         self.patient_record = patient_record
         self.symptom_history = []
         self.notify_fn = notify_fn
-        self.username = st.session_state["username"]
-        self.symptom_manager = SymptomManager(self.username)
+        self.username = username or st.session_state["username"]
+        self.symptom_manager = symptom_manager or SymptomManager(self.username)
+        self.groq = groq or GroqChat()
 
     def classify_severity_llm(self, symptom: str, duration_days: int) -> str:
         """
@@ -86,8 +129,7 @@ class SymptomAgent:
         Returns:
             str: Severity level (e.g., Mild, Moderate, Severe).
         """
-        groq = GroqChat()
-        severity = groq.classify_severity(symptom, self.patient_record, duration_days)
+        severity = self.groq.classify_severity(symptom, self.patient_record, duration_days)
         return severity
 
     def extract_symptoms(self, text: str) -> list[str]:
@@ -100,8 +142,7 @@ class SymptomAgent:
         Returns:
             list[str]: List of detected symptom strings.
         """
-        groq = GroqChat()
-        data = groq.extract_symptoms(text)
+        data = self.groq.extract_symptoms(text)
         if data and "detected_symptoms" in data:
             return data["detected_symptoms"]
         return []
@@ -110,6 +151,10 @@ class SymptomAgent:
         """
         Processes a symptom input, classifies severity, and records it.
 
+        A single combined triage call extracts the symptoms, their durations and
+        the severity; if its response fails validation, the step-by-step
+        extraction and classification calls are used instead.
+
         Args:
             text (str): Symptom description text.
             duration_days (int, optional): Duration of the symptom. Defaults to None.
@@ -117,11 +162,33 @@ class SymptomAgent:
         Returns:
             tuple: (severity (str), recommendation_text (str))
         """
-        groq = GroqChat()
-        data = groq.extract_symptoms(text)
-        print("Extracted data:", data)
+        groq = self.groq
+        data = groq.triage_symptoms(text, self.patient_record)
+        if data:
+            severity = data["overall_severity"]
+        else:
+            data, severity = self._extract_and_classify(groq, text, duration_days)
+        self.symptom_manager.add_entry(self._build_entry(text, data, severity))
+        # Urgent case handling
+        if str(severity).lower() == "severe":
+            return severity, URGENT_MESSAGE
+        # Optional notification callback
+        recommendation_text = ""
+        if self.notify_fn:
+            recommendation_text = self.notify_fn(text, severity) or ""
+        return severity, recommendation_text   
+
+    def _extract_and_classify(self, groq, text: str, duration_days: int = None):
+        """
+        Multi-call fallback: extracts symptoms, then each missing duration,
+        then classifies the overall severity.
+
+        Returns:
+            tuple: (extracted data (dict), severity (str))
+        """
+        data = groq.extract_symptoms(text) or {}
         # Determine symptoms
-        symptoms = data.get("detected_symptoms") if data else []
+        symptoms = data.get("detected_symptoms")
         if not symptoms:
             symptoms = [text]  # fallback: todo como un síntoma
 
@@ -132,37 +199,49 @@ class SymptomAgent:
                 continue
             if symptom.get("duration_days") is None:
                 duration_days = groq.extract_duration_from_text(text, name)
-                print(f"Duration for '{name}': {duration_days} days")
                 if duration_days is None or duration_days <= 0:
                     duration_days = 1
                 symptom["duration_days"] = duration_days
         # Classify overall severity    
         severity = self.classify_severity_llm(text, duration_days)
+        return data, severity
 
-        # Save symptom entry
+    def _build_entry(self, text: str, data: dict, severity: str) -> dict:
         zn = ZoneInfo("Europe/London")
-        now = datetime.now(zn).isoformat()
-        entry = {
-            "timestamp": now,
+        return {
+            "timestamp": datetime.now(zn).isoformat(),
             "symptoms": data.get("symptoms", []),
             "overall_severity": severity,
             "input_text": text,
         }
-        self.symptom_manager.add_entry(entry)
-        # Urgent case handling
-        is_urgent = str(severity).lower() == "severe"
-        if is_urgent:
-            urgent_msg = (
-                "🚨 **Potentially urgent symptoms detected.**\n"
-                "Please call emergency services or go to the hospital immediately.\n"
-                "If you are already in the hospital, inform the medical staff about these symptoms."                
-            )            
-            return severity, urgent_msg
-        # Optional notification callback
+
+    async def aprocess_symptom(self, text: str, duration_days: int = None):
+        """
+        Async version of process_symptom. In the fallback path missing
+        durations are extracted concurrently, one call per symptom.
+        """
+        groq = self.groq
+        data = await groq.atriage_symptoms(text, self.patient_record)
+        if data:
+            severity = data["overall_severity"]
+        else:
+            data = await groq.aextract_symptoms(text) or {}
+            missing = [s for s in data.get("symptoms", []) if s.get("name") and s.get("duration_days") is None]
+            durations = await asyncio.gather(*(groq.aextract_duration_from_text(text, s["name"]) for s in missing))
+            for symptom, days in zip(missing, durations):
+                duration_days = days if days and days > 0 else 1
+                symptom["duration_days"] = duration_days
+            severity = await groq.aclassify_severity(text, self.patient_record, duration_days)
+        await self.symptom_manager.aadd_entry(self._build_entry(text, data, severity))
+        if str(severity).lower() == "severe":
+            return severity, URGENT_MESSAGE
         recommendation_text = ""
         if self.notify_fn:
-            recommendation_text = self.notify_fn(text, severity) or ""
-        return severity, recommendation_text   
+            recommendation_text = self.notify_fn(text, severity)
+            if asyncio.iscoroutine(recommendation_text):
+                recommendation_text = await recommendation_text
+            recommendation_text = recommendation_text or ""
+        return severity, recommendation_text
     
     def get_symptom_duration(self, symptom: str) -> int:
         """
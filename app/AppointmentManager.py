@@ -1,11 +1,15 @@
 import json
+import time
 from datetime import datetime, timedelta
 import os
 from uuid import uuid4
 from zoneinfo import ZoneInfo
+from pymongo import DeleteMany, ReplaceOne, ReturnDocument
 from app.GroqChat import GroqChat
 from app.MedicalRecordManager import MedicalRecordManager
-from data.DataBaseManager import DatabaseManager
+from app.Utilities import to_due_at, backfill_due_at, notify_tracker_change
+from data.DataBaseManager import AsyncDatabaseManager, DatabaseManager
+from data.TrackerRepository import TrackerRepository
 
 class AppointmentManager:
     """
@@ -25,27 +29,108 @@ class AppointmentManager:
         self.user_id = user_id
         db_manager = DatabaseManager()
         self.collection_tracker = db_manager.get_collection("appointmentTracker")
-        
+        self.repository = TrackerRepository("appointmentTracker", self.collection_tracker)
+
+    @staticmethod
+    def ensure_indexes():
+        """
+        Creates the (patient_id, completed, due_at) index used by reminder window
+        queries and the unique (patient_id, id) key used by keyed upserts, and
+        backfills 'due_at' on older appointments. Run at startup
+        through app.DatabaseSetup, never from a chat turn.
+        """
+        collection = DatabaseManager().get_collection("appointmentTracker")
+        collection.create_index([("patient_id", 1), ("completed", 1), ("due_at", 1)])
+        collection.create_index(
+            [("patient_id", 1), ("id", 1)],
+            unique=True,
+            partialFilterExpression={"id": {"$type": "string"}},
+        )
+        backfill_due_at(collection, default_time="09:00")
+
+    @property
+    def acollection_tracker(self):
+        """Async handle on the tracker collection; only usable inside a coroutine."""
+        return AsyncDatabaseManager().get_collection("appointmentTracker")
+
     def load_appointment_tracker(self):
         """
         Loads all appointment records for the user from the database.
 
         Returns:
-            list[dict]: List of appointment documents.
+            list[AppointmentEntry]: List of appointment documents, without '_id'.
+        """
+        return self.repository.find({"patient_id": self.user_id}, "page")
+
+    def find_due(self, start, end):
+        """
+        Loads the appointments not yet completed that fall between two instants.
+
+        Args:
+            start (datetime): Timezone-aware start of the window.
+            end (datetime): Timezone-aware end of the window.
+
+        Returns:
+            list[AppointmentEntry]: Appointments sorted by due time, with the reminder view's fields only.
         """
-        docs = list(self.collection_tracker.find({"patient_id": self.user_id}))
-        return docs
+        return self.repository.find(self._due_query(start, end), "reminder", sort=[("due_at", 1)])
+
+    async def afind_due(self, start, end):
+        """Async version of find_due."""
+        return await self.repository.afind(self._due_query(start, end), "reminder", sort=[("due_at", 1)])
+
+    def _due_query(self, start, end):
+        return {
+            "patient_id": self.user_id,
+            "completed": {"$ne": True},
+            "due_at": {"$gte": start, "$lte": end},
+        }
 
     def save_appointment_tracker(self, tracker):
         """
         Saves the user's appointment tracker, replacing any existing records.
 
+        Appointments are upserted by their 'id' and only those that differ from
+        the stored version are written; stored appointments missing from
+        `tracker` are deleted in the same unordered bulk write. Each document
+        is replaced atomically, so readers never see an empty tracker.
+
         Args:
             tracker (list[dict]): List of appointment records to save.
+
+        Returns:
+            dict: 'changed' (upserted), 'deleted' and 'latency_ms' of the bulk write.
         """
-        if tracker:
-            self.collection_tracker.delete_many({"patient_id": self.user_id})
-            self.collection_tracker.insert_many(tracker)
+        result = {"changed": 0, "deleted": 0, "latency_ms": 0.0}
+        if not tracker:
+            return result
+        stored = {
+            doc.get("id"): doc
+            for doc in self.collection_tracker.find({"patient_id": self.user_id}, {"_id": 0})
+        }
+        operations = []
+        for appt in tracker:
+            appt.setdefault("id", str(uuid4()))
+            appt["patient_id"] = self.user_id
+            appt["due_at"] = to_due_at(appt.get("date"), appt.get("time") or "09:00")
+            doc = {k: v for k, v in appt.items() if k != "_id"}
+            if stored.get(doc["id"]) != doc:
+                operations.append(ReplaceOne({"patient_id": self.user_id, "id": doc["id"]}, doc, upsert=True))
+        kept = {appt["id"] for appt in tracker}
+        removed = [appt_id for appt_id in stored if appt_id not in kept]
+        if removed:
+            operations.append(DeleteMany({"patient_id": self.user_id, "id": {"$in": removed}}))
+        if not operations:
+            return result
+        started = time.perf_counter()
+        write = self.collection_tracker.bulk_write(operations, ordered=False)
+        result.update({
+            "changed": write.upserted_count + write.modified_count,
+            "deleted": write.deleted_count,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+        notify_tracker_change(self.user_id)
+        return result
    
     def return_appointment_info(self):
         """
@@ -121,29 +206,27 @@ class AppointmentManager:
         now = datetime.now(zn)
         start = now
         end = now + timedelta(hours=window_hours)
-        tracker = self.load_appointment_tracker()
-        upcoming = []
-        for appt in tracker:
-            if appt.get("completed"):
-                continue
-            dt_str = f"{appt['date']} {appt.get('time', '09:00')}"
-            try:
-                dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M").replace(tzinfo=zn)
-                if start <= dt <= end:
-                    location_info = f" at {appt['location']}" if appt.get("location") else ""
-                    reason = appt.get("reason", "")
-                    department = appt.get("department", "")
-                    clinician = appt.get("clinician", "")
-                    if reason:
-                        description = reason
-                    elif department or clinician:
-                        description = f"{department} with {clinician}".strip()
-                    else:
-                        description = "Medical appointment"
-                    upcoming.append(f"- 📅 {description}{location_info} on {appt['date']} at {dt.strftime('%H:%M')}")
-            except:
-                continue
-        return upcoming
+        return [self._format_upcoming(appt) for appt in self.find_due(start, end)]
+
+    async def acheck_upcoming_appointments(self, window_hours=24):
+        """Async version of check_upcoming_appointments."""
+        zn = ZoneInfo("Europe/London")
+        now = datetime.now(zn)
+        return [self._format_upcoming(appt) for appt in await self.afind_due(now, now + timedelta(hours=window_hours))]
+
+    @staticmethod
+    def _format_upcoming(appt):
+        location_info = f" at {appt['location']}" if appt.get("location") else ""
+        reason = appt.get("reason", "")
+        department = appt.get("department", "")
+        clinician = appt.get("clinician", "")
+        if reason:
+            description = reason
+        elif department or clinician:
+            description = f"{department} with {clinician}".strip()
+        else:
+            description = "Medical appointment"
+        return f"- 📅 {description}{location_info} on {appt['date']} at {appt.get('time') or '09:00'}"
 
     def mark_appointment_as_completed(self, description):
         """
@@ -157,24 +240,24 @@ class AppointmentManager:
                 - marked: True if successfully marked.
                 - already_completed: True if it was already completed.
         """
-        tracker = self.load_appointment_tracker()
-        found = False
-        already_completed = False
-
-        for appt in tracker:
-            if appt["description"].lower() == description.lower():
-                if appt.get("completed"):
-                    already_completed = True
-                    continue
-                appt["completed"] = True
-                found = True
-                break
-
-        if found:
-            self.save_appointment_tracker(tracker)
+        # Case-insensitive match on the description, like comparing .lower() strings
+        case_insensitive = {"locale": "en", "strength": 2}
+        marked = self.collection_tracker.find_one_and_update(
+            {"patient_id": self.user_id, "description": description, "completed": {"$ne": True}},
+            {"$set": {"completed": True}},
+            collation=case_insensitive,
+            return_document=ReturnDocument.AFTER,
+        )
+        if marked:
+            notify_tracker_change(self.user_id)
             # (marked, already completed=False)
             return True, False
-        return False, already_completed
+        already_completed = self.collection_tracker.find_one(
+            {"patient_id": self.user_id, "description": description, "completed": True},
+            {"_id": 1},
+            collation=case_insensitive,
+        )
+        return False, already_completed is not None
 
     def mark_as_attended(self, date_str, time_str):
         """
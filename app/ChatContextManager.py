@@ -0,0 +1,169 @@
+import streamlit as st
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from app.ChatHistoryManager import ChatHistoryManager
+from app.GroqChat import GroqChat
+from app.Utilities import estimate_tokens
+
+DEFAULT_MAX_TURNS = 4
+DEFAULT_TOKEN_BUDGET = 1200
+SUMMARY_MAX_WORDS = 150
+# Transcript tokens sent per summarisation call; a long backlog (e.g. migrated legacy chats) takes several
+SUMMARY_CHUNK_TOKENS = 3000
+
+class ChatContextManager:
+    """
+    Builds a bounded conversation context for LLM prompts.
+
+    The latest turns are kept verbatim, up to max_turns (user + assistant
+    pairs) and the token budget. Older messages are folded into a rolling
+    summary that is stored with the conversation (see
+    ChatHistoryManager.save_summary). Each call only summarises the messages
+    that have fallen out of the window since the previous call, so prompt
+    size stays flat however long the conversation gets. A long backlog is
+    folded in chunks of SUMMARY_CHUNK_TOKENS, saving the summary after each;
+    if a summarisation call fails the context falls back to the summary so
+    far plus the recent turns.
+
+    Attributes:
+        history (ChatHistoryManager): The patient's chat history.
+        max_turns (int): Turns kept verbatim.
+        token_budget (int): Token budget for the summary plus verbatim turns.
+    """
+    def __init__(self, user_id, max_turns: int = None, token_budget: int = None, history: ChatHistoryManager = None,
+                 groq: GroqChat = None):
+        """
+        Args:
+            user_id (str): The patient's unique identifier.
+            max_turns (int, optional): Defaults to the CHAT_CONTEXT_MAX_TURNS secret or DEFAULT_MAX_TURNS.
+            token_budget (int, optional): Defaults to the CHAT_CONTEXT_TOKEN_BUDGET secret or DEFAULT_TOKEN_BUDGET.
+            history (ChatHistoryManager, optional): Existing manager to reuse.
+            groq (GroqChat, optional): Existing client for the summaries; built on first use otherwise.
+        """
+        self.history = history or ChatHistoryManager(user_id)
+        self.max_turns = max_turns or int(st.secrets.get("CHAT_CONTEXT_MAX_TURNS", DEFAULT_MAX_TURNS))
+        self.token_budget = token_budget or int(st.secrets.get("CHAT_CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+        self._groq = groq
+
+    @property
+    def groq(self):
+        if self._groq is None:
+            self._groq = GroqChat()
+        return self._groq
+
+    def build_context(self) -> str:
+        """
+        Returns the conversation context: the rolling summary followed by the
+        recent turns. Folds messages that left the window into the summary first.
+
+        Returns:
+            str: Context text, or "" for a new conversation.
+        """
+        summary, summary_seq = self.history.get_summary()
+        messages = self._conversational(self.history.load_since(summary_seq))
+        recent, older = self.split(messages, summary)
+        for chunk in self.chunk(older):
+            try:
+                new_summary = self.groq.summarize_conversation(summary, self._transcript(chunk), SUMMARY_MAX_WORDS)
+            except Exception as e:
+                print(f"Error summarising conversation: {e}")
+                break
+            new_summary = self._clip(new_summary)
+            last_seq = ChatHistoryManager.seq_of(chunk[-1])
+            # If another request already advanced the summary, its version is as good as ours
+            self.history.save_summary(new_summary, last_seq, summary_seq)
+            summary, summary_seq = new_summary, last_seq
+        return self.format_context(summary, recent)
+
+    async def abuild_context(self) -> str:
+        """Async version of build_context."""
+        summary, summary_seq = await self.history.aget_summary()
+        messages = self._conversational(await self.history.aload_since(summary_seq))
+        recent, older = self.split(messages, summary)
+        for chunk in self.chunk(older):
+            try:
+                new_summary = await self.groq.asummarize_conversation(summary, self._transcript(chunk), SUMMARY_MAX_WORDS)
+            except Exception as e:
+                print(f"Error summarising conversation: {e}")
+                break
+            new_summary = self._clip(new_summary)
+            last_seq = ChatHistoryManager.seq_of(chunk[-1])
+            await self.history.asave_summary(new_summary, last_seq, summary_seq)
+            summary, summary_seq = new_summary, last_seq
+        return self.format_context(summary, recent)
+
+    def split(self, messages, summary: str = ""):
+        """
+        Splits messages into the verbatim tail and the older part to summarise.
+
+        The tail holds at most max_turns * 2 messages and, together with the
+        summary, fits in the token budget; the newest message is always kept.
+
+        Args:
+            messages (list[BaseMessage]): Messages not yet summarised, oldest first.
+            summary (str): Current summary, counted against the budget.
+
+        Returns:
+            tuple: (recent (list), older (list)), both oldest first.
+        """
+        budget = self.token_budget - estimate_tokens(summary)
+        kept = 0
+        used = 0
+        for message in reversed(messages):
+            cost = estimate_tokens(self.format_messages([message]))
+            if kept and (kept >= self.max_turns * 2 or used + cost > budget):
+                break
+            kept += 1
+            used += cost
+        cut = len(messages) - kept
+        return messages[cut:], messages[:cut]
+
+    def chunk(self, messages):
+        """
+        Groups messages to summarise into chunks of at most
+        SUMMARY_CHUNK_TOKENS (estimated); each chunk has at least one message.
+
+        Args:
+            messages (list[BaseMessage]): Messages to summarise, oldest first.
+
+        Returns:
+            list[list]: The chunks, oldest first.
+        """
+        chunks = []
+        used = 0
+        for message in messages:
+            cost = estimate_tokens(self.format_messages([message]))
+            if not chunks or used + cost > SUMMARY_CHUNK_TOKENS:
+                chunks.append([])
+                used = 0
+            chunks[-1].append(message)
+            used += cost
+        return chunks
+
+    def _transcript(self, chunk) -> str:
+        # A single message longer than a chunk is cut to fit
+        return self.format_messages(chunk)[:SUMMARY_CHUNK_TOKENS * 4]
+
+    def _clip(self, summary: str) -> str:
+        # Keep the summary within half of the budget even if the model ignores the word limit
+        max_chars = self.token_budget * 2
+        return summary if len(summary) <= max_chars else summary[:max_chars].rsplit(" ", 1)[0]
+
+    @staticmethod
+    def _conversational(messages):
+        return [m for m in messages if not isinstance(m, SystemMessage)]
+
+    @staticmethod
+    def format_messages(messages) -> str:
+        lines = []
+        for m in messages:
+            role = "user" if isinstance(m, HumanMessage) else "assistant" if isinstance(m, AIMessage) else "system"
+            lines.append(f"{role}: {m.content}")
+        return "\n".join(lines)
+
+    def format_context(self, summary: str, recent) -> str:
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation:\n{summary}")
+        if recent:
+            parts.append(f"Recent messages:\n{self.format_messages(recent)}")
+        return "\n\n".join(parts)
@@ -1,71 +1,313 @@
+import asyncio
 import json
 import os
+import threading
+from datetime import datetime, timezone
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
-from data.DataBaseManager import DatabaseManager
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from data.DataBaseManager import AsyncDatabaseManager, DatabaseManager
 
 class ChatHistoryManager:
     """
     Manages chat history for a user in a post-surgery recovery assistant context.
 
-    Stores and retrieves messages from a MongoDB collection, preserving the roles
-    (user, assistant, system) and enabling conversation continuity.
-    
+    History is append-only: every message is its own document in the
+    'chat_messages' collection, numbered by a per-patient sequence. The
+    patient's document in 'chat_history' only holds the sequence counter, so
+    each turn writes just the new messages and pages read only what they show.
+    Persisted messages carry their id ("<patient_id>:<seq>") in message.id.
+
     Attributes:
         user_id (str): The patient's unique identifier.
-        collection (pymongo collection): MongoDB collection for storing chat history.
+        collection (pymongo collection): Per-patient conversation documents (sequence counter).
+        messages_collection (pymongo collection): One document per message.
     """
-    def __init__(self, user_id):
+    _indexes_ready = False
+    # Patients whose legacy 'history' array is known to be migrated in this process
+    _migrated = set()
+    _migrated_lock = threading.Lock()
+
+    def __init__(self, user_id, collection=None, messages_collection=None):
         """
         Initializes the ChatHistoryManager for a given user.
 
         Args:
             user_id (str): Unique identifier for the patient.
+            collection (optional): 'chat_history' collection; defaults to the shared DatabaseManager one.
+            messages_collection (optional): 'chat_messages' collection; defaults to the shared one.
         """
         self.user_id = user_id
-        db_manager = DatabaseManager()
-        self.collection = db_manager.get_collection("chat_history")
+        if collection is None or messages_collection is None:
+            db_manager = DatabaseManager()
+            collection = collection if collection is not None else db_manager.get_collection("chat_history")
+            messages_collection = (
+                messages_collection if messages_collection is not None else db_manager.get_collection("chat_messages")
+            )
+        self.collection = collection
+        self.messages_collection = messages_collection
+        if not ChatHistoryManager._indexes_ready:
+            self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """
+        Creates the unique (patient_id, seq) index used for appends and paging.
+        Runs once per process.
+        """
+        self.messages_collection.create_index([("patient_id", 1), ("seq", 1)], unique=True)
+        ChatHistoryManager._indexes_ready = True
 
-    def load(self):
+    def load(self, limit=None, before=None):
         """
         Loads the chat history for the user from the database.
 
+        Args:
+            limit (int, optional): Return only the latest `limit` messages.
+            before (int, optional): Only return messages with a sequence number
+                lower than this, to page back through older history.
+
         Returns:
             list[BaseMessage]: A list of HumanMessage, AIMessage, or SystemMessage
-            objects representing the chat history. If no history exists, returns a
+            objects in chronological order. If no history exists, returns a
             default system message for the recovery assistant.
         """
-        doc = self.collection.find_one({"patient_id": self.user_id})
-        if doc and "history" in doc:
-            return [
-                HumanMessage(m["content"]) if m["role"] == "user"
-                else AIMessage(m["content"]) if m["role"] == "assistant"
-                else SystemMessage(m["content"])
-                for m in doc["history"]
-            ]
+        self._migrate_legacy_history()
+        cursor = self.messages_collection.find(self._page_query(before)).sort("seq", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return self._to_messages(list(cursor), before)
+
+    async def aload(self, limit=None, before=None):
+        """Async version of load."""
+        await self._amigrate_legacy_history()
+        cursor = AsyncDatabaseManager().get_collection("chat_messages").find(self._page_query(before)).sort("seq", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return self._to_messages(await cursor.to_list(None), before)
+
+    def load_since(self, after_seq):
+        """
+        Loads every message with a sequence number greater than after_seq.
+
+        Args:
+            after_seq (int): Sequence number of the last message already handled.
+
+        Returns:
+            list[BaseMessage]: Messages in chronological order, each with its id.
+        """
+        self._migrate_legacy_history()
+        docs = self.messages_collection.find({"patient_id": self.user_id, "seq": {"$gt": after_seq}}).sort("seq", 1)
+        return [self._to_message(doc) for doc in docs]
+
+    async def aload_since(self, after_seq):
+        """Async version of load_since."""
+        await self._amigrate_legacy_history()
+        docs = await AsyncDatabaseManager().get_collection("chat_messages").find(
+            {"patient_id": self.user_id, "seq": {"$gt": after_seq}}
+        ).sort("seq", 1).to_list(None)
+        return [self._to_message(doc) for doc in docs]
+
+    def get_summary(self):
+        """
+        Returns the rolling summary of older messages stored with the conversation.
+
+        Returns:
+            tuple: (summary (str), summary_seq (int)) where summary_seq is the last
+                message folded into the summary; ("", 0) if there is none.
+        """
+        doc = self.collection.find_one({"patient_id": self.user_id}, {"summary": 1, "summary_seq": 1})
+        return self._summary_fields(doc)
+
+    async def aget_summary(self):
+        """Async version of get_summary."""
+        doc = await AsyncDatabaseManager().get_collection("chat_history").find_one(
+            {"patient_id": self.user_id}, {"summary": 1, "summary_seq": 1}
+        )
+        return self._summary_fields(doc)
+
+    @staticmethod
+    def _summary_fields(doc):
+        if not doc:
+            return "", 0
+        return doc.get("summary", ""), doc.get("summary_seq", 0)
+
+    def save_summary(self, summary, summary_seq, previous_seq):
+        """
+        Stores a new rolling summary unless another writer already advanced it.
+
+        Args:
+            summary (str): The updated summary.
+            summary_seq (int): Last message folded into it.
+            previous_seq (int): summary_seq the update was computed from.
+
+        Returns:
+            bool: True if the summary was stored.
+        """
+        result = self.collection.update_one(*self._summary_update(summary, summary_seq, previous_seq))
+        return result.modified_count > 0
+
+    async def asave_summary(self, summary, summary_seq, previous_seq):
+        """Async version of save_summary."""
+        result = await AsyncDatabaseManager().get_collection("chat_history").update_one(
+            *self._summary_update(summary, summary_seq, previous_seq)
+        )
+        return result.modified_count > 0
+
+    def _summary_update(self, summary, summary_seq, previous_seq):
+        query = {"patient_id": self.user_id}
+        if previous_seq:
+            query["summary_seq"] = previous_seq
         else:
+            query["summary_seq"] = {"$exists": False}
+        return query, {"$set": {"summary": summary, "summary_seq": summary_seq}}
+
+    def _page_query(self, before):
+        query = {"patient_id": self.user_id}
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        return query
+
+    def _to_messages(self, docs, before=None):
+        if not docs:
+            if before is not None:
+                return []
             # Default system message for new users or empty history
             return [SystemMessage(content="You are a helpful assistant for post-surgery recovery.")]
-   
+        return [self._to_message(doc) for doc in reversed(docs)]
+
+    def _to_message(self, doc):
+        message_id = f"{self.user_id}:{doc['seq']}"
+        if doc["role"] == "user":
+            return HumanMessage(content=doc["content"], id=message_id)
+        if doc["role"] == "assistant":
+            return AIMessage(content=doc["content"], id=message_id)
+        return SystemMessage(content=doc["content"], id=message_id)
+
+    @staticmethod
+    def seq_of(message):
+        """
+        Returns the sequence number of a persisted message, or None if unsaved.
+        """
+        if not getattr(message, "id", None):
+            return None
+        return int(message.id.rsplit(":", 1)[1])
+
     def save(self, messages):
         """
-        Saves the provided chat messages to the database.
+        Persists the messages that are not stored yet.
 
-        Converts the message objects into a serializable format with roles.
+        Messages loaded from or already written to the database carry an id and
+        are skipped, so passing the whole session history only appends the new
+        turn.
 
         Args:
             messages (list[BaseMessage]): List of messages (HumanMessage, AIMessage, SystemMessage) to save.
         """
-        serializable = []
-        for m in messages:
+        self.append([m for m in messages if not getattr(m, "id", None)])
+
+    def append(self, messages):
+        """
+        Appends messages to the history in one counter update and one insert.
+
+        Args:
+            messages (list[BaseMessage]): New messages, in order. Their id is set
+                once they are stored.
+
+        Returns:
+            int or None: Sequence number of the last stored message.
+        """
+        if not messages:
+            return None
+        first_seq = self._reserve(len(messages))
+        now = datetime.now(timezone.utc)
+        docs = []
+        for offset, m in enumerate(messages):
             role = (
                 "user" if isinstance(m, HumanMessage)
                 else "assistant" if isinstance(m, AIMessage)
                 else "system"
             )
-            serializable.append({"role": role, "content": m.content})
-        # Upsert: create new document if none exists, else update existing
-        self.collection.update_one(
+            docs.append({
+                "patient_id": self.user_id,
+                "seq": first_seq + offset,
+                "role": role,
+                "content": m.content,
+                "created_at": now,
+            })
+        self.messages_collection.insert_many(docs, ordered=True)
+        for m, doc in zip(messages, docs):
+            m.id = f"{self.user_id}:{doc['seq']}"
+        return docs[-1]["seq"]
+
+    def _reserve(self, count):
+        """
+        Atomically reserves `count` sequence numbers for the patient.
+
+        Returns:
+            int: The first reserved sequence number.
+        """
+        doc = self.collection.find_one_and_update(
             {"patient_id": self.user_id},
-            {"$set": {"history": serializable}},
-            upsert=True
-        )
\ No newline at end of file
+            {"$inc": {"last_seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["last_seq"] - count + 1
+
+    def _migrate_legacy_history(self):
+        """
+        Copies a pre-existing 'history' array into 'chat_messages', then removes it.
+
+        The array gets its sequence range once ('history_seq' keeps the first
+        number), and the unique (patient_id, seq) index makes a retried copy
+        skip the messages already stored. 'history' is only unset once every
+        message is stored, so a failed copy leaves it in place for the next load.
+        Each patient is checked once per process after a successful migration.
+        """
+        if self.user_id in ChatHistoryManager._migrated:
+            return
+        doc = self.collection.find_one(
+            {"patient_id": self.user_id, "history": {"$exists": True}}, {"history": 1, "history_seq": 1}
+        )
+        if not doc:
+            self._mark_migrated()
+            return
+        history = doc.get("history") or []
+        if history and doc.get("history_seq") is None:
+            first_seq = self._reserve(len(history))
+            self.collection.update_one(
+                {"_id": doc["_id"], "history_seq": {"$exists": False}}, {"$set": {"history_seq": first_seq}}
+            )
+            # A concurrent load may have reserved the range first; its numbers win
+            doc = self.collection.find_one({"_id": doc["_id"]}, {"history_seq": 1})
+        if history:
+            now = datetime.now(timezone.utc)
+            try:
+                self.messages_collection.insert_many([
+                    {
+                        "patient_id": self.user_id,
+                        "seq": doc["history_seq"] + i,
+                        "role": m.get("role", "system"),
+                        "content": m.get("content", ""),
+                        "created_at": now,
+                    }
+                    for i, m in enumerate(history)
+                ], ordered=False)
+            except BulkWriteError as e:
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    print(f"Error migrating chat history: {e}")
+                    return
+            except Exception as e:
+                print(f"Error migrating chat history: {e}")
+                return
+        self.collection.update_one({"_id": doc["_id"]}, {"$unset": {"history": "", "history_seq": ""}})
+        self._mark_migrated()
+
+    async def _amigrate_legacy_history(self):
+        # The async reads would otherwise miss a legacy history the sync path has not migrated yet
+        if self.user_id not in ChatHistoryManager._migrated:
+            await asyncio.to_thread(self._migrate_legacy_history)
+
+    def _mark_migrated(self):
+        with ChatHistoryManager._migrated_lock:
+            ChatHistoryManager._migrated.add(self.user_id)
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from app.AppointmentManager import AppointmentManager
+from app.MedicationScheduleManager import MedicationScheduleManager
+from app.RecoveryCheckUpScheduleManager import RecoveryCheckUpScheduleManager
+
+# Collections whose indexes and 'due_at' backfill are prepared before serving turns
+TRACKER_MANAGERS = [MedicationScheduleManager, RecoveryCheckUpScheduleManager, AppointmentManager]
+
+_database_ready = False
+_database_ready_lock = threading.Lock()
+
+
+def ensure_database_ready() -> bool:
+    """
+    Creates the tracker indexes and backfills 'due_at' on older documents,
+    once per process.
+
+    The backfill scans whole collections with blocking pymongo calls, so it
+    runs at startup (graph building, reminder scheduler, or
+    `python -m app.DatabaseSetup` as a migration step) and never inside a
+    chat turn, where it would stall the shared event loop and eat into the
+    reminder timeout. A failed setup is retried on the next call.
+
+    Returns:
+        bool: True once the setup has completed.
+    """
+    global _database_ready
+    if _database_ready:
+        return True
+    with _database_ready_lock:
+        if not _database_ready:
+            try:
+                for manager in TRACKER_MANAGERS:
+                    manager.ensure_indexes()
+                _database_ready = True
+            except Exception as e:
+                print(f"Error preparing the database: {e}")
+    return _database_ready
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    ready = ensure_database_ready()
+    print(f"Database ready: {ready} ({(time.perf_counter() - started) * 1000:.0f} ms)")
@@ -1,13 +1,103 @@
+import asyncio
+import importlib.util
 import json
 import re
+import threading
+import weakref
 from dotenv import load_dotenv
 from pathlib import Path
 import streamlit as st
 #load_dotenv() 
 
 import os
+import httpx
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 from langchain_groq import ChatGroq
+from langgraph.constants import TAG_NOSTREAM
+from app.LLMCache import get_llm_cache, make_cache_key
+from app.PromptEncoder import get_prompt_encoder
+from app.ReminderCandidates import select_candidates
+from app.Tracing import llm_usage, span
+
+# Tag on LLM calls whose text is the reply shown to the user. The chat page
+# streams tokens from calls with this tag; every other call is marked
+# TAG_NOSTREAM so its tokens are not sent to the stream.
+REPLY_TAG = "naia_reply"
+
+GROQ_MODEL = "llama-3.1-8b-instant"
+# HTTP/2 multiplexes concurrent calls over one connection; needs the h2 package
+GROQ_HTTP2 = importlib.util.find_spec("h2") is not None
+GROQ_HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+
+_chat_models = {}
+_http_clients = None
+_chat_models_lock = threading.Lock()
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport keeping one connection pool per event loop.
+
+    A pooled connection cannot move between loops, but a ChatGroq instance
+    outlives any single loop (asyncio.run in scripts and tests, the
+    background loop in the app), so the pool is picked per call.
+    """
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._transports = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    async def handle_async_request(self, request):
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            with self._lock:
+                transport = self._transports.setdefault(loop, httpx.AsyncHTTPTransport(**self._kwargs))
+        return await transport.handle_async_request(request)
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def _groq_http_clients():
+    global _http_clients
+    if _http_clients is None:
+        _http_clients = (
+            httpx.Client(http2=GROQ_HTTP2, limits=GROQ_HTTP_LIMITS),
+            httpx.AsyncClient(transport=LoopLocalTransport(http2=GROQ_HTTP2, limits=GROQ_HTTP_LIMITS)),
+        )
+    return _http_clients
+
+
+def get_chat_model(temperature: float, model: str = GROQ_MODEL) -> ChatGroq:
+    """
+    Returns the process-wide ChatGroq for a model and temperature, building
+    it on first use.
+
+    Every instance sends its requests through the same pooled HTTP clients
+    (HTTP/2 when h2 is installed), so after the first call a request reuses
+    an open TLS connection to Groq instead of creating a client and
+    handshaking again. ChatGroq holds no per-call state and is thread-safe.
+
+    Args:
+        temperature (float): Sampling temperature.
+        model (str): Groq model name.
+
+    Returns:
+        ChatGroq: The shared chat model.
+    """
+    key = (model, temperature)
+    chat_model = _chat_models.get(key)
+    if chat_model is not None:
+        return chat_model
+    with _chat_models_lock:
+        if key not in _chat_models:
+            http_client, http_async_client = _groq_http_clients()
+            _chat_models[key] = ChatGroq(groq_api_key=st.secrets["GROQ_API_KEY"], temperature=temperature, model=model,
+                                         http_client=http_client, http_async_client=http_async_client)
+        return _chat_models[key]
 
 class GroqChat:
     """
@@ -21,20 +111,16 @@ class GroqChat:
     """
     def __init__(self):
         """
-        Initialize GroqChat with API keys and separate LLM instances for:
+        Initialize GroqChat with API keys and the shared LLM instances for:
         - general chat
         - classification
         - symptom analysis
         """
         self.api_key = st.secrets["GROQ_API_KEY"]
-        self.llm = ChatGroq(groq_api_key=self.api_key, temperature=0.5, model="llama-3.1-8b-instant")
-        self.chat_llm = ChatGroq(groq_api_key=self.api_key
-                                 , temperature=0.4
-                                 , model="llama-3.1-8b-instant")
-        
-        self.classifier_llm = ChatGroq(groq_api_key=self.api_key
-                                       , temperature=0.0
-                                       , model="llama-3.1-8b-instant")
+        # Shared per (model, temperature): creating a GroqChat builds no client
+        self.llm = get_chat_model(0.5)
+        self.chat_llm = get_chat_model(0.4)
+        self.classifier_llm = get_chat_model(0.0)
 
     def get_initial_messages(self):
         """
@@ -61,24 +147,145 @@ class GroqChat:
         """
         return AIMessage(content=content)    
         
-    def get_response(self, messages):
+    def _invoke(self, llm, messages, reply: bool = False) -> str:
+        """
+        Send a prompt to one of the LLM instances.
+        Deterministic (temperature 0) calls are served from the shared LLMCache when possible.
+        Args:
+            llm (ChatGroq): The model instance to call.
+            messages (list | str): Chat messages or a plain prompt string.
+            reply (bool): True if the response is shown to the user as is; its
+                tokens are then streamed when the graph runs with stream_mode="messages".
+        Returns: str: Response content from the AI.
+        """
+        config = self._call_config(reply)
+        with span("llm.chat", "client", model=llm.model_name, reply=reply) as llm_span:
+            if not self._is_deterministic(llm):
+                return self._traced_content(llm_span, llm.invoke(messages, config=config))
+            cache = get_llm_cache()
+            key = make_cache_key(llm.model_name, 0.0, messages)
+            content = cache.get(key)
+            llm_span.set(cache_hit=content is not None)
+            if content is None:
+                content = self._traced_content(llm_span, llm.invoke(messages, config=config))
+                cache.set(key, content)
+            return content
+
+    async def _ainvoke(self, llm, messages, reply: bool = False) -> str:
+        """
+        Async version of _invoke, using the model's ainvoke.
+        Returns: str: Response content from the AI.
+        """
+        config = self._call_config(reply)
+        with span("llm.chat", "client", model=llm.model_name, reply=reply) as llm_span:
+            if not self._is_deterministic(llm):
+                return self._traced_content(llm_span, await llm.ainvoke(messages, config=config))
+            cache = get_llm_cache()
+            key = make_cache_key(llm.model_name, 0.0, messages)
+            content = await cache.aget(key)
+            llm_span.set(cache_hit=content is not None)
+            if content is None:
+                content = self._traced_content(llm_span, await llm.ainvoke(messages, config=config))
+                await cache.aset(key, content)
+            return content
+
+    @staticmethod
+    def _traced_content(llm_span, message):
+        # Token counts reported by Groq for this call
+        llm_span.set(**llm_usage(message))
+        return message.content
+
+    @staticmethod
+    def _call_config(reply):
+        return {"tags": [REPLY_TAG if reply else TAG_NOSTREAM]}
+
+    @staticmethod
+    def _is_deterministic(llm) -> bool:
+        # langchain_groq stores temperature=0.0 as 1e-08
+        return (getattr(llm, "temperature", None) or 0.0) < 1e-6
+
+    def get_response(self, messages, reply: bool = False):
         """
         Send messages to the chat LLM and get a response.
-        Args: messages (list): List of HumanMessage, AIMessage, or SystemMessage.
+        Args:
+            messages (list): List of HumanMessage, AIMessage, or SystemMessage.
+            reply (bool): True if the response is shown to the user as is (streamed).
         Returns: str: Response content from the AI.
         """
-        return self.chat_llm.invoke(messages).content 
+        return self._invoke(self.chat_llm, messages, reply)
 
-    def get_chat_response(self, user_input: str) -> str:
+    async def aget_response(self, messages, reply: bool = False):
         """
-        Generate a general chat response for the user's input.        
-        Args: user_input (str): User's message.        
+        Async version of get_response.
+        Returns: str: Response content from the AI.
+        """
+        return await self._ainvoke(self.chat_llm, messages, reply)
+
+    def stream_response(self, messages):
+        """
+        Stream the chat LLM's response outside a graph.
+        Args: messages (list): List of HumanMessage, AIMessage, or SystemMessage.
+        Returns: Iterator[str]: Content chunks as they are generated.
+        """
+        for chunk in self.chat_llm.stream(messages, config=self._call_config(True)):
+            if chunk.content:
+                yield chunk.content
+
+    def get_chat_response(self, user_input: str, reply: bool = False) -> str:
+        """
+        Generate a general chat response for the user's input.
+        Args:
+            user_input (str): User's message.
+            reply (bool): True if the response is shown to the user as is (streamed).
         Returns: str: AI-generated response from the chat model.
         """
         messages = self.get_initial_messages()
         messages.append(self.human_message(user_input))
-        return self.get_response(messages)    
-    
+        return self.get_response(messages, reply)
+
+    async def aget_chat_response(self, user_input: str, reply: bool = False) -> str:
+        """
+        Async version of get_chat_response.
+        Returns: str: AI-generated response from the chat model.
+        """
+        messages = self.get_initial_messages()
+        messages.append(self.human_message(user_input))
+        return await self.aget_response(messages, reply)
+
+    def summarize_conversation(self, previous_summary: str, transcript: str, max_words: int = 150) -> str:
+        """
+        Fold older conversation turns into the running summary.
+        Args:
+            previous_summary (str): Summary of everything before the transcript ("" if none).
+            transcript (str): The turns to fold in, one "role: content" per line.
+            max_words (int): Upper bound on the summary length.
+        Returns: str: The updated summary.
+        """
+        prompt = self._summary_prompt(previous_summary, transcript, max_words)
+        return self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip()
+
+    async def asummarize_conversation(self, previous_summary: str, transcript: str, max_words: int = 150) -> str:
+        """
+        Async version of summarize_conversation.
+        """
+        prompt = self._summary_prompt(previous_summary, transcript, max_words)
+        return (await self._ainvoke(self.classifier_llm, [HumanMessage(content=prompt)])).strip()
+
+    def _summary_prompt(self, previous_summary, transcript, max_words):
+        return f"""
+        You maintain a running summary of a conversation between a post-surgery patient and their assistant.
+
+        Current summary:
+        {previous_summary or "(empty)"}
+
+        New turns to add:
+        {transcript}
+
+        Rewrite the summary so it also covers the new turns. Keep symptoms, durations, medications,
+        reminders and advice already given; drop greetings and small talk.
+        Use at most {max_words} words. Respond with the summary only.
+        """
+
     def classify_intent(self, user_input: str) -> str:
         """
         Classify the user's message into an intent category.        
@@ -97,24 +304,38 @@ class GroqChat:
         User: "{user_input}"
         """
         
-        response = self.classifier_llm.invoke([HumanMessage(content=prompt)]).content.strip().lower()
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip().lower()
         return response
 
     def extract_symptoms(self, user_input):
         """
         Extract symptoms and related metadata from the user's message.
-        
+
         Returns a JSON object containing:
         - overall_severity: 'mild', 'moderate', 'severe', or 'unknown'
         - symptoms: list of symptom objects with name, location, duration, severity, onset
-        
+
         Args:
             user_input (str): User's message.
-        
+
         Returns:
             dict: Extracted symptoms and overall severity.
         """
-        prompt = f"""
+        prompt = self._symptoms_prompt(user_input)
+        response = self._invoke(self.chat_llm, [HumanMessage(content=prompt)]).strip()
+        return self._parse_symptoms(response)
+
+    async def aextract_symptoms(self, user_input):
+        """
+        Async version of extract_symptoms.
+        Returns: dict: Extracted symptoms and overall severity.
+        """
+        prompt = self._symptoms_prompt(user_input)
+        response = (await self._ainvoke(self.chat_llm, [HumanMessage(content=prompt)])).strip()
+        return self._parse_symptoms(response)
+
+    def _symptoms_prompt(self, user_input):
+        return f"""
             Extract symptoms and metadata from the user's message.
             Return ONLY ONE raw JSON object. No Markdown, no comments, no extra text.
             - overall_severity: one of "mild", "moderate", "severe", or "unknown"
@@ -135,8 +356,8 @@ class GroqChat:
 
             User text: "{user_input}"
             """
-        
-        response = self.chat_llm.invoke([HumanMessage(content=prompt)]).content.strip()
+
+    def _parse_symptoms(self, response):
         try:
             start = response.find("{")
             end   = response.rfind("}")
@@ -167,7 +388,21 @@ class GroqChat:
         Returns:
             int: Number of days the symptom has been present. Returns 0 if not mentioned or invalid.
         """
-        prompt = f"""
+        prompt = self._duration_prompt(text, symptom)
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip()
+        return self._parse_duration(response)
+
+    async def aextract_duration_from_text(self, text: str, symptom: str) -> int:
+        """
+        Async version of extract_duration_from_text.
+        Returns: int: Number of days the symptom has been present.
+        """
+        prompt = self._duration_prompt(text, symptom)
+        response = (await self._ainvoke(self.classifier_llm, [HumanMessage(content=prompt)])).strip()
+        return self._parse_duration(response)
+
+    def _duration_prompt(self, text, symptom):
+        return f"""
         The following user message might mention how many days they have had this symptom: {symptom}.
         Extract the number of days (as an integer). If not mentioned, respond with 0.
 
@@ -176,13 +411,100 @@ class GroqChat:
 
         Answer with only a number.
         """
-        response = self.classifier_llm.invoke([HumanMessage(content=prompt)]).content.strip()
+
+    def _parse_duration(self, response):
         try:
             duration = int(response.strip())
             return max(duration, 0)
         except ValueError:
             return 0
 
+    def triage_symptoms(self, user_input: str, patient_context: dict):
+        """
+        Extract symptoms, their durations and the overall severity in a single call.
+
+        Args:
+            user_input (str): User's message.
+            patient_context (dict): Patient information including surgery type, medications, and pre-existing conditions.
+
+        Returns:
+            dict or None: Validated triage with 'symptoms', 'detected_symptoms' and
+                'overall_severity', or None if the response does not match the schema.
+        """
+        prompt = self._triage_prompt(user_input, patient_context)
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip()
+        return self._validate_triage(self._parse_symptoms(response))
+
+    async def atriage_symptoms(self, user_input: str, patient_context: dict):
+        """
+        Async version of triage_symptoms.
+        """
+        prompt = self._triage_prompt(user_input, patient_context)
+        response = (await self._ainvoke(self.classifier_llm, [HumanMessage(content=prompt)])).strip()
+        return self._validate_triage(self._parse_symptoms(response))
+
+    def _triage_prompt(self, user_input: str, patient_context: dict):
+        prompt = f"""
+            You are a post-surgery symptom triage assistant.
+            Extract the symptoms from the user's message and evaluate their overall severity.
+            Return ONLY ONE raw JSON object. No Markdown, no comments, no extra text.
+            - overall_severity: one of "mild", "moderate", "severe"
+            - symptoms: array of objects with fields:
+                - name (string)
+                - location (string or null)
+                - duration_days (integer, 1 if not mentioned)
+                - severity (one of "mild","moderate","severe" or null)
+                - onset (string or null)
+
+            To decide the severity consider:
+            - Symptom duration.
+            - Possible complications for the type of surgery.
+            - Risk factors from medications and pre-existing conditions.
+
+            Patient context:
+            - Surgery: {patient_context.get('surgery')}
+            - Medications: {', '.join([med['name'] for med in patient_context.get('medications', [])])}
+            - Pre-existing conditions: {', '.join([cond['name'] for cond in patient_context.get('pre_existing_conditions', [])])}
+
+            Rules:
+            - "location" must be anatomical (e.g., "head", "left arm").
+            - If no symptoms are found, return "symptoms": [] and still evaluate the message.
+
+            User text: "{user_input}"
+            """
+        return prompt
+
+    def _validate_triage(self, data):
+        """
+        Checks a triage response against the expected schema and normalises it.
+
+        Returns:
+            dict or None: The triage with 'detected_symptoms' added, or None if invalid.
+        """
+        severities = ("mild", "moderate", "severe")
+        if not isinstance(data, dict):
+            return None
+        overall = str(data.get("overall_severity", "")).strip().lower()
+        symptoms = data.get("symptoms")
+        if overall not in severities or not isinstance(symptoms, list):
+            return None
+        for symptom in symptoms:
+            if not isinstance(symptom, dict) or not isinstance(symptom.get("name"), str) or not symptom["name"].strip():
+                return None
+            duration = symptom.get("duration_days")
+            if duration is None:
+                symptom["duration_days"] = 1
+            elif isinstance(duration, bool) or not isinstance(duration, int) or duration < 0:
+                return None
+            else:
+                symptom["duration_days"] = max(duration, 1)
+            severity = symptom.get("severity")
+            if severity is not None and str(severity).lower() not in severities:
+                return None
+        data["overall_severity"] = overall
+        data["detected_symptoms"] = [symptom["name"] for symptom in symptoms]
+        return data
+
     def classify_severity(self, symptom: str, patient_context: dict, duration_days: int) -> str:
         """
         Classify the severity of a symptom based on patient context and symptom duration.
@@ -195,6 +517,19 @@ class GroqChat:
         Returns:
             str: Severity classification: "mild", "moderate", or "severe".
         """
+        prompt = self._classify_severity_prompt(symptom, patient_context, duration_days)
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip()
+        return response.lower()
+
+    async def aclassify_severity(self, symptom: str, patient_context: dict, duration_days: int) -> str:
+        """
+        Async version of classify_severity.
+        """
+        prompt = self._classify_severity_prompt(symptom, patient_context, duration_days)
+        response = (await self._ainvoke(self.classifier_llm, [HumanMessage(content=prompt)])).strip()
+        return response.lower()
+
+    def _classify_severity_prompt(self, symptom: str, patient_context: dict, duration_days: int):
         prompt = f"""
         You are a post-surgery symptom triage assistant.
         Consider:
@@ -214,9 +549,8 @@ class GroqChat:
 
         Respond only with the severity.
         """
-        response = self.classifier_llm.invoke([HumanMessage(content=prompt)]).content.strip()
-        return response.lower()
-    
+        return prompt
+
     def answer_medication_question(self, user_input: str, medication_data: list) -> str:
         """
         Answer a user's question about their medication schedule.
@@ -228,16 +562,27 @@ class GroqChat:
         Returns:
             str: AI-generated, concise, and friendly response about medications.
         """
-        medication_json_str = json.dumps(medication_data, indent=2)
+        prompt = self._answer_medication_question_prompt(user_input, medication_data)
+        response = self._invoke(self.chat_llm, [HumanMessage(content=prompt)], reply=True).strip()
+        return response
+
+    async def aanswer_medication_question(self, user_input: str, medication_data: list) -> str:
+        """
+        Async version of answer_medication_question.
+        """
+        prompt = self._answer_medication_question_prompt(user_input, medication_data)
+        response = (await self._ainvoke(self.chat_llm, [HumanMessage(content=prompt)], reply=True)).strip()
+        return response
+
+    def _answer_medication_question_prompt(self, user_input: str, medication_data: list):
+        medication_table = get_prompt_encoder().medication_schedule(medication_data)
 
         prompt = f"""
         You are a helpful assistant that helps users manage their medication schedules after surgery.
 
-        Here is the user's medication tracker in JSON format:
+        Here is the user's medication tracker, one line per medication and day with the time and status of each dose:
 
-        ```json
-        {medication_json_str}
-        ```
+        {medication_table}
 
         Based on this data, answer the user's question below in a clear and helpful tone. If a medication is due soon, remind the user.
         If no medication is due, let them know. If the data is incomplete, be honest about it.
@@ -246,10 +591,8 @@ class GroqChat:
 
         Respond in a concise, friendly tone.
         """
+        return prompt
 
-        response = self.chat_llm.invoke([HumanMessage(content=prompt)]).content.strip()
-        return response
-    
     def answer_recovery_question(self, user_input: str, recovery_data: list) -> str:
         """
         Answer a user's question about their post-surgery recovery tasks or schedule.
@@ -261,15 +604,26 @@ class GroqChat:
         Returns:
             str: AI-generated, concise, and friendly response about recovery.
         """
-        recovery_json_str = json.dumps(recovery_data, indent=2)
+        prompt = self._answer_recovery_question_prompt(user_input, recovery_data)
+        response = self._invoke(self.chat_llm, [HumanMessage(content=prompt)], reply=True).strip()
+        return response
+
+    async def aanswer_recovery_question(self, user_input: str, recovery_data: list) -> str:
+        """
+        Async version of answer_recovery_question.
+        """
+        prompt = self._answer_recovery_question_prompt(user_input, recovery_data)
+        response = (await self._ainvoke(self.chat_llm, [HumanMessage(content=prompt)], reply=True)).strip()
+        return response
+
+    def _answer_recovery_question_prompt(self, user_input: str, recovery_data: list):
+        recovery_table = get_prompt_encoder().recovery_schedule(recovery_data)
         prompt = f"""
         You are a helpful assistant that helps users manage their post-surgery recovery tasks and schedules.
 
-        Here is the user's recovery routine tracker in JSON format:
+        Here is the user's recovery routine tracker, one line per activity and day with the time and status of each session:
 
-        ```json
-        {recovery_json_str}
-        ```
+        {recovery_table}
 
         Based on this data, answer the user's question below in a clear and helpful tone.
         If a recovery task is scheduled soon, remind the user.
@@ -280,9 +634,7 @@ class GroqChat:
 
         Respond in a concise, friendly tone.
         """
-
-        response = self.chat_llm.invoke([HumanMessage(content=prompt)]).content.strip()
-        return response
+        return prompt
 
     def extract_taken_medication(self, user_input: str) -> str:
         """
@@ -294,6 +646,19 @@ class GroqChat:
         Returns:
             str: Exact medication name in lowercase, or "none" if no medication is mentioned.
         """
+        prompt = self._extract_taken_medication_prompt(user_input)
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip()
+        return response.lower()
+
+    async def aextract_taken_medication(self, user_input: str) -> str:
+        """
+        Async version of extract_taken_medication.
+        """
+        prompt = self._extract_taken_medication_prompt(user_input)
+        response = (await self._ainvoke(self.classifier_llm, [HumanMessage(content=prompt)])).strip()
+        return response.lower()
+
+    def _extract_taken_medication_prompt(self, user_input: str):
         prompt = f"""
         The user may be confirming that they have taken a medication.
 
@@ -304,8 +669,7 @@ class GroqChat:
 
         User: "{user_input}"
         """
-        response = self.classifier_llm.invoke([HumanMessage(content=prompt)]).content.strip()
-        return response.lower()
+        return prompt
 
     def extract_completed_recovery_task(self, user_input: str) -> str:
         """
@@ -327,7 +691,7 @@ class GroqChat:
 
         User: "{user_input}"
         """
-        response = self.classifier_llm.invoke([HumanMessage(content=prompt)]).content.strip()
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip()
         return response.lower()
     
     def is_recovery_related(self, user_input, tracker):
@@ -341,10 +705,22 @@ class GroqChat:
         Returns:
             bool: True if the input relates to a recovery task, False otherwise.
         """
-        tracker_simplified = [
-             {"activity": t["activity"], "time": t["time"]} 
-                for t in tracker
-            ]
+        prompt = self._is_recovery_related_prompt(user_input, tracker)
+        response = self._invoke(self.classifier_llm, [HumanMessage(content=prompt)]).strip().lower()
+        return response == "yes"
+
+    async def ais_recovery_related(self, user_input, tracker):
+        """
+        Async version of is_recovery_related.
+        """
+        prompt = self._is_recovery_related_prompt(user_input, tracker)
+        response = (await self._ainvoke(self.classifier_llm, [HumanMessage(content=prompt)])).strip().lower()
+        return response == "yes"
+
+    def _is_recovery_related_prompt(self, user_input, tracker):
+        # Distinct (activity, time) pairs: a multi-day question repeats the same sessions
+        pairs = dict.fromkeys((t["activity"], t["time"]) for t in tracker)
+        tracker_simplified = [{"activity": activity, "time": time} for activity, time in pairs]
         prompt = f"""
         Given the user's input and the list of scheduled recovery activities, recovery checkups or recovery tasks, 
         determine if the input describes doing or referring to any of the items listed in the recovery activities.
@@ -355,8 +731,7 @@ class GroqChat:
 
         Respond ONLY with "yes" or "no".
         """
-        response = self.classifier_llm.invoke([HumanMessage(content=prompt)]).content.strip().lower()
-        return response == "yes"
+        return prompt
 
     def extract_routine_from_medical_record(self, routine_text, surgery_date):
         """
@@ -410,7 +785,7 @@ class GroqChat:
             Return ONLY ONE valid JSON object. Do not include explanations or formatting.
                        
             """
-        response = self.classifier_llm.invoke(prompt).content.strip()
+        response = self._invoke(self.classifier_llm, prompt).strip()
         return response 
     
 
@@ -449,7 +824,7 @@ class GroqChat:
             Follow-up entries:
             {json.dumps(followup_list, indent=2)}
             """          
-        response = self.classifier_llm.invoke(prompt).content.strip()
+        response = self._invoke(self.classifier_llm, prompt).strip()
         return response
 
     def search_for_tasks_to_mark(self, tasks_str: str, user_input: str) -> str:
@@ -463,6 +838,19 @@ class GroqChat:
         Returns:
             str: Task number matching the user's input, or "none" if no match.
         """
+        prompt = self._search_for_tasks_to_mark_prompt(tasks_str, user_input)
+        response = self._invoke(self.classifier_llm, prompt).strip().lower()
+        return response
+
+    async def asearch_for_tasks_to_mark(self, tasks_str: str, user_input: str) -> str:
+        """
+        Async version of search_for_tasks_to_mark.
+        """
+        prompt = self._search_for_tasks_to_mark_prompt(tasks_str, user_input)
+        response = (await self._ainvoke(self.classifier_llm, prompt)).strip().lower()
+        return response
+
+    def _search_for_tasks_to_mark_prompt(self, tasks_str: str, user_input: str):
         prompt = f"""
         These are the recovery tasks scheduled for today near the current time:
         {tasks_str}
@@ -474,13 +862,16 @@ class GroqChat:
         - If none match, respond with "none".
         - Respond with ONLY the task number or "none".
         """
-        response = self.classifier_llm.invoke(prompt).content.strip().lower()
-        return response
+        return prompt
 
     def find_reminder_mentioned(self, user_input, all_reminders):
         """
         Determine the user's intent related to reminders and match it to an existing reminder.
 
+        Only the activities most likely meant by the message are listed in the
+        prompts (see app.ReminderCandidates.select_candidates), so their size
+        does not grow with the schedule.
+
         Args:
             user_input (str): User's message.
             all_reminders (list): List of all reminder objects.
@@ -489,8 +880,34 @@ class GroqChat:
             str: A string combining the intent and the matched reminder name, separated by "|",
                 or "none" if unrelated to reminders.
         """
+        task_list_str = self._reminder_task_list(user_input, all_reminders)
+        result = self._invoke(self.classifier_llm, self._reminder_intent_prompt(user_input, task_list_str)).strip()
+        # print ("result------------ ", result)
+
+        if result == "none":
+            return "none"
+        result2 = self._invoke(self.classifier_llm, self._reminder_match_prompt(user_input, task_list_str)).strip()
+        # print ("result2------------ ", result2)
+        return result + "|" + result2
+
+    async def afind_reminder_mentioned(self, user_input, all_reminders):
+        """
+        Async version of find_reminder_mentioned. The intent and name-matching
+        calls are sent concurrently; the match is discarded when the intent is "none".
+        """
+        task_list_str = self._reminder_task_list(user_input, all_reminders)
+        result, result2 = await asyncio.gather(
+            self._ainvoke(self.classifier_llm, self._reminder_intent_prompt(user_input, task_list_str)),
+            self._ainvoke(self.classifier_llm, self._reminder_match_prompt(user_input, task_list_str)),
+        )
+        result = result.strip()
+        if result == "none":
+            return "none"
+        return result + "|" + result2.strip()
+
+    def _reminder_task_list(self, user_input, all_reminders):
         unique_tasks = {}
-        for reminder in all_reminders:
+        for reminder in select_candidates(user_input, all_reminders):
             name = reminder["activity"].lower()
             reminder_type = "personal" if reminder.get("created_by_patient", False) else "doctor"
             if name not in unique_tasks:
@@ -498,8 +915,10 @@ class GroqChat:
                     "activity": reminder["activity"],
                     "type": reminder_type
                 }
-        task_list = [f"{data['activity']} ({data['type']})" for data in unique_tasks.values()]
         task_list_str = "\n".join(f"- {data['activity']} ({data['type']})" for data in unique_tasks.values())
+        return task_list_str
+
+    def _reminder_intent_prompt(self, user_input, task_list_str):
         prompt = f"""
         You are a reminder intent classifier.
 
@@ -518,11 +937,9 @@ class GroqChat:
         reminder_crud
         none
         """
-        result = self.classifier_llm.invoke(prompt).content.strip()
-        # print ("result------------ ", result)
+        return prompt
 
-        if result == "none":
-            return "none"
+    def _reminder_match_prompt(self, user_input, task_list_str):
         prompt = f"""
         You are a reminder name matcher.
 
@@ -532,10 +949,8 @@ class GroqChat:
         Find the single reminder from the list that best matches the message, even if the wording is different.
         Return ONLY the exact reminder name from the list, or "none" if there is no match.
         """
-        result2 = self.classifier_llm.invoke(prompt).content.strip()
-        # print ("result2------------ ", result2)
-        return result + "|" + result2
-    
+        return prompt
+
     def get_reminder_information(self, user_input, all_reminders):
         """
         Check if the user's message refers to any existing reminder and identify its type.
@@ -545,10 +960,33 @@ class GroqChat:
             all_reminders (list): List of existing reminders with their type.
 
         Returns:
-            str: "YES|TYPE" if a match is found (TYPE = "personal" or "doctor"), "NO" otherwise.
+            str: "YES|TYPE" if a match is found (TYPE = "personal" or "doctor"), "NO" otherwise,
+            without calling the LLM when there are no reminders.
+            Only the closest candidate activities are compared (app.ReminderCandidates).
         """
+        prompt = self._get_reminder_information_prompt(user_input, all_reminders)
+        if prompt is None:
+            return "NO"
+        result = self._invoke(self.classifier_llm, prompt).strip().upper()
+        # print("Match result:", result)
+        # print ("_________________________________")
+        return result
+
+    async def aget_reminder_information(self, user_input, all_reminders):
+        """
+        Async version of get_reminder_information.
+        """
+        prompt = self._get_reminder_information_prompt(user_input, all_reminders)
+        if prompt is None:
+            return "NO"
+        result = (await self._ainvoke(self.classifier_llm, prompt)).strip().upper()
+        # print("Match result:", result)
+        # print ("_________________________________")
+        return result
+
+    def _get_reminder_information_prompt(self, user_input, all_reminders):
         unique_tasks = {}
-        for reminder in all_reminders:
+        for reminder in select_candidates(user_input, all_reminders):
             name = reminder["activity"].lower()
             reminder_type = reminder["type"]
             if name not in unique_tasks:
@@ -556,32 +994,31 @@ class GroqChat:
                     "activity": reminder["activity"],
                     "type": reminder_type
                 }
-            task_lines = [f"- {data['activity']} ({data['type']})" for data in unique_tasks.values()]
-            tasks_text = "\n".join(task_lines)
-            prompt = f"""
-               You are a reminder matching assistant.
-
-                Here is the list of existing reminders with their type:
-                {tasks_text}
+        if not unique_tasks:
+            return None
+        task_lines = [f"- {data['activity']} ({data['type']})" for data in unique_tasks.values()]
+        tasks_text = "\n".join(task_lines)
+        prompt = f"""
+           You are a reminder matching assistant.
 
-                User message:
-                "{user_input}"
+            Here is the list of existing reminders with their type:
+            {tasks_text}
 
-                Task:
-                - Check if the reminder activity mentioned in the user's message refers to one in the list above.
-                - Consider it a match even if:
-                    * Case (upper/lower) is different.
-                    * There are plural/singular variations.
-                    * There are extra words like "the", "reminder", "task", "my", etc.
-                    * There are action verbs like "delete", "remove", "mark", "complete", etc.
-                - If the meaning clearly refers to one existing activity, output ONLY: YES|TYPE (TYPE is "personal" or "doctor").
-                - If it does not refer to any activity in the list, output ONLY: NO.
-                - No explanations. No extra text. No formatting.
-                """
-        result = self.classifier_llm.invoke(prompt).content.strip().upper()
-        # print("Match result:", result)
-        # print ("_________________________________")
-        return result
+            User message:
+            "{user_input}"
+
+            Task:
+            - Check if the reminder activity mentioned in the user's message refers to one in the list above.
+            - Consider it a match even if:
+                * Case (upper/lower) is different.
+                * There are plural/singular variations.
+                * There are extra words like "the", "reminder", "task", "my", etc.
+                * There are action verbs like "delete", "remove", "mark", "complete", etc.
+            - If the meaning clearly refers to one existing activity, output ONLY: YES|TYPE (TYPE is "personal" or "doctor").
+            - If it does not refer to any activity in the list, output ONLY: NO.
+            - No explanations. No extra text. No formatting.
+            """
+        return prompt
 
     def get_new_reminder(self, user_input, all_reminders):
         """
@@ -624,7 +1061,7 @@ class GroqChat:
                 - If it does not refer to any activity in the list, output ONLY: NO|.
                 - No explanations. No extra text. No formatting.
                 """
-        result = self.classifier_llm.invoke(prompt).content.strip().upper()
+        result = self._invoke(self.classifier_llm, prompt).strip().upper()
         # print("Match result:", result)
         # print ("_________________________________")
         return result
@@ -645,6 +1082,21 @@ class GroqChat:
                 - preferred_times
                 - notes
         """
+        prompt = self._extract_reminder_info_simple_prompt(user_input)
+        response = self._invoke(self.classifier_llm, prompt).strip()
+        # print("extracting reminder ", response)
+        return response
+
+    async def aextract_reminder_info_simple(self, user_input):
+        """
+        Async version of extract_reminder_info_simple.
+        """
+        prompt = self._extract_reminder_info_simple_prompt(user_input)
+        response = (await self._ainvoke(self.classifier_llm, prompt)).strip()
+        # print("extracting reminder ", response)
+        return response
+
+    def _extract_reminder_info_simple_prompt(self, user_input):
         prompt = f"""
             You are an assistant that extracts reminder details from a user's message.
 
@@ -669,6 +1121,5 @@ class GroqChat:
 
             Respond ONLY with the JSON object. No extra text or explanation.
         """
-        response = self.classifier_llm.invoke(prompt).content.strip()
-        # print("extracting reminder ", response)
-        return response
\ No newline at end of file
+        return prompt
+
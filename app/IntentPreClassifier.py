@@ -0,0 +1,393 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+INTENTS = [
+    "symptom_agent",
+    "reminder_medication_agent",
+    "reminder_recovery_agent",
+    "medical_record_agent",
+    "recommendation_agent",
+    "chat_agent",
+]
+# Route used when the LLM answers with something that is not an intent and there is no local guess
+FALLBACK_INTENT = "chat_agent"
+DEFAULT_CONFIDENCE_THRESHOLD = 0.9
+# Most recent LLM-labelled messages used for training
+MAX_LOGGED_EXAMPLES = 5000
+
+# Examples taken from the routing prompt in agents.NaiaAgent, plus close variants
+SEED_EXAMPLES = {
+    "symptom_agent": [
+        "I have pain in my leg", "I have pain", "I'm nauseous", "It hurts",
+        "my knee hurts", "I feel dizzy", "I have a fever", "my wound is swollen",
+        "I have a headache", "I feel sick", "the incision is bleeding", "I've been vomiting",
+    ],
+    "reminder_medication_agent": [
+        "Did I take my ibuprofen?", "What are the medications for today?",
+        "did I take my medication", "when do I take my pills", "what meds are due now",
+        "which medicine do I take next", "have I taken my tablets today", "medication schedule",
+    ],
+    "reminder_recovery_agent": [
+        "What stretches do I need to do today?", "When should I apply ice?",
+        "set a reminder", "create a reminder", "delete my reminder", "remind me to walk every day",
+        "what exercises are pending", "I did my leg stretches", "I went for my walk",
+    ],
+    "medical_record_agent": [
+        "What were my last test results?", "Do I have any allergies?",
+        "what surgery did I have", "what are my lab results", "show my past prescriptions",
+        "what is in my medical history", "when was my surgery",
+    ],
+    "recommendation_agent": [
+        "Should I go to the ER?", "what should I do?", "is this normal?",
+        "should I go to the hospital?", "should I call my doctor", "what do you recommend for recovery",
+        "can I shower after surgery", "when can I drive again",
+    ],
+    "chat_agent": [
+        "Hey, how are you?", "what's your name?", "hello", "hi there", "good morning",
+        "thank you", "thanks a lot", "who are you",
+    ],
+}
+
+# Symptom vocabulary shared by the symptom rule and the "is it normal" exclusion
+SYMPTOM_WORDS = (
+    r"\b(pain|ache|aching|nause\w*|dizz\w*|fever\w*|swell\w*|swollen|bleed\w*|vomit\w*|headache|cramps?|itch\w*|rash|sore|numb)\b"
+)
+
+# High-precision rules, checked in the routing prompt's priority order. Ambiguous
+# wording (a medication question about the record, "is it normal" about a
+# symptom) is left to the model and the LLM.
+RULES = [
+    ("symptom_agent", re.compile(
+        r"\b(i have|i've got|i have got|i feel|i'm feeling|i am feeling|i'm|i am)\b.{0,30}" + SYMPTOM_WORDS)),
+    ("symptom_agent", re.compile(r"\b(it hurts|hurts|hurting|painful|throwing up)\b")),
+    ("reminder_medication_agent", re.compile(
+        r"\b(did i take|have i taken|when do i take|what do i take)\b.{0,30}"
+        r"\b(medications?|medicines?|meds|pills?|tablets?|dose|ibuprofen|paracetamol|antibiotics?)\b")),
+    ("reminder_medication_agent", re.compile(
+        r"\bwhat (medications?|medicines?|meds|pills|tablets)\b.{0,30}"
+        r"\b(take|taking|due|today|tonight|now|next|this (morning|afternoon|evening))\b")),
+    ("reminder_medication_agent", re.compile(r"\bnext dose\b")),
+    ("reminder_recovery_agent", re.compile(
+        r"\b(set|create|add|delete|remove|cancel|change|modify)\b.{0,20}\breminders?\b")),
+    ("reminder_recovery_agent", re.compile(r"\bremind me\b")),
+    ("reminder_recovery_agent", re.compile(r"\bwhat (stretches|exercises|recovery tasks)\b")),
+    ("medical_record_agent", re.compile(
+        r"\b(my|any)\s+(allerg(y|ies)|test results|lab results|blood tests?|medical (history|records?)|past prescriptions?)\b")),
+    ("recommendation_agent", re.compile(
+        r"\bshould i (go to|see|call|visit) (the |a |my )?(er|a&e|hospital|doctor|gp|emergency)\b")),
+    ("recommendation_agent", re.compile(r"^(?!.*" + SYMPTOM_WORDS + r").*\bis (this|it|that) normal\b")),
+    ("chat_agent", re.compile(
+        r"^\W*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|how are you|what'?s your name|who are you)\b"
+        r"[\w\s,']{0,20}\W*$")),
+]
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercases a message and returns its word unigrams and bigrams.
+
+    Args:
+        text (str): The user message.
+
+    Returns:
+        list[str]: Unigram and bigram features.
+    """
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NgramNaiveBayes:
+    """
+    Multinomial naive Bayes over word n-grams with Laplace smoothing.
+
+    Small enough to retrain in milliseconds from the seed examples and the
+    logged traffic, which is all the pre-classifier needs.
+    """
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.labels = []
+        self._log_prior = {}
+        self._log_likelihood = {}
+        self._log_unseen = {}
+
+    def fit(self, examples):
+        """
+        Trains the model.
+
+        Args:
+            examples (list[tuple[str, str]]): (text, label) pairs.
+        """
+        doc_counts = Counter()
+        feature_counts = defaultdict(Counter)
+        vocabulary = set()
+        for text, label in examples:
+            doc_counts[label] += 1
+            features = tokenize(text)
+            feature_counts[label].update(features)
+            vocabulary.update(features)
+        total_docs = sum(doc_counts.values())
+        self.labels = sorted(doc_counts)
+        vocab_size = len(vocabulary) or 1
+        for label in self.labels:
+            total = sum(feature_counts[label].values()) + self.alpha * vocab_size
+            self._log_prior[label] = math.log(doc_counts[label] / total_docs)
+            self._log_likelihood[label] = {
+                f: math.log((count + self.alpha) / total) for f, count in feature_counts[label].items()
+            }
+            self._log_unseen[label] = math.log(self.alpha / total)
+        self._vocabulary = vocabulary
+
+    def predict_proba(self, text: str) -> dict:
+        """
+        Returns the posterior probability of each label for a message.
+        Features never seen in training are ignored.
+
+        Args:
+            text (str): The user message.
+
+        Returns:
+            dict: Mapping of label to probability, or {} if the model is untrained.
+        """
+        if not self.labels:
+            return {}
+        features = [f for f in tokenize(text) if f in self._vocabulary]
+        scores = {}
+        for label in self.labels:
+            likelihood = self._log_likelihood[label]
+            unseen = self._log_unseen[label]
+            scores[label] = self._log_prior[label] + sum(likelihood.get(f, unseen) for f in features)
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+class IntentPreClassifier:
+    """
+    Local router that answers confident cases without calling the LLM.
+
+    Messages are first matched against high-precision keyword/regex rules,
+    then scored by an n-gram naive Bayes model trained on the routing prompt's
+    examples and on past LLM decisions logged in the 'intentLog' collection.
+    Below the confidence threshold the caller falls back to the LLM, whose
+    answer is logged as new training data and compared with the local guess.
+
+    Attributes:
+        threshold (float): Minimum model probability to route locally.
+        collection (pymongo collection): Optional 'intentLog' collection.
+        shadow_rate (float): Fraction of local decisions also sent to the LLM
+            to measure agreement on confident cases (0 disables it).
+        stats (dict): Counters for local hits, LLM fallbacks and agreement.
+    """
+    def __init__(self, threshold: float = DEFAULT_CONFIDENCE_THRESHOLD, collection=None, shadow_rate: float = 0.0):
+        self.threshold = threshold
+        self.collection = collection
+        self.shadow_rate = shadow_rate
+        self.model = NgramNaiveBayes()
+        self.stats = {"total": 0, "rule_hits": 0, "model_hits": 0, "llm_calls": 0, "compared": 0, "agreements": 0,
+                      "invalid_llm_labels": 0}
+        self._lock = threading.Lock()
+        self.retrain()
+
+    def retrain(self):
+        """
+        Retrains the model from the seed examples plus logged LLM decisions.
+
+        Returns:
+            int: Number of training examples used.
+        """
+        examples = [(text, label) for label, texts in SEED_EXAMPLES.items() for text in texts]
+        if self.collection is not None:
+            try:
+                cursor = self.collection.find(
+                    {"label": {"$in": INTENTS}}, {"_id": 0, "text": 1, "label": 1}
+                ).sort("timestamp", -1).limit(MAX_LOGGED_EXAMPLES)
+                examples += [(doc["text"], doc["label"]) for doc in cursor]
+            except Exception as e:
+                print(f"Error loading intent log: {e}")
+        self.model.fit(examples)
+        return len(examples)
+
+    def predict(self, text: str):
+        """
+        Predicts the intent of a message locally.
+
+        Args:
+            text (str): The user message.
+
+        Returns:
+            tuple: (label (str), confidence (float), source ("rule" | "model"))
+        """
+        lowered = text.lower()
+        for label, pattern in RULES:
+            if pattern.search(lowered):
+                return label, 1.0, "rule"
+        proba = self.model.predict_proba(text)
+        if not proba:
+            return None, 0.0, "model"
+        label = max(proba, key=proba.get)
+        return label, proba[label], "model"
+
+    def route(self, text: str):
+        """
+        Returns the locally predicted intent when it is confident enough.
+
+        Args:
+            text (str): The user message.
+
+        Returns:
+            tuple: (label or None, guess) where label is set when the message can
+                be routed without the LLM and guess is the full predict() result.
+        """
+        guess = self.predict(text)
+        label, confidence, source = guess
+        with self._lock:
+            self.stats["total"] += 1
+            if label and confidence >= self.threshold:
+                self.stats["rule_hits" if source == "rule" else "model_hits"] += 1
+                return label, guess
+            self.stats["llm_calls"] += 1
+        return None, guess
+
+    def should_shadow(self) -> bool:
+        """Decides whether a confident local decision is also checked by the LLM."""
+        if self.shadow_rate <= 0:
+            return False
+        with self._lock:
+            hits = self.stats["rule_hits"] + self.stats["model_hits"]
+        return hits % max(1, round(1 / self.shadow_rate)) == 0
+
+    def record_llm_label(self, text: str, llm_label: str, guess, shadow: bool = False, from_llm: bool = True):
+        """
+        Records the LLM's decision: updates agreement counters and logs the
+        message as training data. Labels that did not come from the LLM (see
+        resolve_label) are neither compared nor logged, so the model never
+        trains on its own guesses.
+
+        Args:
+            text (str): The user message.
+            llm_label (str): Intent returned by the LLM.
+            guess (tuple): The predict() result for the same message.
+            shadow (bool): True when the message was already routed locally.
+            from_llm (bool): False when llm_label is a fallback, not the LLM's answer.
+        """
+        local_label, confidence, source = guess
+        with self._lock:
+            if shadow:
+                self.stats["llm_calls"] += 1
+            if not from_llm:
+                return
+            if local_label:
+                self.stats["compared"] += 1
+                if local_label == llm_label:
+                    self.stats["agreements"] += 1
+        if self.collection is None or llm_label not in INTENTS:
+            return
+        try:
+            self.collection.insert_one({
+                "text": text,
+                "label": llm_label,
+                "local_label": local_label,
+                "local_confidence": round(confidence, 4),
+                "local_source": source,
+                "timestamp": datetime.now(ZoneInfo("Europe/London")),
+            })
+        except Exception as e:
+            print(f"Error logging intent: {e}")
+
+    def resolve_label(self, llm_label: str, guess) -> tuple:
+        """
+        Maps the LLM's answer to one of INTENTS: the answer itself, or the one
+        intent it mentions (e.g. '"symptom_agent".'). Anything else falls back
+        to the local guess, then to FALLBACK_INTENT.
+
+        Args:
+            llm_label (str): Raw answer of the LLM router.
+            guess (tuple): The predict() result for the same message.
+
+        Returns:
+            tuple: (a valid intent, True if it came from the LLM's answer).
+        """
+        answer = str(llm_label or "").strip().lower()
+        if answer in INTENTS:
+            return answer, True
+        mentioned = [intent for intent in INTENTS if intent in answer]
+        if len(mentioned) == 1:
+            return mentioned[0], True
+        with self._lock:
+            self.stats["invalid_llm_labels"] += 1
+        return guess[0] or FALLBACK_INTENT, False
+
+    def classify(self, text: str, llm_fn) -> str:
+        """
+        Routes a message locally when confident, otherwise asks the LLM.
+
+        Args:
+            text (str): The user message.
+            llm_fn (callable): Function taking the message and returning the LLM's label.
+
+        Returns:
+            str: The selected intent, always one of INTENTS.
+        """
+        label, guess = self.route(text)
+        if label is not None:
+            if self.should_shadow():
+                llm_label, from_llm = self.resolve_label(llm_fn(text), guess)
+                self.record_llm_label(text, llm_label, guess, shadow=True, from_llm=from_llm)
+            return label
+        llm_label, from_llm = self.resolve_label(llm_fn(text), guess)
+        self.record_llm_label(text, llm_label, guess, from_llm=from_llm)
+        return llm_label
+
+    def metrics(self) -> dict:
+        """
+        Returns the counters plus derived hit and agreement rates.
+
+        Returns:
+            dict: 'hit_rate' is the share of messages routed locally and
+                'agreement_rate' the share of compared messages where the local
+                guess matched the LLM.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        hits = stats["rule_hits"] + stats["model_hits"]
+        stats["hit_rate"] = round(hits / stats["total"], 4) if stats["total"] else 0.0
+        stats["agreement_rate"] = round(stats["agreements"] / stats["compared"], 4) if stats["compared"] else None
+        return stats
+
+
+_intent_classifier = None
+_intent_classifier_lock = threading.Lock()
+
+def get_intent_classifier() -> IntentPreClassifier:
+    """
+    Returns the process-wide pre-classifier, building it on first use.
+
+    Optional secrets INTENT_CONFIDENCE_THRESHOLD and INTENT_SHADOW_RATE tune it;
+    logged traffic comes from the 'intentLog' collection when MongoDB is reachable.
+
+    Returns:
+        IntentPreClassifier: The shared classifier.
+    """
+    global _intent_classifier
+    with _intent_classifier_lock:
+        if _intent_classifier is None:
+            import streamlit as st
+            from data.DataBaseManager import DatabaseManager
+            try:
+                threshold = float(st.secrets.get("INTENT_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD))
+                shadow_rate = float(st.secrets.get("INTENT_SHADOW_RATE", 0.0))
+            except Exception:
+                threshold, shadow_rate = DEFAULT_CONFIDENCE_THRESHOLD, 0.0
+            try:
+                collection = DatabaseManager().get_collection("intentLog")
+                collection.create_index("timestamp")
+            except Exception as e:
+                print(f"Intent log unavailable, using seed examples only: {e}")
+                collection = None
+            _intent_classifier = IntentPreClassifier(threshold, collection, shadow_rate)
+    return _intent_classifier
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+
+def make_cache_key(model: str, temperature: float, messages) -> str:
+    """
+    Builds the content address of an LLM request.
+
+    Args:
+        model (str): Model name.
+        temperature (float): Sampling temperature.
+        messages (str | list): Plain prompt or list of LangChain messages.
+
+    Returns:
+        str: Hex sha256 of the model, temperature and messages.
+    """
+    if isinstance(messages, str):
+        payload = messages
+    else:
+        payload = [[getattr(m, "type", "text"), getattr(m, "content", m)] for m in messages]
+    raw = json.dumps([model, round(float(temperature or 0.0), 6), payload], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Content-addressed cache for deterministic (temperature 0) LLM responses.
+
+    - Memory tier: an LRU of at most max_entries responses.
+    - Persistent tier (optional): a MongoDB collection shared by every
+      process, with a TTL index so MongoDB removes expired entries itself.
+      Hits there are copied into the memory tier.
+
+    Attributes:
+        max_entries (int): Size of the in-memory LRU.
+        ttl_seconds (float): Lifetime of a cached response in both tiers.
+        collection (pymongo collection): Optional 'llmCache' collection.
+        stats (dict): Counters for memory hits, persistent hits, misses and evictions.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS, collection=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if collection is not None:
+            try:
+                collection.create_index("expires_at", expireAfterSeconds=0)
+            except Exception as e:
+                print(f"Error creating llmCache TTL index: {e}")
+
+    def get(self, key: str):
+        """
+        Looks a response up in memory, then in the persistent tier.
+
+        Args:
+            key (str): Key from make_cache_key.
+
+        Returns:
+            str or None: The cached response, or None on a miss.
+        """
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        value = self._get_persistent(key)
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["persistent_hits"] += 1
+        self._set_memory(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        """
+        Stores a response in both tiers.
+
+        Args:
+            key (str): Key from make_cache_key.
+            value (str): The LLM response content.
+        """
+        self._set_memory(key, value)
+        self._set_persistent(key, value)
+
+    async def aget(self, key: str):
+        """Async version of get; the persistent lookup runs in a worker thread."""
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        value = await asyncio.to_thread(self._get_persistent, key) if self.collection is not None else None
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["persistent_hits"] += 1
+        self._set_memory(key, value)
+        return value
+
+    async def aset(self, key: str, value: str):
+        """Async version of set; the persistent write runs in a worker thread."""
+        self._set_memory(key, value)
+        if self.collection is not None:
+            await asyncio.to_thread(self._set_persistent, key, value)
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return value
+
+    def _set_memory(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _get_persistent(self, key):
+        if self.collection is None:
+            return None
+        try:
+            # The TTL monitor runs once a minute, so expiry is also checked here
+            doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        except Exception as e:
+            print(f"Error reading llmCache: {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+            return None
+        return doc["response"] if doc else None
+
+    def _set_persistent(self, key, value):
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {"_id": key},
+                {"$set": {
+                    "response": value,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Error writing llmCache: {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+
+    def clear(self):
+        """Drops every in-memory entry. The persistent tier is left untouched."""
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        """
+        Returns the counters plus the overall hit rate and current size.
+
+        Returns:
+            dict: Counters with 'hit_rate' and 'size' added.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    """
+    Returns the process-wide LLM cache, building it on first use.
+
+    Optional secrets LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS and
+    LLM_CACHE_PERSISTENT (default true) configure it; the persistent tier is
+    the 'llmCache' collection and is skipped if MongoDB is unavailable.
+
+    Returns:
+        LLMCache: The shared cache.
+    """
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            import streamlit as st
+            from data.DataBaseManager import DatabaseManager
+            try:
+                max_entries = int(st.secrets.get("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+                ttl_seconds = float(st.secrets.get("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+                persistent = str(st.secrets.get("LLM_CACHE_PERSISTENT", "true")).lower() == "true"
+            except Exception:
+                max_entries, ttl_seconds, persistent = DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, False
+            collection = None
+            if persistent:
+                try:
+                    collection = DatabaseManager().get_collection("llmCache")
+                except Exception as e:
+                    print(f"LLM cache persistent tier unavailable: {e}")
+            _llm_cache = LLMCache(max_entries, ttl_seconds, collection)
+    return _llm_cache
@@ -1,22 +1,260 @@
+import asyncio
 import os
 import json
+import threading
+import time
 from datetime import datetime
 from typing import List, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from app.Tracing import requests_response_hook
+from app.Utilities import get_async_http_client
+
+NHS_API_URL = "https://689c738058a27b18087e39e2.mockapi.io/mock_nhs_api/v1/patients"
+RECORD_TTL_SECONDS = 300
+RECORD_STALE_SECONDS = 900
+REQUEST_TIMEOUT_SECONDS = 10
+
+class MedicalRecordCache:
+    """
+    Process-wide cache of patient records fetched from the mock NHS API.
+
+    - Fresh entries (younger than ttl_seconds) are served from memory.
+    - Expired entries within stale_seconds are served immediately while a
+      background request revalidates them (stale-while-revalidate).
+    - Revalidation is conditional (If-None-Match / If-Modified-Since), so an
+      unchanged record costs a 304 with no body.
+    - Concurrent misses for the same patient share a single request.
+
+    Attributes:
+        ttl_seconds (float): Time an entry is considered fresh.
+        stale_seconds (float): Extra time an expired entry may still be served.
+        session (requests.Session): Keep-alive session reused for every request.
+        async_client (httpx.AsyncClient): Client for aget; defaults to the loop's shared client.
+        stats (dict): Counters for hits, misses, stale hits, revalidations and errors.
+    """
+    def __init__(self, ttl_seconds: float = RECORD_TTL_SECONDS, stale_seconds: float = RECORD_STALE_SECONDS,
+                 session: Optional[requests.Session] = None, async_client=None):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.session = session or self._build_session()
+        self.async_client = async_client
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "not_modified": 0, "errors": 0}
+        self._entries = {}
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build_session() -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(requests_response_hook)
+        return session
+
+    def get(self, api_url: str, patient_id: str, force_refresh: bool = False) -> Optional[dict]:
+        """
+        Returns the record for a patient, fetching it only when needed.
+
+        Args:
+            api_url (str): Base URL of the patients endpoint.
+            patient_id (str): The patient ID used as cache key.
+            force_refresh (bool): Skip the fresh/stale checks and revalidate now.
+
+        Returns:
+            dict: The patient record, or None if not found or on error with no cached copy.
+        """
+        key = (api_url, patient_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            state = self._freshness(entry, force_refresh)
+            if state == "fresh":
+                return entry["record"]
+            if state == "stale":
+                if key not in self._inflight:
+                    self._inflight[key] = threading.Event()
+                    threading.Thread(target=self._refresh, args=(key,), daemon=True).start()
+                return entry["record"]
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+                self.stats["misses"] += 1
+        if leader:
+            self._refresh(key)
+        else:
+            event.wait(REQUEST_TIMEOUT_SECONDS)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["record"] if entry else None
+
+    async def aget(self, api_url: str, patient_id: str, force_refresh: bool = False) -> Optional[dict]:
+        """
+        Async version of get, fetching through the loop's shared httpx.AsyncClient.
+        Concurrent coroutines missing the same patient await a single task.
+
+        Args:
+            api_url (str): Base URL of the patients endpoint.
+            patient_id (str): The patient ID used as cache key.
+            force_refresh (bool): Skip the fresh/stale checks and revalidate now.
+
+        Returns:
+            dict: The patient record, or None if not found or on error with no cached copy.
+        """
+        key = (api_url, patient_id)
+        flight_key = (key, asyncio.get_running_loop())
+        with self._lock:
+            entry = self._entries.get(key)
+            state = self._freshness(entry, force_refresh)
+            if state == "fresh":
+                return entry["record"]
+            if state == "stale":
+                if flight_key not in self._async_inflight:
+                    self._async_inflight[flight_key] = asyncio.ensure_future(self._arefresh(key, flight_key))
+                return entry["record"]
+            flight = self._async_inflight.get(flight_key)
+            if flight is None:
+                flight = asyncio.ensure_future(self._arefresh(key, flight_key))
+                self._async_inflight[flight_key] = flight
+                self.stats["misses"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(flight), REQUEST_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["record"] if entry else None
+
+    def _freshness(self, entry, force_refresh):
+        """
+        Classifies a cached entry and counts the hit. Must hold self._lock.
+
+        Returns:
+            str or None: "fresh", "stale", or None when the entry must be fetched.
+        """
+        if not entry or force_refresh:
+            return None
+        age = time.monotonic() - entry["fetched_at"]
+        if age < self.ttl_seconds:
+            self.stats["hits"] += 1
+            return "fresh"
+        if age < self.ttl_seconds + self.stale_seconds:
+            self.stats["stale_hits"] += 1
+            return "stale"
+        return None
+
+    def _refresh(self, key):
+        """
+        Fetches (or revalidates) one entry and wakes up any waiting callers.
+        On error the previous entry, if any, is kept.
+        """
+        api_url, patient_id = key
+        try:
+            with self._lock:
+                entry = self._entries.get(key)
+            response = self.session.get(api_url, params={"patient_id": patient_id},
+                                        headers=self._conditional_headers(entry), timeout=REQUEST_TIMEOUT_SECONDS)
+            if response.status_code != 304:
+                response.raise_for_status()
+            self._store(key, entry, response.status_code, response.headers,
+                        None if response.status_code == 304 else response.json())
+        except Exception as e:
+            print(f"Error loading medical record from NHS MockAPI: {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            with self._lock:
+                event = self._inflight.pop(key, None)
+            if event:
+                event.set()
+
+    async def _arefresh(self, key, flight_key):
+        """
+        Async version of _refresh using the loop's shared httpx.AsyncClient.
+        """
+        api_url, patient_id = key
+        try:
+            with self._lock:
+                entry = self._entries.get(key)
+            client = self.async_client or get_async_http_client()
+            response = await client.get(api_url, params={"patient_id": patient_id},
+                                        headers=self._conditional_headers(entry), timeout=REQUEST_TIMEOUT_SECONDS)
+            if response.status_code != 304:
+                response.raise_for_status()
+            self._store(key, entry, response.status_code, response.headers,
+                        None if response.status_code == 304 else response.json())
+        except Exception as e:
+            print(f"Error loading medical record from NHS MockAPI: {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._async_inflight.pop(flight_key, None)
+
+    @staticmethod
+    def _conditional_headers(entry) -> dict:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _store(self, key, entry, status_code, headers, data):
+        """
+        Stores a fetched record, or just renews the entry on a 304.
+        """
+        with self._lock:
+            if status_code == 304 and entry:
+                entry["fetched_at"] = time.monotonic()
+                self.stats["not_modified"] += 1
+                return
+        if not data:
+            print(f"No medical history found for user '{key[1]}' in API")
+        with self._lock:
+            self._entries[key] = {
+                "record": data[0] if data else None,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "fetched_at": time.monotonic(),
+            }
+
+    def invalidate(self, patient_id: str):
+        """Drops every cached entry for a patient."""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == patient_id]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drops every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every MedicalRecordManager in the process
+record_cache = MedicalRecordCache()
 
 class MedicalRecordManager:
     """
     Class for managing and accessing a patient's medical record from a mock NHS API.
 
+    Records are served through the shared `record_cache`, so creating a manager
+    is a memory lookup unless the cached record has expired. The returned
+    record is shared between callers and must be treated as read-only.
+
     Attributes:
         username (str): The patient ID or username used to fetch the record.
         api_url (str): Base URL of the mock NHS API.
         record (dict): Loaded medical record for the patient.
 
     Methods:
-        load_record() -> dict:
-            Fetches the patient's medical record from the API.
+        load_record(force_refresh=False) -> dict:
+            Fetches the patient's medical record from the cache or the API.
             Returns the record as a dictionary, or None if not found or on error.
         
         get_patient_info() -> dict:
@@ -28,23 +266,31 @@ class MedicalRecordManager:
             - phone
             - location
     """
-    def __init__(self, username: str):
+    def __init__(self, username: str, load: bool = True):
         self.username = username
-        self.api_url = "https://689c738058a27b18087e39e2.mockapi.io/mock_nhs_api/v1/patients"
-        self.record = self.load_record()
+        self.api_url = NHS_API_URL
+        self.record = self.load_record() if load else None
 
-    def load_record(self) -> dict:
-        try:
-            response = requests.get(f"{self.api_url}?patient_id={self.username}")
-            response.raise_for_status()
-            data = response.json()
-            if not data:
-                print(f"No medical history found for user '{self.username}' in API")
-                return None
-            return data[0]
-        except Exception as e:
-            print(f"Error loading medical record from NHS MockAPI: {e}")
-            return None
+    @classmethod
+    async def acreate(cls, username: str) -> "MedicalRecordManager":
+        """
+        Builds a manager without blocking the event loop.
+
+        Args:
+            username (str): The patient ID.
+
+        Returns:
+            MedicalRecordManager: Manager with its record loaded through record_cache.aget.
+        """
+        manager = cls(username, load=False)
+        manager.record = await manager.aload_record()
+        return manager
+
+    def load_record(self, force_refresh: bool = False) -> dict:
+        return record_cache.get(self.api_url, self.username, force_refresh=force_refresh)
+
+    async def aload_record(self, force_refresh: bool = False) -> dict:
+        return await record_cache.aget(self.api_url, self.username, force_refresh=force_refresh)
  
     def get_patient_info(self) -> dict:
         return {
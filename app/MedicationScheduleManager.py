@@ -2,18 +2,26 @@ from datetime import datetime, timedelta
 import json
 import os
 from datetime import datetime, timedelta, time
-from uuid import uuid4
 from zoneinfo import ZoneInfo
 from app.MedicalRecordManager import MedicalRecordManager
-from data.DataBaseManager import DatabaseManager
+from app.RecurrenceRule import (
+    build_rule, changed_rows, expand_tracker, occurrence_update, rule_window_query, write_status_changes
+)
+from app.Utilities import backfill_due_at, notify_tracker_change
+from data.DataBaseManager import AsyncDatabaseManager, DatabaseManager
+from data.TrackerRepository import TrackerRepository
 
 class MedicationScheduleManager:
     """
     Manages a patient's medication schedule, including tracking doses,
     checking pending medications, marking them as taken, and creating
     trackers from medical history.
-    """
 
+    Each medication is stored as one recurrence rule (see app.RecurrenceRule)
+    whose doses are expanded when read; taken doses are kept in the rule's
+    'done' set. Trackers created before rules (one document per dose) are
+    still read and updated.
+    """
     def __init__(self, user_id):
         """
         Initialize the manager for a specific user.
@@ -24,16 +32,76 @@ class MedicationScheduleManager:
         self.user_id = user_id
         db_manager = DatabaseManager()
         self.collection = db_manager.get_collection("medicationTracker")
+        self.repository = TrackerRepository("medicationTracker", self.collection)
+
+    @staticmethod
+    def ensure_indexes():
+        """
+        Creates the (patient_id, taken, due_at) index used by reminder window
+        queries on per-dose documents and the (patient_id, kind, end_at) index
+        used to find the rules active in a window, and backfills 'due_at' on
+        older documents. Run at startup
+        through app.DatabaseSetup, never from a chat turn.
+        """
+        collection = DatabaseManager().get_collection("medicationTracker")
+        collection.create_index([("patient_id", 1), ("taken", 1), ("due_at", 1)])
+        collection.create_index([("patient_id", 1), ("kind", 1), ("end_at", 1)])
+        backfill_due_at(collection)
+
+    @property
+    def acollection(self):
+        """Async handle on the tracker collection; only usable inside a coroutine."""
+        return AsyncDatabaseManager().get_collection("medicationTracker")
 
-    def load_tracker(self):
+    def load_tracker(self, view="page"):
         """
         Load all medication tracking records for the user.
 
+        Args:
+            view (str): 'page' for whole rows or 'prompt' for the fields the
+                medication prompts use (see data.TrackerRepository).
+
         Returns:
-            list: A list of medication tracker documents.
+            list[MedicationDose]: A list of medication tracker documents, one per dose.
+        """
+        return expand_tracker(self.repository.find({"patient_id": self.user_id}, view), "taken")
+
+    async def aload_tracker(self, view="page"):
+        """Async version of load_tracker."""
+        return expand_tracker(await self.repository.afind({"patient_id": self.user_id}, view), "taken")
+
+    def find_due(self, start, end):
         """
-        docs = list(self.collection.find({"patient_id": self.user_id}))
-        return docs
+        Load the untaken doses due between two instants using the due_at index.
+
+        Args:
+            start (datetime): Timezone-aware start of the window.
+            end (datetime): Timezone-aware end of the window.
+
+        Returns:
+            list[MedicationDose]: Doses sorted by due time, with the reminder view's fields only.
+        """
+        docs = self.repository.find(self._due_query(start, end), "reminder")
+        docs += self.repository.find(rule_window_query(self.user_id, start, end), "reminder")
+        return self._due_doses(docs, start, end)
+
+    async def afind_due(self, start, end):
+        """Async version of find_due."""
+        docs = await self.repository.afind(self._due_query(start, end), "reminder")
+        docs += await self.repository.afind(rule_window_query(self.user_id, start, end), "reminder")
+        return self._due_doses(docs, start, end)
+
+    @staticmethod
+    def _due_doses(docs, start, end):
+        doses = [dose for dose in expand_tracker(docs, "taken", start, end) if not dose.get("taken")]
+        return sorted(doses, key=lambda dose: dose["due_at"])
+
+    def _due_query(self, start, end):
+        return {
+            "patient_id": self.user_id,
+            "taken": {"$ne": True},
+            "due_at": {"$gte": start, "$lte": end},
+        }
     
     def check_pending_medications(self, window_minutes=30):
         """
@@ -50,19 +118,19 @@ class MedicationScheduleManager:
         now = datetime.now(zn)
         start = now - timedelta(minutes=window_minutes)
         end = now + timedelta(minutes=window_minutes)
-        tracker = self.load_tracker()
-        upcoming = []
-        for med in tracker:
-            if med.get("taken"):
-                continue
-            dt_str = f"{med['date']} {med['time']}"
-            try:
-                dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M").replace(tzinfo=zn)
-                if start <= dt <= end:
-                    upcoming.append(f"- 💊 {med['med_name']} ({med['dose']}) - {med['time']}")
-            except:
-                continue
-        return upcoming
+        return [self._format_pending(med) for med in self.find_due(start, end)]
+
+    async def acheck_pending_medications(self, window_minutes=30):
+        """Async version of check_pending_medications."""
+        zn = ZoneInfo("Europe/London")
+        now = datetime.now(zn)
+        start = now - timedelta(minutes=window_minutes)
+        end = now + timedelta(minutes=window_minutes)
+        return [self._format_pending(med) for med in await self.afind_due(start, end)]
+
+    @staticmethod
+    def _format_pending(med):
+        return f"- 💊 {med['med_name']} ({med['dose']}) - {med['time']}"
     
     def mark_medication_as_taken(self, user_input: str):
         """
@@ -79,17 +147,8 @@ class MedicationScheduleManager:
         now = datetime.now(zn)
         today_str = now.strftime("%Y-%m-%d")
         window_minutes = 30
-        tracker = self.load_tracker()
-        meds_today = []
-        for med in tracker:
-            if med.get("date") != today_str or med.get("taken"):
-                continue
-            try:
-                med_time = datetime.strptime(f"{med['date']} {med['time']}", "%Y-%m-%d %H:%M").replace(tzinfo=zn)
-            except:
-                continue
-            if abs((med_time - now).total_seconds()) <= window_minutes * 60:
-                meds_today.append(med)
+        window = timedelta(minutes=window_minutes)
+        meds_today = [med for med in self.find_due(now - window, now + window) if med.get("date") == today_str]
         if not meds_today:
             return None, None
         user_input_lower = user_input.lower()
@@ -98,19 +157,37 @@ class MedicationScheduleManager:
                 if med.get("taken"):
                     return None, True
                 # Marcar como tomada
-                self.collection.update_one(
-                    {"id": med["id"]},
-                    {"$set": {"taken": True}}
-                )
+                self.collection.update_one(*occurrence_update(med["id"], "taken", True))
+                notify_tracker_change(self.user_id)
+                return med["med_name"], False
+        return None, False
+
+    async def amark_medication_as_taken(self, user_input: str):
+        """Async version of mark_medication_as_taken."""
+        zn = ZoneInfo("Europe/London")
+        now = datetime.now(zn)
+        today_str = now.strftime("%Y-%m-%d")
+        window = timedelta(minutes=30)
+        meds_today = [med for med in await self.afind_due(now - window, now + window) if med.get("date") == today_str]
+        if not meds_today:
+            return None, None
+        user_input_lower = user_input.lower()
+        for med in meds_today:
+            if med["med_name"].lower() in user_input_lower:
+                if med.get("taken"):
+                    return None, True
+                await self.acollection.update_one(*occurrence_update(med["id"], "taken", True))
+                notify_tracker_change(self.user_id)
                 return med["med_name"], False
         return None, False
     
     def create_tracker_from_history(self):
         """
-        Generate a medication tracker from the patient's medical history.
+        Generate a medication tracker from the patient's medical history,
+        stored as one recurrence rule per medication.
 
         Returns:
-            list: List of created medication tracker documents.
+            list: List of created medication tracker documents, one per dose.
         """
         zn = ZoneInfo("Europe/London")
         medicalRecordManager = MedicalRecordManager(self.user_id)
@@ -120,7 +197,7 @@ class MedicationScheduleManager:
             return []
         surgery_date_str = history_data.get("surgery_date", None)
         now = datetime.now(zn)
-        start_date = datetime.strptime(surgery_date_str, "%Y-%m-%d").replace(zn) if surgery_date_str else now     
+        start_date = datetime.strptime(surgery_date_str, "%Y-%m-%d").replace(tzinfo=zn) if surgery_date_str else now     
         frequency_schedule = {
             "6x/day": [time(6, 0), time(10, 0), time(14, 0), time(18, 0), time(22, 0), time(2, 0)],
             "5x/day": [time(7, 0), time(11, 0), time(15, 0), time(19, 0), time(23, 0)],
@@ -129,30 +206,23 @@ class MedicationScheduleManager:
             "2x/day": [time(9, 0), time(21, 0)],
             "1x/day": [time(9, 0)],
         }
-        tracker_docs = []
+        rules = []
         for med in history_data.get("medications", []):
             duration_str = med.get("duration", "7 days")
             days = int(duration_str.split()[0])
             freq = med.get("frequency", "").lower()
             scheduled_times = frequency_schedule.get(freq, [time(9,0)])
-            for day_offset in range(days):
-                day_date = start_date + timedelta(days=day_offset)
-                day_str = day_date.strftime("%Y-%m-%d").replace(tzinfo=zn)
-                for t in scheduled_times:
-                    time_str = t.strftime("%H:%M").replace(tzinfo=zn)
-                    tracker_docs.append({
-                         "id": str(uuid4()), 
-                        "patient_id": self.user_id,
-                        "date": day_str,
-                        "time": time_str,
-                        "med_name": med.get("name"),
-                        "dose": med.get("dose"),
-                        "frequency": med.get("frequency"),
-                        "taken": False
-                    })
-        if tracker_docs:
-            self.collection.insert_many(tracker_docs)
-        return tracker_docs
+            rules.append(build_rule(
+                self.user_id,
+                start_date.strftime("%Y-%m-%d"),
+                [t.strftime("%H:%M") for t in scheduled_times],
+                days,
+                {"med_name": med.get("name"), "dose": med.get("dose"), "frequency": med.get("frequency")},
+            ))
+        if rules:
+            self.collection.insert_many(rules)
+            notify_tracker_change(self.user_id)
+        return expand_tracker(rules, "taken")
         
     def return_medication_info(self):
         """
@@ -167,18 +237,21 @@ class MedicationScheduleManager:
         else:
             return self.create_tracker_from_history()
 
-    def update_taken_status(self, updated_records):
+    def update_taken_status(self, updated_records, original_records=None):
         """
         Update the 'taken' status of medications in the database.
 
         Args:
             updated_records (list): List of medication records with updated 'taken' status.
+            original_records (list, optional): The records as loaded; when given,
+                only the records whose status changed are written.
+
+        Returns:
+            dict: 'changed', 'modified' and 'latency_ms' of the single bulk write.
         """
-        for record in updated_records:
-            record_id = record.get("_id") or record.get("id")  # usar lo que tengas
-            if record_id is None:                
-                continue  # si no hay id, no actualizamos
-            self.collection.update_one(
-                {"id": record_id},  # filtro por _id
-                {"$set": {"taken": record["taken"]}}
-            )
\ No newline at end of file
+        if original_records is not None:
+            updated_records = changed_rows(original_records, updated_records, "taken")
+        result = write_status_changes(self.collection, updated_records, "taken")
+        if result["changed"]:
+            notify_tracker_change(self.user_id)
+        return result
@@ -0,0 +1,376 @@
+import argparse
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from urllib.parse import unquote
+
+NHS_BASE_URL = "https://www.nhs.uk"
+NHS_RECOVERY_KEYWORDS = ["recovery", "recover", "complication", "complicate", "problem", "issue", "risk"]
+DEFAULT_INDEX_PATH = os.path.join("data", "nhs_guidance_index.json.gz")
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for", "from", "has", "have",
+    "i", "if", "in", "into", "is", "it", "its", "may", "me", "my", "not", "of", "on", "or", "so",
+    "that", "the", "their", "there", "these", "this", "to", "was", "will", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercases text and returns its words without stopwords. A trailing 's'
+    is dropped from longer words so "knees" and "knee" match.
+
+    Args:
+        text (str): Passage or query text.
+
+    Returns:
+        list[str]: Index terms.
+    """
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text: str, max_words: int = 120, overlap: int = 20) -> list:
+    """
+    Splits page text into passages of about max_words words. Lines (the page's
+    paragraphs, list items and headings) are kept whole where possible, and
+    consecutive passages share `overlap` words so sentences at a boundary are
+    found from either side.
+
+    Args:
+        text (str): Page text, one block per line.
+        max_words (int): Target passage length.
+        overlap (int): Words repeated from the end of the previous passage.
+
+    Returns:
+        list[str]: Passages in page order.
+    """
+    passages, current = [], []
+    for line in (l.strip() for l in text.splitlines()):
+        if not line:
+            continue
+        words = line.split()
+        if current and len(current) + len(words) > max_words:
+            passages.append(" ".join(current))
+            current = current[-overlap:] if overlap else []
+        current.extend(words)
+        while len(current) > max_words * 2:
+            passages.append(" ".join(current[:max_words]))
+            current = current[max_words - overlap:]
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def parse_nhs_links(html: str, n: int = 2) -> list:
+    """
+    Picks the top recovery/complication guideline links from an NHS search page.
+
+    Args:
+        html (str): nhs.uk search results page.
+        n (int): Maximum number of links.
+
+    Returns:
+        list[str]: Absolute guideline URLs.
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("a", class_="app-search-results-item"))
+    urls = []
+    for a in soup.select("a.app-search-results-item"):
+        href = a.get("href")
+        if not href:
+            continue
+        # Extract final URL if it's a tracking link
+        match = re.search(r"url=([^&]+)", href)
+        if match:
+            clean_path = unquote(match.group(1))
+            if "/tests-and-treatments/" not in clean_path:
+                continue
+            if any(kw in clean_path.lower() for kw in NHS_RECOVERY_KEYWORDS):
+                urls.append(NHS_BASE_URL + clean_path)
+        if len(urls) >= n:
+            break
+    return urls
+
+
+def parse_page_text(html: str) -> str:
+    """
+    Extracts the article paragraphs, list items and headings from an NHS page.
+    Only the <article> subtree is built, which skips the header, navigation
+    and footer that make up most of the page.
+
+    Args:
+        html (str): nhs.uk article page.
+
+    Returns:
+        str: One text block per line.
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("article"))
+    return "\n".join(p.get_text(" ", strip=True) for p in soup.select("article p, article li, article h2"))
+
+
+def parse_page_title(html: str) -> str:
+    from bs4 import BeautifulSoup
+    heading = BeautifulSoup(html, HTML_PARSER).select_one("h1, title")
+    return heading.get_text(" ", strip=True) if heading else ""
+
+
+class NHSGuidanceIndex:
+    """
+    BM25 inverted index over chunked NHS guidance passages.
+
+    Pages are ingested offline (see ingest_urls / ingest_directory and the
+    command line below) and saved as one gzipped JSON file. At query time the
+    recommendation agent retrieves the passages most relevant to the
+    patient's surgery and symptoms instead of scraping nhs.uk.
+
+    Attributes:
+        passages (list[dict]): {"url", "title", "text"} per passage.
+        postings (dict): term -> list of [passage index, term frequency].
+        lengths (list[int]): Number of terms in each passage.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 length normalisation.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages = []
+        self.postings = defaultdict(list)
+        self.lengths = []
+
+    def add_page(self, url: str, title: str, text: str, max_words: int = 120):
+        """
+        Chunks a page and indexes its passages. The title is indexed with
+        every passage so it counts towards matches on the page topic.
+
+        Args:
+            url (str): Source page.
+            title (str): Page title.
+            text (str): Page text, one block per line.
+            max_words (int): Passage length.
+
+        Returns:
+            int: Number of passages added.
+        """
+        passages = chunk_text(text, max_words)
+        for passage in passages:
+            index = len(self.passages)
+            terms = tokenize(f"{title} {passage}")
+            self.passages.append({"url": url, "title": title, "text": passage})
+            self.lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                self.postings[term].append([index, freq])
+        return len(passages)
+
+    def search(self, query: str, k: int = 5) -> list:
+        """
+        Ranks passages against a query with BM25.
+
+        Args:
+            query (str): Free text, e.g. the surgery plus reported symptoms.
+            k (int): Number of passages to return.
+
+        Returns:
+            list[tuple]: (score, passage dict), best first.
+        """
+        if not self.passages:
+            return []
+        count = len(self.passages)
+        avg_length = sum(self.lengths) / count
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / avg_length)
+                scores[index] += idf * freq * (self.k1 + 1) / (freq + norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(round(score, 4), self.passages[index]) for index, score in best]
+
+    def context_for(self, query: str, k: int = 5, max_chars: int = 4000) -> str:
+        """
+        Formats the top passages for a prompt, stopping at max_chars.
+
+        Args:
+            query (str): Free text query.
+            k (int): Maximum number of passages.
+            max_chars (int): Size budget for the returned text.
+
+        Returns:
+            str: Passages with their source, or "" if nothing matched.
+        """
+        blocks, used = [], 0
+        for _, passage in self.search(query, k):
+            block = f"[{passage['title']}]({passage['url']})\n{passage['text']}"
+            if used + len(block) > max_chars:
+                if not blocks:
+                    # Better a cut best passage than no guidance at all
+                    blocks.append(block[:max_chars])
+                break
+            blocks.append(block)
+            used += len(block) + 2
+        return "\n\n".join(blocks)
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        """Writes the index to a gzipped JSON file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({
+                "k1": self.k1, "b": self.b, "passages": self.passages,
+                "postings": self.postings, "lengths": self.lengths,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH):
+        """
+        Reads an index written by save.
+
+        Returns:
+            NHSGuidanceIndex: The loaded index.
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.passages = data["passages"]
+        index.postings = defaultdict(list, data["postings"])
+        index.lengths = data["lengths"]
+        return index
+
+    def ingest_directory(self, directory: str) -> int:
+        """
+        Indexes saved NHS article pages (*.html) from a directory. A page's URL
+        is read from its canonical link, or derived from the file name.
+
+        Args:
+            directory (str): Folder with the saved pages.
+
+        Returns:
+            int: Number of passages added.
+        """
+        from bs4 import BeautifulSoup
+        added = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".html"):
+                continue
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                html = f.read()
+            canonical = BeautifulSoup(html, HTML_PARSER).select_one("link[rel=canonical]")
+            url = canonical["href"] if canonical else f"{NHS_BASE_URL}/{name[:-5]}/"
+            added += self.add_page(url, parse_page_title(html), parse_page_text(html))
+        return added
+
+    def ingest_urls(self, urls: list) -> int:
+        """
+        Downloads and indexes NHS article pages.
+
+        Args:
+            urls (list[str]): Page URLs.
+
+        Returns:
+            int: Number of passages added.
+        """
+        import requests
+        added = 0
+        with requests.Session() as session:
+            for url in urls:
+                try:
+                    html = session.get(url, timeout=15).text
+                except Exception as e:
+                    print(f"Error retrieving {url}: {e}")
+                    continue
+                added += self.add_page(url, parse_page_title(html), parse_page_text(html))
+        return added
+
+
+def search_guideline_urls(surgeries: list, pages_per_surgery: int = 3) -> list:
+    """
+    Finds the recovery/complication guideline pages for each surgery on nhs.uk.
+
+    Args:
+        surgeries (list[str]): Surgery names, e.g. "knee replacement".
+        pages_per_surgery (int): Links kept per search.
+
+    Returns:
+        list[str]: Unique page URLs.
+    """
+    import requests
+    urls = []
+    for surgery in surgeries:
+        query = "+".join(surgery.lower().split())
+        try:
+            html = requests.get(f"{NHS_BASE_URL}/search/results?q={query}", timeout=15).text
+        except Exception as e:
+            print(f"Error searching NHS guidance for {surgery}: {e}")
+            continue
+        urls.extend(u for u in parse_nhs_links(html, pages_per_surgery) if u not in urls)
+    return urls
+
+
+_nhs_index = None
+_nhs_index_loaded = False
+_nhs_index_lock = threading.Lock()
+
+def get_nhs_index():
+    """
+    Returns the process-wide guidance index, loading it on first use from the
+    NHS_INDEX_PATH secret (default data/nhs_guidance_index.json.gz).
+
+    Returns:
+        NHSGuidanceIndex or None: None if no index has been built.
+    """
+    global _nhs_index, _nhs_index_loaded
+    with _nhs_index_lock:
+        if not _nhs_index_loaded:
+            _nhs_index_loaded = True
+            try:
+                import streamlit as st
+                path = st.secrets.get("NHS_INDEX_PATH", DEFAULT_INDEX_PATH)
+            except Exception:
+                path = DEFAULT_INDEX_PATH
+            if os.path.exists(path):
+                try:
+                    _nhs_index = NHSGuidanceIndex.load(path)
+                except Exception as e:
+                    print(f"Error loading NHS guidance index: {e}")
+    return _nhs_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the local NHS guidance index.")
+    parser.add_argument("--surgery", action="append", default=[], help="Surgery to search on nhs.uk (repeatable).")
+    parser.add_argument("--url", action="append", default=[], help="NHS page to index (repeatable).")
+    parser.add_argument("--from-dir", help="Index saved *.html pages from this folder instead of downloading.")
+    parser.add_argument("--pages-per-surgery", type=int, default=3)
+    parser.add_argument("--out", default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args(argv)
+
+    index = NHSGuidanceIndex()
+    if args.from_dir:
+        index.ingest_directory(args.from_dir)
+    urls = list(args.url) + search_guideline_urls(args.surgery, args.pages_per_surgery)
+    if urls:
+        index.ingest_urls(urls)
+    index.save(args.out)
+    print(f"Indexed {len(index.passages)} passages from {len({p['url'] for p in index.passages})} pages into {args.out}")
+
+
+if __name__ == "__main__":
+    # python -m app.NHSGuidanceIndex --surgery "knee replacement" --surgery "hip replacement"
+    main()
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.Tracing import requests_response_hook
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "naia_nhs_cache")
+DEFAULT_TTL = 24 * 3600
+REQUEST_TIMEOUT = (3.05, 10)
+
+def freshness_lifetime(headers, default_ttl: int = DEFAULT_TTL):
+    """
+    Works out how long a response may be served from cache.
+
+    Args:
+        headers (Mapping): Response headers (case-insensitive).
+        default_ttl (int): Seconds used when the server sends no freshness
+            information.
+
+    Returns:
+        int or None: Seconds the response stays fresh (0 means revalidate on
+        every use), or None if it must not be stored.
+    """
+    cache_control = (headers.get("Cache-Control") or "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    match = re.search(r"(?:s-maxage|max-age)=(\d+)", cache_control)
+    if match:
+        return max(0, int(match.group(1)) - int(headers.get("Age") or 0))
+    if headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            return max(0, int(expires - time.time()))
+        except (TypeError, ValueError):
+            return 0
+    return default_ttl
+
+
+class NHSPageFetcher:
+    """
+    Fetches nhs.uk pages for the live guidance fallback.
+
+    - One keep-alive requests.Session (and, for async callers, the loop's
+      shared httpx client) with connect/read timeouts.
+    - Pages are kept in an on-disk cache. Fresh entries (Cache-Control
+      max-age / Expires) are served without a request; stale entries are
+      revalidated with If-None-Match / If-Modified-Since, so an unchanged
+      page costs a 304 instead of a download.
+    - fetch_many/afetch_many download several pages concurrently.
+
+    Attributes:
+        cache_dir (str): Folder for cached pages, None to disable the cache.
+        session (requests.Session): Shared session.
+        default_ttl (int): Freshness used when the server gives none.
+        workers (int): Threads used by fetch_many.
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, session=None, default_ttl: int = DEFAULT_TTL,
+                 timeout=REQUEST_TIMEOUT, workers: int = 4):
+        self.cache_dir = cache_dir
+        self.default_ttl = default_ttl
+        self.timeout = timeout
+        self.workers = workers
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.hooks["response"].append(requests_response_hook)
+        self.session = session
+        self.stats = {"hits": 0, "revalidated": 0, "downloads": 0, "stale": 0}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, url: str) -> str:
+        """
+        Returns the page HTML, from cache when it is still fresh.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            str: Response body.
+
+        Raises:
+            requests.RequestException: If the page cannot be fetched and
+                nothing is cached for it.
+        """
+        entry = self._read(url)
+        if entry and entry["expires"] > time.time():
+            self._count("hits")
+            return entry["body"]
+        try:
+            resp = self.session.get(url, headers=self._conditional_headers(entry), timeout=self.timeout)
+            if resp.status_code != 304:
+                resp.raise_for_status()
+        except requests.RequestException as e:
+            return self._fallback(url, entry, e)
+        return self._handle(url, entry, resp.status_code, resp.headers, resp.text)
+
+    async def afetch(self, url: str) -> str:
+        """
+        Async version of fetch using the event loop's shared httpx client.
+        """
+        from app.Utilities import get_async_http_client
+        import httpx
+        entry = self._read(url)
+        if entry and entry["expires"] > time.time():
+            self._count("hits")
+            return entry["body"]
+        try:
+            resp = await get_async_http_client().get(url, headers=self._conditional_headers(entry))
+            if resp.status_code != 304:
+                resp.raise_for_status()
+        except httpx.HTTPError as e:
+            return self._fallback(url, entry, e)
+        return self._handle(url, entry, resp.status_code, resp.headers, resp.text)
+
+    def fetch_many(self, urls: list) -> list:
+        """
+        Fetches several pages concurrently.
+
+        Args:
+            urls (list[str]): Page URLs.
+
+        Returns:
+            list: HTML per URL, in order, or the exception raised for it.
+        """
+        def safe_fetch(url):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                return e
+
+        if len(urls) <= 1:
+            return [safe_fetch(url) for url in urls]
+        with ThreadPoolExecutor(min(self.workers, len(urls))) as pool:
+            return list(pool.map(safe_fetch, urls))
+
+    async def afetch_many(self, urls: list) -> list:
+        """
+        Async version of fetch_many.
+        """
+        return await asyncio.gather(*(self.afetch(url) for url in urls), return_exceptions=True)
+
+    def _conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _handle(self, url, entry, status, headers, body):
+        lifetime = freshness_lifetime(headers, self.default_ttl)
+        if status == 304 and entry:
+            self._count("revalidated")
+            if lifetime is not None:
+                entry["expires"] = time.time() + lifetime
+                entry["etag"] = headers.get("ETag") or entry.get("etag")
+                self._write(url, entry)
+            return entry["body"]
+        self._count("downloads")
+        if lifetime is not None:
+            self._write(url, {
+                "url": url,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "expires": time.time() + lifetime,
+                "body": body,
+            })
+        return body
+
+    def _fallback(self, url, entry, error):
+        if entry is None:
+            raise error
+        # Guidance pages change rarely; a stale copy beats no guidance
+        print(f"Serving cached copy of {url}: {error}")
+        self._count("stale")
+        return entry["body"]
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _read(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(url), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, url, entry):
+        if not self.cache_dir:
+            return
+        path = self._path(url)
+        try:
+            # Write then rename so concurrent readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error writing NHS page cache: {e}")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+
+_nhs_fetcher = None
+_nhs_fetcher_lock = threading.Lock()
+
+def get_nhs_fetcher() -> NHSPageFetcher:
+    """
+    Returns the process-wide page fetcher. The cache folder can be set with
+    the NHS_HTTP_CACHE_DIR secret.
+
+    Returns:
+        NHSPageFetcher: The shared fetcher.
+    """
+    global _nhs_fetcher
+    with _nhs_fetcher_lock:
+        if _nhs_fetcher is None:
+            try:
+                import streamlit as st
+                cache_dir = st.secrets.get("NHS_HTTP_CACHE_DIR", DEFAULT_CACHE_DIR)
+            except Exception:
+                cache_dir = DEFAULT_CACHE_DIR
+            _nhs_fetcher = NHSPageFetcher(cache_dir)
+    return _nhs_fetcher
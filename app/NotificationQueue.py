@@ -0,0 +1,329 @@
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+
+PHONE_PATTERN = re.compile(r'^\+\d{10,15}$')
+STALE_QUEUED_AFTER = timedelta(minutes=10)
+LOG_RETENTION_SECONDS = 30 * 24 * 3600
+
+class NotificationError(Exception):
+    """
+    Raised by a transport when a message could not be sent.
+
+    Attributes:
+        retryable (bool): False for errors that will not succeed on retry
+            (e.g. an invalid number); the queue gives up immediately.
+    """
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TwilioTransport:
+    """
+    Sends SMS through Twilio with one client reused for every message.
+    """
+    def __init__(self, account_sid, auth_token, from_number):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+        self.from_number = from_number
+
+    def send(self, to: str, body: str) -> str:
+        """
+        Sends one SMS.
+
+        Returns:
+            str: The Twilio message SID.
+
+        Raises:
+            NotificationError: retryable for throttling and server errors.
+        """
+        from twilio.base.exceptions import TwilioRestException
+        try:
+            return self.client.messages.create(body=body, from_=self.from_number, to=to).sid
+        except TwilioRestException as e:
+            raise NotificationError(str(e), retryable=e.status == 429 or e.status >= 500) from e
+        except Exception as e:
+            raise NotificationError(str(e)) from e
+
+
+class FakeTransport:
+    """
+    In-memory stand-in for Twilio, for local runs and benchmarks.
+
+    Attributes:
+        latency (float): Seconds each send takes.
+        failure_rate (float): Probability that a send raises a retryable error.
+        sent (list): (to, body) of every delivered message.
+    """
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise NotificationError("Simulated transport failure")
+        with self._lock:
+            self.sent.append((to, body))
+            return f"FAKE{len(self.sent):08d}"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class NotificationQueue:
+    """
+    Outbound SMS queue with bounded concurrency, rate limiting, retries and
+    persistent idempotency.
+
+    - enqueue() claims the message's idempotency key in the 'notificationLog'
+      collection (the key is the document _id, so the claim is atomic across
+      processes) and returns without waiting for delivery.
+    - `workers` threads send through the transport, taking a token from the
+      bucket before every attempt, so the provider's rate limit holds however
+      many reminders fall due at once.
+    - Retryable errors are retried with exponential backoff and jitter.
+
+    Attributes:
+        transport: Object with send(to, body) -> str.
+        collection (pymongo collection): Optional 'notificationLog' collection.
+        max_retries (int): Attempts after the first one.
+        backoff (float): Base delay in seconds between attempts.
+        stats (dict): Counters for queued, duplicate, sent, retried and failed messages.
+    """
+    def __init__(self, transport, collection=None, workers: int = 4, rate_per_second: float = 1.0,
+                 burst: float = None, max_retries: int = 3, backoff: float = 1.0, max_pending: int = 10000):
+        self.transport = transport
+        self.collection = collection
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.stats = {"queued": 0, "duplicates": 0, "invalid": 0, "sent": 0, "retries": 0, "failed": 0}
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        if collection is not None:
+            try:
+                collection.create_index("created_at", expireAfterSeconds=LOG_RETENTION_SECONDS)
+            except Exception as e:
+                print(f"Error creating notificationLog index: {e}")
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"naia-sms-{i}", daemon=True).start()
+
+    def enqueue(self, idempotency_key: str, to: str, body: str) -> bool:
+        """
+        Queues an SMS unless a message with the same key was already sent or queued.
+
+        Args:
+            idempotency_key (str): Stable key for this notification.
+            to (str): Phone number in international format (+1234567890).
+            body (str): Message text.
+
+        Returns:
+            bool: True if the message was queued, False if invalid or a duplicate.
+        """
+        if not to or not PHONE_PATTERN.match(to):
+            self._count("invalid")
+            return False
+        if not self._claim(idempotency_key, to):
+            self._count("duplicates")
+            return False
+        self._queue.put(([idempotency_key], to, body))
+        self._count("queued")
+        return True
+
+    def claim(self, keys: list, to: str) -> list:
+        """
+        Claims several idempotency keys, e.g. one per reminder a batched SMS
+        will cover, so each is only ever sent once whatever it is batched with.
+
+        Args:
+            keys (list[str]): Stable keys, one per notified item.
+            to (str): Phone number in international format (+1234567890).
+
+        Returns:
+            list[str]: The keys claimed by this call, in order; keys already
+                sent or queued (by any process) are left out.
+        """
+        if not to or not PHONE_PATTERN.match(to):
+            self._count("invalid")
+            return []
+        claimed = [key for key in keys if self._claim(key, to)]
+        with self._lock:
+            self.stats["duplicates"] += len(keys) - len(claimed)
+        return claimed
+
+    def enqueue_claimed(self, keys: list, to: str, body: str) -> bool:
+        """
+        Queues an SMS covering keys already taken with claim(). Its delivery
+        status is logged on every key, so a failed send can be claimed again.
+
+        Args:
+            keys (list[str]): Keys returned by claim().
+            to (str): Phone number in international format (+1234567890).
+            body (str): Message text.
+
+        Returns:
+            bool: True if the message was queued, False if there is no key.
+        """
+        if not keys:
+            return False
+        self._queue.put((list(keys), to, body))
+        self._count("queued")
+        return True
+
+    def _claim(self, key, to):
+        if self.collection is None:
+            return True
+        now = datetime.now(timezone.utc)
+        try:
+            self.collection.insert_one({
+                "_id": key, "to": to, "status": "queued", "attempts": 0,
+                "created_at": now, "updated_at": now,
+            })
+            return True
+        except DuplicateKeyError:
+            # Failed sends and claims left behind by a crashed process can be taken over
+            result = self.collection.update_one(
+                {"_id": key, "$or": [
+                    {"status": "failed"},
+                    {"status": "queued", "updated_at": {"$lt": now - STALE_QUEUED_AFTER}},
+                ]},
+                {"$set": {"status": "queued", "updated_at": now}},
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            # Delivery matters more than dedupe when the log is unavailable
+            print(f"Error writing notificationLog: {e}")
+            return True
+
+    def _worker(self):
+        while True:
+            keys, to, body = self._queue.get()
+            try:
+                self._deliver(keys, to, body)
+            except Exception as e:
+                print(f"Error in notification worker: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, keys, to, body):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                sid = self.transport.send(to, body)
+            except NotificationError as e:
+                if e.retryable and attempt < self.max_retries:
+                    attempt += 1
+                    self._count("retries")
+                    time.sleep(self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+                    continue
+                self._count("failed")
+                self._log(keys, {"status": "failed", "attempts": attempt + 1, "error": str(e)})
+                return
+            self._count("sent")
+            self._log(keys, {"status": "sent", "attempts": attempt + 1, "sid": sid})
+            return
+
+    def _log(self, keys, fields):
+        if self.collection is None:
+            return
+        fields["updated_at"] = datetime.now(timezone.utc)
+        try:
+            if len(keys) == 1:
+                self.collection.update_one({"_id": keys[0]}, {"$set": fields})
+            else:
+                self.collection.update_many({"_id": {"$in": keys}}, {"$set": fields})
+        except Exception as e:
+            print(f"Error writing notificationLog: {e}")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def flush(self):
+        """Blocks until every queued message was sent or gave up."""
+        self._queue.join()
+
+    def metrics(self) -> dict:
+        """
+        Returns the counters plus the number of messages waiting.
+
+        Returns:
+            dict: Counters with 'pending' added.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+_notification_queue = None
+_notification_queue_lock = threading.Lock()
+
+def get_notification_queue() -> NotificationQueue:
+    """
+    Returns the process-wide notification queue, building it on first use.
+
+    Secrets: SMS_TRANSPORT ("twilio" by default, or "fake"), SMS_WORKERS,
+    SMS_RATE_PER_SECOND and the TWILIO_* credentials. Idempotency keys are
+    stored in the 'notificationLog' collection.
+
+    Returns:
+        NotificationQueue: The shared queue.
+    """
+    global _notification_queue
+    with _notification_queue_lock:
+        if _notification_queue is None:
+            import streamlit as st
+            from data.DataBaseManager import DatabaseManager
+            if st.secrets.get("SMS_TRANSPORT", "twilio") == "fake":
+                transport = FakeTransport()
+            else:
+                transport = TwilioTransport(
+                    st.secrets["TWILIO_ACCOUNT_SID"],
+                    st.secrets["TWILIO_AUTH_TOKEN"],
+                    st.secrets["TWILIO_PHONE_NUMBER"],
+                )
+            try:
+                collection = DatabaseManager().get_collection("notificationLog")
+            except Exception as e:
+                print(f"Notification log unavailable: {e}")
+                collection = None
+            _notification_queue = NotificationQueue(
+                transport,
+                collection,
+                workers=int(st.secrets.get("SMS_WORKERS", 4)),
+                rate_per_second=float(st.secrets.get("SMS_RATE_PER_SECOND", 1.0)),
+            )
+    return _notification_queue
@@ -0,0 +1,123 @@
+import threading
+
+from app.Utilities import estimate_tokens
+
+DEFAULT_SECTION_TOKEN_BUDGET = 600
+MORE_ROWS_TOKENS = 8
+
+
+def _cell(value) -> str:
+    return " ".join(str(value).replace("|", "/").split()) if value not in (None, "") else "-"
+
+
+def _order(row) -> tuple:
+    return (row.get("date") or "", row.get("time") or "")
+
+
+class PromptEncoder:
+    """
+    Serialises tracker data for LLM prompts as compact tables.
+
+    Only the fields a prompt needs are kept (no id, patient_id, due_at or
+    frequency), doses are grouped per medication and day on one line, and
+    each section is cut to a token budget, the dropped lines being counted
+    in a final "... more rows not shown" line.
+
+    Attributes:
+        token_budget (int): Estimated token budget of one section (app.Utilities.estimate_tokens).
+        stats (dict): Sections encoded, rows read, tokens emitted, sections truncated and lines dropped.
+    """
+    def __init__(self, token_budget: int = DEFAULT_SECTION_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.stats = {"sections": 0, "rows": 0, "tokens": 0, "truncated": 0, "lines_dropped": 0}
+        self._lock = threading.Lock()
+
+    def medication_schedule(self, rows: list) -> str:
+        """
+        One line per medication and day: date | medication | dose | doses,
+        each dose as "<time> taken" or "<time> pending".
+
+        Args:
+            rows (list[dict]): Medication tracker rows (med_name, dose, date, time, taken).
+
+        Returns:
+            str: The table, or "No medications scheduled." for no rows.
+        """
+        groups = {}
+        for row in sorted(rows, key=_order):
+            key = (row.get("date"), row.get("med_name"), row.get("dose"))
+            status = "taken" if row.get("taken") else "pending"
+            groups.setdefault(key, []).append(f"{row.get('time') or 'any time'} {status}")
+        lines = [f"{_cell(day)} | {_cell(name)} | {_cell(dose)} | {', '.join(doses)}"
+                 for (day, name, dose), doses in groups.items()]
+        return self._section("date | medication | dose | doses", lines, len(rows), "No medications scheduled.")
+
+    def recovery_schedule(self, rows: list) -> str:
+        """
+        One line per activity and day: date | activity | minutes | times | notes,
+        each time as "<time> done" or "<time> pending" ("ongoing" when untimed).
+
+        Args:
+            rows (list[dict]): Routine tracker rows (activity, date, time, completed,
+                duration_minutes, notes).
+
+        Returns:
+            str: The table, or "No recovery tasks scheduled." for no rows.
+        """
+        groups = {}
+        for row in sorted(rows, key=_order):
+            key = (row.get("date"), row.get("activity"), row.get("duration_minutes") or None, row.get("notes") or None)
+            status = "done" if row.get("completed") else "pending"
+            groups.setdefault(key, []).append(f"{row.get('time') or 'ongoing'} {status}")
+        lines = [f"{_cell(day)} | {_cell(activity)} | {_cell(minutes)} | {', '.join(times)} | {_cell(notes)}"
+                 for (day, activity, minutes, notes), times in groups.items()]
+        return self._section("date | activity | minutes | times | notes", lines, len(rows), "No recovery tasks scheduled.")
+
+    def _section(self, header: str, lines: list, row_count: int, empty: str) -> str:
+        if not lines:
+            text, kept = empty, 0
+        else:
+            costs = [estimate_tokens(line) + 1 for line in lines]
+            used = estimate_tokens(header)
+            if used + sum(costs) <= self.token_budget:
+                kept = len(lines)
+            else:
+                kept = 0
+                # Room is kept for the "... more rows not shown" line
+                while kept < len(lines) and used + costs[kept] <= self.token_budget - MORE_ROWS_TOKENS:
+                    used += costs[kept]
+                    kept += 1
+            text = "\n".join([header] + lines[:kept])
+            if kept < len(lines):
+                text += f"\n... {len(lines) - kept} more rows not shown"
+        with self._lock:
+            self.stats["sections"] += 1
+            self.stats["rows"] += row_count
+            self.stats["tokens"] += estimate_tokens(text)
+            if lines and kept < len(lines):
+                self.stats["truncated"] += 1
+                self.stats["lines_dropped"] += len(lines) - kept
+        return text
+
+
+_prompt_encoder = None
+_prompt_encoder_lock = threading.Lock()
+
+def get_prompt_encoder() -> PromptEncoder:
+    """
+    Returns the process-wide prompt encoder, building it on first use. The
+    optional PROMPT_SECTION_TOKEN_BUDGET secret sets the section budget.
+
+    Returns:
+        PromptEncoder: The shared encoder.
+    """
+    global _prompt_encoder
+    with _prompt_encoder_lock:
+        if _prompt_encoder is None:
+            try:
+                import streamlit as st
+                budget = int(st.secrets.get("PROMPT_SECTION_TOKEN_BUDGET", DEFAULT_SECTION_TOKEN_BUDGET))
+            except Exception:
+                budget = DEFAULT_SECTION_TOKEN_BUDGET
+            _prompt_encoder = PromptEncoder(budget)
+    return _prompt_encoder
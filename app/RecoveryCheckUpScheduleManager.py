@@ -5,7 +5,12 @@ import difflib
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 from app.MedicalRecordManager import MedicalRecordManager
-from data.DataBaseManager import DatabaseManager
+from app.RecurrenceRule import (
+    build_rule, changed_rows, expand_tracker, is_rule, occurrence_update, rule_window_query, write_status_changes
+)
+from app.Utilities import to_due_at, backfill_due_at
+from data.DataBaseManager import AsyncDatabaseManager, DatabaseManager
+from data.TrackerRepository import TrackerRepository
 
 from app.GroqChat import GroqChat
 
@@ -19,6 +24,9 @@ class RecoveryCheckUpScheduleManager:
     - Checking pending routines within a time window.
     - Marking routines as completed based on user input.
 
+    Routines from the medical history are stored as recurrence rules (see
+    app.RecurrenceRule) and expanded into one entry per session when read.
+
     Attributes:
         user_id (str): The ID of the patient.
         collection (pymongo.collection.Collection): The MongoDB collection used to store routines.
@@ -33,16 +41,78 @@ class RecoveryCheckUpScheduleManager:
         self.user_id = user_id
         db_manager = DatabaseManager()
         self.collection = db_manager.get_collection("routineTracker")
+        self.repository = TrackerRepository("routineTracker", self.collection)
+
+    @staticmethod
+    def ensure_indexes():
+        """
+        Creates the (patient_id, completed, due_at) index used by reminder window
+        queries and backfills 'due_at' on older entries. Run at startup
+        through app.DatabaseSetup, never from a chat turn.
+        """
+        collection = DatabaseManager().get_collection("routineTracker")
+        collection.create_index([("patient_id", 1), ("completed", 1), ("due_at", 1)])
+        collection.create_index([("patient_id", 1), ("kind", 1), ("end_at", 1)])
+        backfill_due_at(collection)
+
+    @property
+    def acollection(self):
+        """Async handle on the tracker collection; only usable inside a coroutine."""
+        return AsyncDatabaseManager().get_collection("routineTracker")
     
-    def load_tracker(self):
+    def load_tracker(self, view="page"):
         """
         Loads all routine entries for the current patient from the database.
 
+        Args:
+            view (str): 'page' for whole entries or 'prompt' for the fields the
+                reminder prompts use (see data.TrackerRepository).
+
+        Returns:
+            list[RoutineEntry]: A list of routine/check-up records for the patient.
+        """
+        return expand_tracker(self.repository.find({"patient_id": self.user_id}, view), "completed")
+
+    async def aload_tracker(self, view="page"):
+        """Async version of load_tracker."""
+        return expand_tracker(await self.repository.afind({"patient_id": self.user_id}, view), "completed")
+
+    def find_due(self, start, end, include_completed=False):
+        """
+        Loads the timed entries due between two instants using the due_at index.
+        Entries without a time (ongoing recommendations) have no due_at and are never returned.
+
+        Args:
+            start (datetime): Timezone-aware start of the window.
+            end (datetime): Timezone-aware end of the window.
+            include_completed (bool): Also return entries already marked as completed.
+
         Returns:
-            list[dict]: A list of routine/check-up records for the patient.
+            list[RoutineEntry]: Routine/check-up records sorted by due time, with the reminder view's fields only.
         """
-        docs = list(self.collection.find({"patient_id": self.user_id}))
-        return docs
+        docs = self.repository.find(self._due_query(start, end, include_completed), "reminder")
+        docs += self.repository.find(rule_window_query(self.user_id, start, end), "reminder")
+        return self._due_entries(docs, start, end, include_completed)
+
+    async def afind_due(self, start, end, include_completed=False):
+        """Async version of find_due."""
+        docs = await self.repository.afind(self._due_query(start, end, include_completed), "reminder")
+        docs += await self.repository.afind(rule_window_query(self.user_id, start, end), "reminder")
+        return self._due_entries(docs, start, end, include_completed)
+
+    @staticmethod
+    def _due_entries(docs, start, end, include_completed):
+        entries = [
+            entry for entry in expand_tracker(docs, "completed", start, end)
+            if include_completed or not entry.get("completed")
+        ]
+        return sorted(entries, key=lambda entry: entry["due_at"])
+
+    def _due_query(self, start, end, include_completed):
+        query = {"patient_id": self.user_id, "due_at": {"$gte": start, "$lte": end}}
+        if not include_completed:
+            query["completed"] = {"$ne": True}
+        return query
     
     def save_checkup(self, checkup_data: dict, flag: bool) -> bool:
         """
@@ -64,6 +134,21 @@ class RecoveryCheckUpScheduleManager:
         Returns:
             bool: True if the entry was successfully inserted into the database; False otherwise.
         """
+        result = self.collection.insert_one(self._build_checkup_doc(checkup_data, flag))
+        if result.inserted_id:
+            return True
+        else:
+            return False
+
+    async def asave_checkup(self, checkup_data: dict, flag: bool) -> bool:
+        """Async version of save_checkup."""
+        result = await self.acollection.insert_one(self._build_checkup_doc(checkup_data, flag))
+        return bool(result.inserted_id)
+
+    def _build_checkup_doc(self, checkup_data: dict, flag: bool) -> dict:
+        """
+        Builds the stored document for a new check-up or routine entry (see save_checkup).
+        """
         zn = ZoneInfo("Europe/London")
         if flag:
             doc = {
@@ -93,28 +178,25 @@ class RecoveryCheckUpScheduleManager:
                 "type": checkup_data.get("type", "personal"),
                 "completed": False
                 }
-        result = self.collection.insert_one(doc)
-        if result.inserted_id:
-            return True
-        else:
-            return False
+        doc["due_at"] = to_due_at(doc["date"], doc["time"])
+        return doc
         
-    def update_completed_status(self, updated_records):
+    def update_completed_status(self, updated_records, original_records=None):
         """
         Updates the 'completed' status of existing routine/check-up entries in the database.
 
         Args:
             updated_records (list[dict]): List of records with updated 'completed' field.
-                Each record must contain 'id' or '_id' to identify the database entry.
+                Each record must contain 'id' to identify the database entry.
+            original_records (list[dict], optional): The records as loaded; when
+                given, only the records whose status changed are written.
+
+        Returns:
+            dict: 'changed', 'modified' and 'latency_ms' of the single bulk write.
         """
-        for record in updated_records:
-            record_id = record.get("_id") or record.get("id")  
-            if record_id is None:                
-                continue 
-            self.collection.update_one(
-                {"id": record_id}, 
-                {"$set": {"completed": record["completed"]}}
-            )
+        if original_records is not None:
+            updated_records = changed_rows(original_records, updated_records, "completed")
+        return write_status_changes(self.collection, updated_records, "completed")
     
     def return_routine_info(self):
         """
@@ -159,16 +241,20 @@ class RecoveryCheckUpScheduleManager:
             except Exception as e:
                 print(f"Error interpreting routine schedule: {e}")
         if tracker_docs:
-            # assign unique IDs and patient ID to each entry
+            # assign unique IDs and patient ID to the ongoing entries (rules already have them)
             for t in tracker_docs:
+                if is_rule(t):
+                    continue
                 t["id"] = str(uuid4())
                 t["patient_id"] = self.user_id
+                t["due_at"] = to_due_at(t.get("date"), t.get("time"))
             self.collection.insert_many(tracker_docs)
-        return tracker_docs
+        return expand_tracker(tracker_docs, "completed")
     
     def build_schedule_from_extracted_info(self, info_list, surgery_date):
         """
-        Converts extracted routine information into individual scheduled tasks.
+        Converts extracted routine information into tracker documents: one
+        recurrence rule per scheduled task and one entry per ongoing task.
 
         Args:
             info_list (list[dict]): List of tasks with fields like 'activity', 'start_offset_days',
@@ -176,7 +262,7 @@ class RecoveryCheckUpScheduleManager:
             surgery_date (datetime): The surgery date to calculate offsets from.
 
         Returns:
-            list[dict]: List of scheduled routine/check-up entries.
+            list[dict]: Recurrence rules and ongoing routine/check-up entries.
         """
         all_schedules = []
         for info in info_list:
@@ -203,29 +289,14 @@ class RecoveryCheckUpScheduleManager:
                 })
                 continue
             # Extract the scheduled tasks
-            for day_offset in range(total_days):
-                date = start_date + timedelta(days=day_offset)
-                if preferred_times:
-                    for time_str in preferred_times:
-                        all_schedules.append({
-                            "activity": info["activity"],
-                            "date": date.strftime("%Y-%m-%d"),
-                            "time": time_str,
-                            "duration_minutes": info["duration_minutes"],
-                            "completed": False,
-                            "type": "doctor" 
-                        })
-                else:
-                    for i in range(frequency):
-                        time_str = f"{9 + i * 5:02d}:00"  # Ej: 09:00, 14:00, 19:00...
-                        all_schedules.append({
-                            "activity": info["activity"],
-                            "date": date.strftime("%Y-%m-%d"),
-                            "time": time_str,
-                            "duration_minutes": info["duration_minutes"],
-                            "completed": False,
-                            "type": "doctor" 
-                        })
+            times = preferred_times or [f"{9 + i * 5:02d}:00" for i in range(frequency)]  # Ej: 09:00, 14:00, 19:00...
+            all_schedules.append(build_rule(
+                self.user_id,
+                start_date.strftime("%Y-%m-%d"),
+                times,
+                total_days,
+                {"activity": info["activity"], "duration_minutes": info["duration_minutes"], "type": "doctor"},
+            ))
         return all_schedules
 
     def check_pending_routines(self, window_minutes=30):
@@ -242,21 +313,20 @@ class RecoveryCheckUpScheduleManager:
         now = datetime.now(zn)
         start = now - timedelta(minutes=window_minutes)
         end = now + timedelta(minutes=window_minutes)
-        tracker = self.load_tracker()
-        upcoming = []
-        for task in tracker:
-            # Ignore completed tasks or those without a time (ongoing)
-            if task.get("completed") or not task.get("time"):
-                continue
-            dt_str = f"{task['date']} {task['time']}"
-            try:
-                dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M").replace(tzinfo=zn)
-                if start <= dt <= end:
-                    duration_info = f" ({task['duration_minutes']} min)" if task.get("duration_minutes") else ""
-                    upcoming.append(f"- 📝 {task['activity']}{duration_info} a las {task['time']}")
-            except:
-                continue
-        return upcoming
+        return [self._format_pending(task) for task in self.find_due(start, end)]
+
+    async def acheck_pending_routines(self, window_minutes=30):
+        """Async version of check_pending_routines."""
+        zn = ZoneInfo("Europe/London")
+        now = datetime.now(zn)
+        start = now - timedelta(minutes=window_minutes)
+        end = now + timedelta(minutes=window_minutes)
+        return [self._format_pending(task) for task in await self.afind_due(start, end)]
+
+    @staticmethod
+    def _format_pending(task):
+        duration_info = f" ({task['duration_minutes']} min)" if task.get("duration_minutes") else ""
+        return f"- 📝 {task['activity']}{duration_info} a las {task['time']}"
 
     def mark_task_as_done(self, user_input: str):
         """
@@ -267,23 +337,15 @@ class RecoveryCheckUpScheduleManager:
                 - Boolean indicating whether the task was already completed, or None.
         """
         chat = GroqChat()
-        tracker = self.load_tracker()
-        if not tracker:
-            return None, None
         zn = ZoneInfo("Europe/London")
         now = datetime.now(zn)
         today_str = now.strftime("%Y-%m-%d")
-        # Filter only today's tasks ± 1 hours
-        tasks_today = []
-        for entry in tracker:
-            if entry.get("date") != today_str:
-                continue
-            try:
-                task_time = datetime.strptime(f"{entry['date']} {entry['time']}", "%Y-%m-%d %H:%M").replace(tzinfo=zn)
-            except:
-                continue
-            if abs((task_time - now).total_seconds()) <= 1800:  # 1 horas
-                tasks_today.append(entry)
+        # Filter only today's tasks ± 30 minutes
+        window = timedelta(minutes=30)
+        tasks_today = [
+            entry for entry in self.find_due(now - window, now + window, include_completed=True)
+            if entry.get("date") == today_str
+        ]
         if not tasks_today:
             return None, None
         task_list_str = "\n".join(
@@ -296,8 +358,35 @@ class RecoveryCheckUpScheduleManager:
                 task = tasks_today[idx]
                 if task.get("completed"):
                     return None, True  # ya estaba hecha
-                self.collection.update_one({"id": task["id"]}, {"$set": {"completed": True}})
+                self.collection.update_one(*occurrence_update(task["id"], "completed", True))
                 # task["completed"] = True
                 # self.save_routine_tracker(tracker)
                 return task["activity"], False
         return None, False
+
+    async def amark_task_as_done(self, user_input: str):
+        """Async version of mark_task_as_done."""
+        chat = GroqChat()
+        zn = ZoneInfo("Europe/London")
+        now = datetime.now(zn)
+        today_str = now.strftime("%Y-%m-%d")
+        window = timedelta(minutes=30)
+        tasks_today = [
+            entry for entry in await self.afind_due(now - window, now + window, include_completed=True)
+            if entry.get("date") == today_str
+        ]
+        if not tasks_today:
+            return None, None
+        task_list_str = "\n".join(
+            [f"{i+1}. {t['activity']}" for i, t in enumerate(tasks_today)]
+        )
+        resp = await chat.asearch_for_tasks_to_mark(task_list_str, user_input)
+        if resp.isdigit():
+            idx = int(resp) - 1
+            if 0 <= idx < len(tasks_today):
+                task = tasks_today[idx]
+                if task.get("completed"):
+                    return None, True
+                await self.acollection.update_one(*occurrence_update(task["id"], "completed", True))
+                return task["activity"], False
+        return None, False
@@ -0,0 +1,186 @@
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+from pymongo import UpdateOne
+from zoneinfo import ZoneInfo
+from app.Utilities import to_due_at
+
+RULE_KIND = "rule"
+
+def build_rule(patient_id, start_date, times, count, item, interval_days=1):
+    """
+    Builds a compact recurrence rule document for a tracker collection.
+
+    One rule replaces count x len(times) materialised rows. Completed
+    occurrences are stored sparsely in 'done' as "YYYY-MM-DD|HH:MM" keys.
+
+    Args:
+        patient_id (str): The patient's unique identifier.
+        start_date (str): First day, 'YYYY-MM-DD' (London local date).
+        times (list[str]): 'HH:MM' times on each day.
+        count (int): Number of days the rule repeats.
+        item (dict): Fields copied to every occurrence (e.g. med_name, dose).
+        interval_days (int): Days between repetitions.
+
+    Returns:
+        dict: The rule document, with 'start_at'/'end_at' (UTC) bounding its
+        occurrences for window queries.
+    """
+    times = [t for t in times if to_due_at(start_date, t)]
+    first_day = date.fromisoformat(start_date)
+    last_day = (first_day + timedelta(days=interval_days * max(count - 1, 0))).isoformat()
+    occurrence_times = [to_due_at(start_date, t) for t in times] + [to_due_at(last_day, t) for t in times]
+    return {
+        "id": str(uuid4()),
+        "patient_id": patient_id,
+        "kind": RULE_KIND,
+        "start": start_date,
+        "interval_days": interval_days,
+        "times": times,
+        "count": count,
+        "item": item,
+        "done": [],
+        "start_at": min(occurrence_times) if occurrence_times else None,
+        "end_at": max(occurrence_times) if occurrence_times else None,
+    }
+
+def is_rule(doc) -> bool:
+    return doc.get("kind") == RULE_KIND
+
+def rule_window_query(patient_id, start, end):
+    """
+    Query for the rules of a patient with occurrences between start and end.
+    """
+    return {"patient_id": patient_id, "kind": RULE_KIND, "start_at": {"$lte": end}, "end_at": {"$gte": start}}
+
+def expand_rule(rule, status_field, start=None, end=None):
+    """
+    Lists the occurrences of a rule, optionally only those between start and end.
+
+    Occurrences have the same fields as the materialised tracker rows used
+    before rules: id ("<rule_id>|<date>|<time>"), patient_id, date, time,
+    due_at, the rule's item fields and the status flag.
+
+    Args:
+        rule (dict): Rule document from build_rule.
+        status_field (str): Name of the completion flag ('taken' or 'completed').
+        start (datetime, optional): Timezone-aware window start.
+        end (datetime, optional): Timezone-aware window end.
+
+    Returns:
+        list[dict]: Occurrences in day order.
+    """
+    london = ZoneInfo("Europe/London")
+    first_day = date.fromisoformat(rule["start"])
+    interval = rule.get("interval_days", 1) or 1
+    lo, hi = 0, rule.get("count", 0)
+    # Only visit the days the window can touch; one day of slack covers the UTC offset
+    if start is not None:
+        lo = max(lo, ((start.astimezone(london).date() - first_day).days - 1) // interval)
+    if end is not None:
+        hi = min(hi, (end.astimezone(london).date() - first_day).days // interval + 2)
+    done = set(rule.get("done", []))
+    occurrences = []
+    for i in range(lo, hi):
+        day = (first_day + timedelta(days=i * interval)).isoformat()
+        for t in rule.get("times", []):
+            due_at = to_due_at(day, t)
+            if (start is not None and due_at < start) or (end is not None and due_at > end):
+                continue
+            key = f"{day}|{t}"
+            occurrence = dict(rule.get("item", {}))
+            occurrence.update({
+                "id": f"{rule['id']}|{key}",
+                "patient_id": rule["patient_id"],
+                "date": day,
+                "time": t,
+                status_field: key in done,
+                "due_at": due_at,
+            })
+            occurrences.append(occurrence)
+    return occurrences
+
+def expand_tracker(docs, status_field, start=None, end=None):
+    """
+    Expands the rules among tracker documents; other documents pass through.
+
+    Args:
+        docs (list[dict]): Rules and/or materialised rows.
+        status_field (str): Name of the completion flag.
+        start (datetime, optional): Window start applied to rule occurrences.
+        end (datetime, optional): Window end applied to rule occurrences.
+
+    Returns:
+        list[dict]: Tracker rows.
+    """
+    rows = []
+    for doc in docs:
+        if is_rule(doc):
+            rows.extend(expand_rule(doc, status_field, start, end))
+        else:
+            rows.append(doc)
+    return rows
+
+def occurrence_update(occurrence_id, status_field, value):
+    """
+    Builds the (filter, update) that sets the status of one tracker row,
+    whether it is a rule occurrence or a materialised row.
+
+    Args:
+        occurrence_id (str): Row id as returned by expand_rule or stored on the row.
+        status_field (str): Name of the completion flag.
+        value (bool): New status.
+
+    Returns:
+        tuple: (filter, update) for update_one.
+    """
+    parts = str(occurrence_id).split("|")
+    if len(parts) == 3:
+        rule_id, day, t = parts
+        operator = "$addToSet" if value else "$pull"
+        return {"id": rule_id, "kind": RULE_KIND}, {operator: {"done": f"{day}|{t}"}}
+    return {"id": occurrence_id}, {"$set": {status_field: value}}
+
+def changed_rows(original_rows, edited_rows, status_field):
+    """
+    Returns the edited rows whose status differs from the loaded snapshot.
+
+    Args:
+        original_rows (list[dict]): Rows as they were shown to the user.
+        edited_rows (list[dict]): Rows returned by the editor.
+        status_field (str): Name of the completion flag.
+
+    Returns:
+        list[dict]: Rows that changed; rows without an id are skipped.
+    """
+    before = {row.get("id"): bool(row.get(status_field)) for row in original_rows}
+    return [
+        row for row in edited_rows
+        if row.get("id") is not None and before.get(row["id"]) != bool(row.get(status_field))
+    ]
+
+def write_status_changes(collection, rows, status_field):
+    """
+    Writes the status of tracker rows in one unordered bulk_write.
+
+    Args:
+        collection (pymongo collection): Tracker collection.
+        rows (list[dict]): Rows with 'id' and the new status.
+        status_field (str): Name of the completion flag.
+
+    Returns:
+        dict: 'changed' rows sent, 'modified' documents and 'latency_ms' of the write.
+    """
+    operations = [
+        UpdateOne(*occurrence_update(row["id"], status_field, bool(row.get(status_field))))
+        for row in rows if row.get("id") is not None
+    ]
+    if not operations:
+        return {"changed": 0, "modified": 0, "latency_ms": 0.0}
+    started = time.perf_counter()
+    result = collection.bulk_write(operations, ordered=False)
+    return {
+        "changed": len(operations),
+        "modified": result.modified_count,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
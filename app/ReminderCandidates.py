@@ -0,0 +1,188 @@
+import re
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from zoneinfo import ZoneInfo
+
+# Distinct activities sent to the reminder matching prompts
+REMINDER_CANDIDATES = 8
+# Score from which an activity counts as named in the message
+MATCH_THRESHOLD = 0.5
+# Two words match when their similarity ratio reaches this (typos, inflections)
+WORD_SIMILARITY = 0.8
+
+STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "i'm", "im", "to", "for", "of", "on", "in", "at", "and", "or", "with",
+    "do", "did", "does", "have", "has", "had", "is", "are", "was", "it", "this", "that", "please", "can", "you",
+    "reminder", "reminders", "task", "tasks", "today", "tomorrow", "yesterday", "what", "when", "should",
+}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+ROW_FIELDS = ("activity", "date", "time", "completed", "duration_minutes", "type", "notes")
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word stems without stopwords."""
+    return [_stem(w) for w in re.findall(r"[a-z0-9']+", str(text or "").lower()) if w not in STOPWORDS]
+
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    """Character n-grams of the padded, space-normalised text."""
+    text = f" {' '.join(str(text or '').lower().split())} "
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 0))}
+
+
+def activity_score(activity: str, message_tokens: list, message_grams: set) -> float:
+    """
+    How strongly a message refers to an activity, from 0 to 1.
+
+    Mixes the share of the activity's words found in the message (fuzzy, so
+    "strech" or "stretching" match "stretches") with the share of its
+    character trigrams found in the message.
+
+    Args:
+        activity (str): Activity name, e.g. "Knee stretches".
+        message_tokens (list[str]): tokenize() of the message.
+        message_grams (set[str]): char_ngrams() of the message.
+
+    Returns:
+        float: The score.
+    """
+    words = tokenize(activity)
+    if not words:
+        return 0.0
+    found = sum(
+        1 for word in words
+        if any(word == token or SequenceMatcher(None, word, token).ratio() >= WORD_SIMILARITY
+               for token in message_tokens)
+    )
+    grams = char_ngrams(activity)
+    overlap = len(grams & message_grams) / len(grams) if grams else 0.0
+    return 0.6 * found / len(words) + 0.4 * overlap
+
+
+def mentioned_dates(message: str, today) -> set:
+    """
+    Dates the message refers to: today/tonight, tomorrow, yesterday, a
+    weekday name (its next occurrence, today included) or an ISO date.
+
+    Args:
+        message (str): User message.
+        today (date): Current date in Europe/London.
+
+    Returns:
+        set[str]: "%Y-%m-%d" dates, empty when the message names none.
+    """
+    text = str(message or "").lower()
+    dates = set(re.findall(r"\b\d{4}-\d{2}-\d{2}\b", text))
+    if re.search(r"\b(today|tonight|this (morning|afternoon|evening))\b", text):
+        dates.add(today.isoformat())
+    if "tomorrow" in text:
+        dates.add((today + timedelta(days=1)).isoformat())
+    if "yesterday" in text:
+        dates.add((today - timedelta(days=1)).isoformat())
+    for i, name in enumerate(WEEKDAYS):
+        if re.search(rf"\b{name}\b", text):
+            dates.add((today + timedelta(days=(i - today.weekday()) % 7)).isoformat())
+    return dates
+
+
+def _today(today=None):
+    return today or datetime.now(ZoneInfo("Europe/London")).date()
+
+
+def _date_distance(row, today) -> tuple:
+    # Upcoming rows first (soonest first), then past rows (most recent first)
+    try:
+        days = (datetime.strptime(row.get("date") or "", "%Y-%m-%d").date() - today).days
+    except ValueError:
+        return (2, 0, "")
+    return (0, days, row.get("time") or "") if days >= 0 else (1, -days, "")
+
+
+def score_activities(message: str, reminders: list, today=None) -> list:
+    """
+    Groups reminders by activity and scores each activity against the message.
+
+    Args:
+        message (str): User message.
+        reminders (list[dict]): Tracker rows with at least "activity" and "date".
+        today (date, optional): Defaults to today in Europe/London.
+
+    Returns:
+        list[tuple]: (score, representative row) per distinct activity, best first.
+            The representative is the activity's next occurrence, or its latest one.
+    """
+    today = _today(today)
+    groups = {}
+    for row in reminders:
+        name = str(row.get("activity") or "").strip().lower()
+        if not name:
+            continue
+        best = groups.get(name)
+        if best is None or _date_distance(row, today) < _date_distance(best, today):
+            groups[name] = row
+    tokens, grams = tokenize(message), char_ngrams(message)
+    scored = [(activity_score(row["activity"], tokens, grams), row) for row in groups.values()]
+    scored.sort(key=lambda item: (-item[0], _date_distance(item[1], today)))
+    return scored
+
+
+def select_candidates(message: str, reminders: list, k: int = REMINDER_CANDIDATES, today=None) -> list:
+    """
+    Picks the k distinct activities most likely meant by the message, so the
+    reminder matching prompts stay the same size however long the schedule is.
+
+    When the message names a date that has reminders, only that date's rows
+    are considered. Activities the message does not name are kept, soonest
+    first, to fill the k slots.
+
+    Args:
+        message (str): User message.
+        reminders (list[dict]): All tracker rows of the patient.
+        k (int): Maximum number of activities returned.
+        today (date, optional): Defaults to today in Europe/London.
+
+    Returns:
+        list[dict]: One representative row per selected activity.
+    """
+    today = _today(today)
+    dates = mentioned_dates(message, today)
+    rows = [row for row in reminders if row.get("date") in dates] if dates else reminders
+    return [row for _, row in score_activities(message, rows or reminders, today)[:k]]
+
+
+def select_rows(message: str, reminders: list, today=None) -> list:
+    """
+    Tracker rows needed to answer a question about the schedule: the rows of
+    the dates the message names (today by default), narrowed to the
+    activities it names if any, in compact form.
+
+    Every matching row is returned; the prompts that show them are bounded
+    by app.PromptEncoder, which says how many rows it leaves out.
+
+    Args:
+        message (str): User question.
+        reminders (list[dict]): All tracker rows of the patient.
+        today (date, optional): Defaults to today in Europe/London.
+
+    Returns:
+        list[dict]: Rows sorted by date and time, limited to ROW_FIELDS.
+    """
+    today = _today(today)
+    dates = mentioned_dates(message, today) or {today.isoformat()}
+    rows = [row for row in reminders if row.get("date") in dates]
+    named = {row["activity"].strip().lower() for score, row in score_activities(message, rows, today)
+             if score >= MATCH_THRESHOLD}
+    if named:
+        rows = [row for row in rows if row["activity"].strip().lower() in named]
+    rows.sort(key=lambda row: (row.get("date") or "", row.get("time") or ""))
+    return [
+        {field: row.get(field) for field in ROW_FIELDS if field in ("activity", "time") or row.get(field) not in (None, "")}
+        for row in rows
+    ]
@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from app.AppointmentManager import AppointmentManager
+from app.DatabaseSetup import ensure_database_ready
+from app.MedicalRecordManager import MedicalRecordManager
+from app.MedicationScheduleManager import MedicationScheduleManager
+from app.SendReminder import (
+    claim_sms_keys, format_appointment_reminder, format_medication_reminder, queue_claimed_sms,
+)
+from app.Utilities import on_tracker_change
+
+DEFAULT_HORIZON = timedelta(hours=6)
+MEDICATION_GRACE = timedelta(minutes=1)
+APPOINTMENT_LEAD = timedelta(hours=24)
+
+class ReminderScheduler:
+    """
+    Single process-wide scheduler for medication and appointment SMS reminders.
+
+    Due reminders of every registered patient are kept in a min-heap ordered
+    by send time, and one thread sleeps until the earliest of them. Each
+    patient's reminders are loaded for the next `horizon` only; a reload entry
+    at the end of the horizon loads the next slice. When a tracker changes the
+    patient's version is bumped and their reminders are reloaded; entries
+    with an older version are dropped when popped. Database work is therefore
+    proportional to reminders and tracker changes, not to sessions.
+
+    Attributes:
+        horizon (timedelta): How far ahead each patient's reminders are loaded.
+        sender (callable): sender(phone, message, keys) -> bool, defaults to queue_claimed_sms.
+            `keys` are the per-reminder keys claimed with claim_reminders.
+        clock (callable): Returns the current timezone-aware datetime.
+    """
+    def __init__(self, horizon: timedelta = DEFAULT_HORIZON, sender=None, clock=None):
+        self.horizon = horizon
+        self.sender = sender or queue_claimed_sms
+        self.clock = clock or (lambda: datetime.now(ZoneInfo("Europe/London")))
+        self._heap = []
+        self._counter = itertools.count()
+        self._versions = {}
+        self._sent = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.stats = {"loads": 0, "sent": 0, "stale": 0, "skipped": 0}
+
+    def register(self, patient_id):
+        """
+        Starts scheduling reminders for a patient. Registering again is a no-op.
+
+        Args:
+            patient_id (str): The patient's unique identifier.
+        """
+        with self._condition:
+            if patient_id in self._versions:
+                return
+            self._versions[patient_id] = 0
+            self._push(self.clock(), patient_id, "reload", None)
+
+    def invalidate(self, patient_id):
+        """
+        Drops the patient's queued reminders and reloads them on the scheduler
+        thread. Unregistered patients are ignored.
+
+        Args:
+            patient_id (str): The patient whose tracker changed.
+        """
+        with self._condition:
+            if patient_id not in self._versions:
+                return
+            self._versions[patient_id] += 1
+            self._push(self.clock(), patient_id, "reload", None)
+
+    def start(self):
+        """Starts the scheduler thread if it is not running."""
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="naia-reminder-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stops the scheduler thread after the current batch."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _push(self, when, patient_id, kind, payload):
+        # Called with the condition held
+        version = self._versions[patient_id]
+        heapq.heappush(self._heap, (when, next(self._counter), patient_id, version, kind, payload))
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if self._heap:
+                        delay = (self._heap[0][0] - self.clock()).total_seconds()
+                        if delay <= 0:
+                            break
+                        self._condition.wait(min(delay, 60))
+                    else:
+                        self._condition.wait(60)
+                if self._stopped:
+                    return
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Error in reminder scheduler: {e}")
+
+    def run_pending(self, now=None):
+        """
+        Processes every entry due at `now`: reloads patients and sends their
+        reminders, one SMS per patient and reminder type.
+
+        Args:
+            now (datetime, optional): Defaults to the scheduler clock.
+
+        Returns:
+            int: Number of SMS sent.
+        """
+        now = now or self.clock()
+        reloads, batches = [], {}
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                when, _, patient_id, version, kind, payload = heapq.heappop(self._heap)
+                if version != self._versions.get(patient_id):
+                    self.stats["stale"] += 1
+                    continue
+                if kind == "reload":
+                    reloads.append((patient_id, version))
+                else:
+                    batches.setdefault((patient_id, kind), []).append(payload)
+        for patient_id, version in reloads:
+            self._reload(patient_id, version, now)
+        sent = 0
+        for (patient_id, kind), items in batches.items():
+            sent += self._send(patient_id, kind, items, now)
+        return sent
+
+    def _reload(self, patient_id, version, now):
+        end = now + self.horizon
+        medications = self.load_medications(patient_id, now - MEDICATION_GRACE, end)
+        appointments = self.load_appointments(patient_id, now, end + APPOINTMENT_LEAD)
+        self.stats["loads"] += 1
+        with self._condition:
+            if self._versions.get(patient_id) != version:
+                # Invalidated while loading; the newer reload will queue the reminders
+                return
+            for med in medications:
+                self._push(max(med["due_at"], now), patient_id, "medication", med)
+            for appt in appointments:
+                if not appt.get("reminder_sent"):
+                    self._push(max(appt["due_at"] - APPOINTMENT_LEAD, now), patient_id, "appointment", appt)
+            self._push(end, patient_id, "reload", None)
+            self._prune_sent(now)
+
+    def _prune_sent(self, now):
+        cutoff = now - APPOINTMENT_LEAD
+        for key in [k for k, when in self._sent.items() if when < cutoff]:
+            del self._sent[key]
+
+    @staticmethod
+    def _item_key(kind, patient_id, item):
+        """Idempotency key of one dose or appointment: kind:patient:id:due_at."""
+        due_at = item.get("due_at")
+        due_at = due_at.astimezone(timezone.utc).isoformat() if due_at else ""
+        return f"{kind}:{patient_id}:{item.get('id') or item.get('_id')}:{due_at}"
+
+    def _send(self, patient_id, kind, items, now):
+        keyed = {self._item_key(kind, patient_id, item): item for item in items}
+        with self._condition:
+            keyed = {key: item for key, item in keyed.items() if key not in self._sent}
+        if not keyed:
+            return 0
+        record = self.load_patient(patient_id)
+        phone = record.get("phone")
+        if not phone:
+            return 0
+        # Each dose or appointment is claimed on its own, so a restart or a
+        # second process never texts it again, whatever it is batched with
+        claimed = self.claim_reminders(phone, list(keyed))
+        with self._condition:
+            for key in keyed.keys() - set(claimed):
+                # Already sent or queued elsewhere
+                self._sent[key] = now
+        if not claimed:
+            self.stats["skipped"] += 1
+            return 0
+        items = [keyed[key] for key in claimed]
+        name = record.get("name", "Patient")
+        if kind == "medication":
+            lines = [format_medication_reminder(name, med) for med in items]
+        else:
+            lines = [format_appointment_reminder(name, appt) for appt in items]
+        if not self.sender(phone, "\n".join(lines), claimed):
+            self.stats["skipped"] += 1
+            return 0
+        with self._condition:
+            for key in claimed:
+                self._sent[key] = now
+        if kind == "appointment":
+            self.mark_appointments_sent(patient_id, items)
+        self.stats["sent"] += 1
+        return 1
+
+    # Data access, overridable in tests
+
+    def load_medications(self, patient_id, start, end):
+        return MedicationScheduleManager(patient_id).find_due(start, end)
+
+    def load_appointments(self, patient_id, start, end):
+        return AppointmentManager(patient_id).find_due(start, end)
+
+    def load_patient(self, patient_id):
+        record = MedicalRecordManager(patient_id).record or {}
+        return {"name": record.get("name", "Patient"), "phone": record.get("phone")}
+
+    def claim_reminders(self, phone, keys):
+        return claim_sms_keys(phone, keys)
+
+    def mark_appointments_sent(self, patient_id, appointments):
+        manager = AppointmentManager(patient_id)
+        for appt in appointments:
+            manager.mark_reminder_as_sent(appt["date"], appt["time"])
+
+    def pending_count(self) -> int:
+        """Returns the number of queued heap entries, stale ones included."""
+        with self._condition:
+            return len(self._heap)
+
+
+_reminder_scheduler = None
+_reminder_scheduler_lock = threading.Lock()
+
+def get_reminder_scheduler() -> ReminderScheduler:
+    """
+    Returns the process-wide reminder scheduler, starting it on first use and
+    subscribing it to tracker changes.
+
+    Returns:
+        ReminderScheduler: The shared scheduler.
+    """
+    global _reminder_scheduler
+    with _reminder_scheduler_lock:
+        if _reminder_scheduler is None:
+            ensure_database_ready()
+            _reminder_scheduler = ReminderScheduler()
+            on_tracker_change(_reminder_scheduler.invalidate)
+            _reminder_scheduler.start()
+    return _reminder_scheduler
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+from app.AppointmentManager import AppointmentManager
+from app.ChatContextManager import ChatContextManager
+from app.ChatHistoryManager import ChatHistoryManager
+from app.GroqChat import GroqChat
+from app.MedicalRecordManager import MedicalRecordManager
+from app.MedicationScheduleManager import MedicationScheduleManager
+from app.RecoveryCheckUpScheduleManager import RecoveryCheckUpScheduleManager
+from app.SymptomManager import SymptomManager
+
+
+class RequestContext:
+    """
+    Objects shared by every node of one chat turn.
+
+    The patient record, the tracker managers and the LLM client are created
+    on first use and then reused, so a turn loads the record at most once
+    and builds each manager once, however many nodes and helpers need them
+    (e.g. symptom_agent -> NaiaAgent -> recommendation). The context is
+    carried in AgentState["context"] and must not outlive the turn: the
+    managers are cheap but the record is only as fresh as the turn.
+
+    Each object has its own creation lock: check_reminder uses the context
+    from its thread pool, and its sources must not wait for each other's
+    managers.
+
+    Attributes:
+        username (str): The patient the turn belongs to.
+        created (dict): Number of objects built per name, for benchmarks and tests.
+    """
+    def __init__(self, username: str, medical_record_manager: MedicalRecordManager = None,
+                 chat_history: ChatHistoryManager = None):
+        """
+        Args:
+            username (str): The patient ID.
+            medical_record_manager (MedicalRecordManager, optional): Manager already
+                loaded by the caller (e.g. the Chat page), reused instead of a new load.
+            chat_history (ChatHistoryManager, optional): Existing history manager to reuse.
+        """
+        self.username = username
+        self.created = {}
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._record_task = None
+        if medical_record_manager is not None:
+            self._objects["medical_record_manager"] = medical_record_manager
+        if chat_history is not None:
+            self._objects["chat_history"] = chat_history
+
+    def _get(self, name: str, factory):
+        obj = self._objects.get(name)
+        if obj is not None:
+            return obj
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._objects:
+                self._objects[name] = factory()
+                self.created[name] = self.created.get(name, 0) + 1
+            return self._objects[name]
+
+    @property
+    def medical_record_manager(self) -> MedicalRecordManager:
+        return self._get("medical_record_manager", lambda: MedicalRecordManager(self.username))
+
+    async def amedical_record_manager(self) -> MedicalRecordManager:
+        """
+        Async version of medical_record_manager. Concurrent callers on the
+        turn's event loop share a single load.
+
+        Returns:
+            MedicalRecordManager: Manager with the patient record loaded.
+        """
+        manager = self._objects.get("medical_record_manager")
+        if manager is not None:
+            return manager
+        if self._record_task is None:
+            self._record_task = asyncio.ensure_future(MedicalRecordManager.acreate(self.username))
+        manager = await self._record_task
+        return self._get("medical_record_manager", lambda: manager)
+
+    @property
+    def record(self) -> dict:
+        """The patient record (None if not found), loaded on first use."""
+        return self.medical_record_manager.record
+
+    @property
+    def groq(self) -> GroqChat:
+        return self._get("groq", GroqChat)
+
+    @property
+    def symptom_manager(self) -> SymptomManager:
+        return self._get("symptom_manager", lambda: SymptomManager(self.username))
+
+    @property
+    def medication_manager(self) -> MedicationScheduleManager:
+        return self._get("medication_manager", lambda: MedicationScheduleManager(self.username))
+
+    @property
+    def recovery_manager(self) -> RecoveryCheckUpScheduleManager:
+        return self._get("recovery_manager", lambda: RecoveryCheckUpScheduleManager(self.username))
+
+    @property
+    def appointment_manager(self) -> AppointmentManager:
+        return self._get("appointment_manager", lambda: AppointmentManager(self.username))
+
+    @property
+    def chat_history(self) -> ChatHistoryManager:
+        return self._get("chat_history", lambda: ChatHistoryManager(self.username))
+
+    @property
+    def chat_context(self) -> ChatContextManager:
+        return self._get("chat_context", lambda: ChatContextManager(
+            self.username, history=self.chat_history, groq=self.groq))
+
+
+def get_request_context(state: dict, username: str = None) -> RequestContext:
+    """
+    Returns the turn's context from the graph state, or a new one when the
+    handler is called outside a chat turn (tests, scripts).
+
+    Args:
+        state (dict): Agent state, possibly holding "context".
+        username (str, optional): Patient for a new context. Defaults to state["username"].
+
+    Returns:
+        RequestContext: The context to use.
+    """
+    context = state.get("context")
+    if context is None:
+        context = RequestContext(username or state.get("username"))
+    return context
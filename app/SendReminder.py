@@ -1,18 +1,10 @@
-from datetime import datetime, timedelta
-import re
-import threading
-import time
-from zoneinfo import ZoneInfo
-from twilio.rest import Client
 import streamlit as st
-
-from app.MedicationScheduleManager import MedicationScheduleManager
-from app.MedicalRecordManager import MedicalRecordManager
-from app.AppointmentManager import AppointmentManager
+from app.NotificationQueue import NotificationError, PHONE_PATTERN, get_notification_queue
 
 def send_sms(destino: str, mensaje: str) -> str:
     """
-    Sends an SMS using Twilio.
+    Sends an SMS right away through the shared transport (one reused Twilio
+    client). Reminders should go through queue_sms instead.
 
     Args:
         destino (str): Phone number in international format (+1234567890).
@@ -21,153 +13,83 @@ def send_sms(destino: str, mensaje: str) -> str:
     Returns:
         bool: True if the SMS was sent successfully, False if there was an error or invalid number.
     """
-    account_sid = st.secrets["TWILIO_ACCOUNT_SID"]
-    auth_token = st.secrets["TWILIO_AUTH_TOKEN"]
-    twilio_number = st.secrets["TWILIO_PHONE_NUMBER"]
-
-    if not destino or not re.match(r'^\+\d{10,15}$', destino):
+    if not destino or not PHONE_PATTERN.match(destino):
         return False
-    client = Client(account_sid, auth_token)
     try:
-        sms = client.messages.create(
-            body=mensaje,
-            from_=twilio_number,
-            to=destino
-        )
-        # print(sms.sid)
+        get_notification_queue().transport.send(destino, mensaje)
         return True
-    except Exception as e:
-        print("Error while sending the SMS: {e}")
+    except NotificationError as e:
+        print(f"Error while sending the SMS: {e}")
         return False
-    
-def get_upcoming_medication(username):
+
+def queue_sms(destino: str, mensaje: str, idempotency_key: str) -> bool:
+    """
+    Queues an SMS for rate-limited delivery with retries. A key that was
+    already sent or queued (by any process) is not sent again.
+
+    Args:
+        destino (str): Phone number in international format (+1234567890).
+        mensaje (str): Content of the SMS to send.
+        idempotency_key (str): Stable key identifying this notification.
+
+    Returns:
+        bool: True if queued, False if the number is invalid or the key was already used.
     """
-    Gets the list of medications that need to be taken within ±1 minute.
+    return get_notification_queue().enqueue(idempotency_key, destino, mensaje)
+
+def claim_sms_keys(destino: str, keys: list) -> list:
+    """
+    Claims one idempotency key per reminder before they are batched into an
+    SMS. Keys already sent or queued (by any process) are not returned.
 
     Args:
-        username (str): Username to identify the medication tracker.
+        destino (str): Phone number in international format (+1234567890).
+        keys (list[str]): One stable key per reminder.
 
     Returns:
-        list: Reminder messages for medications that are due soon.
+        list[str]: The keys claimed by this call.
     """
-    tz = ZoneInfo("Europe/London")
-    medicalRecordManager = MedicalRecordManager(username)
-    patient_name = medicalRecordManager.record.get("name", "Patient")
-    # now = datetime.now()
-    now = datetime.now(tz)
-    start = now - timedelta(minutes=1)
-    end = now + timedelta(minutes=1)
-    medicationScheduleManager = MedicationScheduleManager(username)
-    tracker = medicationScheduleManager.load_tracker()
-    upcoming = []
-    for med in tracker:
-        if med.get("taken"):
-            continue
-        dt_str = f"{med['date']} {med['time']}"
-        try:
-            # dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
-            dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M").replace(tzinfo=tz)
-            if start <= dt <= end:
-                upcoming.append(f"{patient_name}, it is time to take {med['med_name']} - ({med['dose']})")
-        except Exception as e:
-            print(f"Error parsing med datetime: {e}")
-            continue
-    return upcoming
-
-def get_upcoming_appointments(username):
+    return get_notification_queue().claim(keys, destino)
+
+def queue_claimed_sms(destino: str, mensaje: str, keys: list) -> bool:
     """
-    Gets upcoming medical appointments within the next 24 hours.
+    Queues an SMS covering reminders claimed with claim_sms_keys.
 
     Args:
-        username (str): Username to identify the appointment tracker.
+        destino (str): Phone number in international format (+1234567890).
+        mensaje (str): Content of the SMS to send.
+        keys (list[str]): Keys returned by claim_sms_keys.
 
     Returns:
-        list: Reminder messages for upcoming appointments.
+        bool: True if queued.
     """
-    tz = ZoneInfo("Europe/London")
-    medicalRecordManager = MedicalRecordManager(username)
-    patient_name = medicalRecordManager.record.get("name", "Patient")
-    # now = datetime.now()
-    now = datetime.now(tz)
-    start = now
-    end = now + timedelta(hours=24)
-    appointmentManager = AppointmentManager(username)
-    tracker = appointmentManager.load_appointment_tracker()
-    upcoming = []
-    for appointment in tracker:
-        if appointment.get("reminder_sent"):
-            continue
-        dt_str = f"{appointment['date']} {appointment['time']}"
-        try:
-            dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M").replace(tzinfo=tz)
-            if start <= dt <= end:
-                upcoming.append(
-                    f"{patient_name}, Reminder: {appointment['department']} at {appointment['location']} "
-                    f"with {appointment['clinician']} on {appointment['date']} at {dt.strftime('%H:%M')}"
-                )
-                appointmentManager.mark_reminder_as_sent(appointment['date'], appointment['time'])
-        except Exception as e:
-            print(f"Error parsing appointment datetime: {e}")
-            continue
-    return upcoming
-
-def monitoring(user):
+    return get_notification_queue().enqueue_claimed(keys, destino, mensaje)
+
+def format_medication_reminder(patient_name, med):
     """
-    Continuous monitoring loop that sends reminders for medications and appointments.
+    Builds the SMS line for a due medication dose.
 
     Args:
-        user (str): Username for which reminders should be sent.
+        patient_name (str): Name used to address the patient.
+        med (dict): Medication tracker document.
 
-    Notes:
-        - Avoids sending duplicate reminders using st.session_state.sent_reminders.
-        - Runs indefinitely, checking every 30 seconds.
+    Returns:
+        str: Reminder text.
     """
-    username = user
-    if "sent_reminders" not in st.session_state:
-        st.session_state.sent_reminders = set()
-    while True:
-        upcoming_meds = get_upcoming_medication(username)
-        if upcoming_meds: 
-            meds_to_send = [med for med in upcoming_meds if med not in st.session_state.sent_reminders]
-            if meds_to_send:
-                medicalRecordManager = MedicalRecordManager(username)
-                patientInfo = medicalRecordManager.get_patient_info()
-                phone = patientInfo.get("phone")
-                if phone:
-                    message = "\n".join(meds_to_send)                    
-                    if send_sms(phone, message):
-                        # Save the sent messages to avoid repetition
-                        for med in meds_to_send:
-                            st.session_state.sent_reminders.add(med)
-        # Appointment reminders
-        upcoming_appts = get_upcoming_appointments(username)
-        appts_to_send = [appt for appt in upcoming_appts if appt not in st.session_state.sent_reminders]
-        if appts_to_send:
-            medicalRecordManager = MedicalRecordManager(username)
-            patientInfo = medicalRecordManager.get_patient_info()
-            phone = patientInfo.get("phone")
-            if phone:
-                message = "\n".join(appts_to_send)
-                if send_sms(phone, message):
-                    for appt in appts_to_send:
-                        st.session_state.sent_reminders.add(appt)
-        
-        time.sleep(30)
-    
-    
-
-def start_monitoring_thread(username):
+    return f"{patient_name}, it is time to take {med['med_name']} - ({med['dose']})"
+
+def format_appointment_reminder(patient_name, appointment):
     """
-    Starts the background monitoring thread if it does not already exist.
+    Builds the SMS line for an appointment in the next 24 hours.
 
     Args:
-        username (str): Username for starting the reminder monitoring.
+        patient_name (str): Name used to address the patient.
+        appointment (dict): Appointment tracker document.
 
-    Notes:
-        - Ensures that only one monitoring thread runs per session.
-        - The thread continuously runs the monitoring() function.
+    Returns:
+        str: Reminder text.
     """
-    if "monitoring" not in st.session_state:
-        st.session_state.monitoring = True
-        threading.Thread(target=monitoring, args=(username,), daemon=True).start()
-        # print("While tha app is running. NAIA will send SMS automatically a medication reminder")
+    return (
+        f"{patient_name}, Reminder: {appointment['department']} at {appointment['location']} "
+        f"with {appointment['clinician']} on {appointment['date']} at {appointment['time']}"
+    )
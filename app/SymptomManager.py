@@ -4,7 +4,8 @@ import json
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 
-from data.DataBaseManager import DatabaseManager
+from data.DataBaseManager import AsyncDatabaseManager, DatabaseManager
+from data.TrackerRepository import TrackerRepository
 
 class SymptomManager:
     """
@@ -23,7 +24,13 @@ class SymptomManager:
         """
         self.user_id = user_id
         db_manager = DatabaseManager()
-        self.collection = db_manager.get_collection("symptomTracker")    
+        self.collection = db_manager.get_collection("symptomTracker")
+        self.repository = TrackerRepository("symptomTracker", self.collection)
+
+    @property
+    def acollection(self):
+        """Async handle on the symptom collection; only usable inside a coroutine."""
+        return AsyncDatabaseManager().get_collection("symptomTracker")
 
     def add_entry(self, entry):
         """
@@ -36,12 +43,20 @@ class SymptomManager:
         Returns:
             dict: The stored entry with added 'timestamp', 'patient_id', and unique 'id'.
         """
+        self.collection.insert_one(self._prepare_entry(entry))
+        return entry
+
+    async def aadd_entry(self, entry):
+        """Async version of add_entry."""
+        await self.acollection.insert_one(self._prepare_entry(entry))
+        return entry
+
+    def _prepare_entry(self, entry):
         zn = ZoneInfo("Europe/London")
         if "timestamp" not in entry:
             entry["timestamp"] = datetime.now(zn).isoformat()
         entry["patient_id"] = self.user_id
         entry["id"] = str(uuid4())
-        self.collection.insert_one(entry)
         return entry
 
     def add(self, new_symptoms):
@@ -60,21 +75,35 @@ class SymptomManager:
                 self.symptoms.append(s)
         self.save()
 
-    def get_all(self):
-        """Return all the records from the patient."""
-        return list(self.collection.find({"patient_id": self.user_id}))
+    def get_all(self, view="page"):
+        """Return all the records from the patient, whole ('page') or as the prompts read them ('prompt')."""
+        return self.repository.find({"patient_id": self.user_id}, view)
+
+    async def aget_all(self, view="page"):
+        """Async version of get_all."""
+        return await self.repository.afind({"patient_id": self.user_id}, view)
     
     def filter_recent_symptoms(self, daysDefined):
         """Filter symptoms recent according to the range of days."""
+        entries = self.repository.find(self._recent_query(daysDefined), "prompt")
+        return self._collect_symptoms(entries)
+
+    async def afilter_recent_symptoms(self, daysDefined):
+        """Async version of filter_recent_symptoms."""
+        entries = await self.repository.afind(self._recent_query(daysDefined), "prompt")
+        return self._collect_symptoms(entries)
+
+    def _recent_query(self, daysDefined):
         zn = ZoneInfo("Europe/London")
         cutoff = datetime.now(zn) - timedelta(days=daysDefined)
         cutoff_str = cutoff.isoformat()
-
-        cursor = self.collection.find({
+        return {
             "patient_id": self.user_id,
             "timestamp": {"$gte": cutoff_str}
-        })
+        }
 
+    @staticmethod
+    def _collect_symptoms(cursor):
         recent_symptoms = []
         for entry in cursor:
             for symptom in entry.get("symptoms", []):
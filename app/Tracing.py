@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+DEFAULT_TRACE_PATH = os.path.join("logs", "naia_traces.jsonl")
+
+_current_span = contextvars.ContextVar("naia_current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation in a trace. Exported with OpenTelemetry's span field
+    names (trace_id, span_id, parent_span_id, start/end_time_unix_nano, ...).
+
+    Attributes:
+        name (str): Operation, e.g. "node:symptom_agent", "llm.chat", "mongo.find".
+        kind (str): "internal", "client" or "server".
+        trace_id (str): 32 hex characters shared by every span of a turn.
+        span_id (str): 16 hex characters.
+        parent_span_id (str): Parent span, None for the root.
+        attributes (dict): Extra fields (model, token counts, collection, ...).
+    """
+    def __init__(self, name, kind="internal", parent=None, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent["trace_id"] if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent["span_id"] if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def context(self) -> dict:
+        """
+        Returns the ids a child span needs, e.g. to pass the trace through the
+        graph state where context variables do not follow.
+        """
+        return {"trace_id": self.trace_id, "span_id": self.span_id}
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+        export_span(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def current_context():
+    """
+    Returns the context of the active span, or None outside a trace.
+    """
+    active = _current_span.get()
+    return active.context() if active else None
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", parent: dict = None, **attributes):
+    """
+    Times a block as a span, child of `parent` or of the active span.
+
+    Works in threads and coroutines alike: the active span lives in a context
+    variable, so tasks started inside the block (asyncio.gather, executor
+    submits through contextvars.copy_context) are parented to it.
+
+    Args:
+        name (str): Operation name.
+        kind (str): Span kind.
+        parent (dict, optional): Span.context() of the parent, overrides the active span.
+        **attributes: Initial attributes.
+
+    Yields:
+        Span: The open span; attributes can be added with set().
+    """
+    current = Span(name, kind, parent or current_context(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced_node(name: str, fn):
+    """
+    Wraps a LangGraph node or conditional edge function in a span. The parent
+    comes from state["trace"] because the graph runs on another thread than
+    the caller.
+
+    Args:
+        name (str): Node name, exported as "node:<name>".
+        fn (callable): Node function (sync or async) taking the state.
+
+    Returns:
+        callable: Wrapper of the same kind.
+    """
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            with span(f"node:{name}", parent=state.get("trace")) as node_span:
+                return _node_result(node_span, await fn(state))
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        with span(f"node:{name}", parent=state.get("trace")) as node_span:
+            return _node_result(node_span, fn(state))
+    return wrapper
+
+
+def _node_result(node_span, result):
+    if isinstance(result, str):
+        # Conditional edges return the next node
+        node_span.set(route=result)
+    return result
+
+
+def record_span(name: str, kind: str, start_ns: int, end_ns: int, parent: dict, status: str = "ok", **attributes):
+    """
+    Exports an already finished operation, e.g. from a driver event.
+    """
+    finished = Span(name, kind, parent, attributes)
+    finished.start_ns = start_ns
+    finished.status = status
+    finished.end(end_ns)
+
+
+def llm_usage(message) -> dict:
+    """
+    Token counts of a chat model response.
+
+    Args:
+        message (AIMessage): Response from invoke/ainvoke.
+
+    Returns:
+        dict: prompt_tokens, completion_tokens and total_tokens (0 if unknown).
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        usage = {
+            "input_tokens": token_usage.get("prompt_tokens", 0),
+            "output_tokens": token_usage.get("completion_tokens", 0),
+            "total_tokens": token_usage.get("total_tokens", 0),
+        }
+    return {
+        "prompt_tokens": usage.get("input_tokens", 0),
+        "completion_tokens": usage.get("output_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+    }
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """
+    Exports a "mongo.<command>" client span for every command issued while a
+    trace is active. Commands from background work (scheduler, queue) have
+    no active span and are ignored.
+    """
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        parent = current_context()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (
+                parent, time.time_ns(), collection if isinstance(collection, str) else None,
+            )
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+    def _finish(self, event, status):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        parent, start_ns, collection = pending
+        record_span(
+            f"mongo.{event.command_name}", "client", start_ns, start_ns + event.duration_micros * 1000, parent, status,
+            **{"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name,
+               "db.collection": collection},
+        )
+
+
+def requests_response_hook(response, *args, **kwargs):
+    """
+    requests Session hook exporting an "http.<method>" span per response.
+    Use as session.hooks["response"].append(requests_response_hook).
+    """
+    parent = current_context()
+    if parent is None:
+        return response
+    end_ns = time.time_ns()
+    record_span(
+        f"http.{response.request.method.lower()}", "client",
+        end_ns - int(response.elapsed.total_seconds() * 1e9), end_ns, parent,
+        "error" if response.status_code >= 500 else "ok",
+        **{"http.url": response.url, "http.status_code": response.status_code},
+    )
+    return response
+
+
+async def httpx_request_hook(request):
+    parent = current_context()
+    if parent is not None:
+        request.extensions["naia_trace"] = (parent, time.time_ns())
+
+
+async def httpx_response_hook(response):
+    started = response.request.extensions.get("naia_trace")
+    if started is None:
+        return
+    parent, start_ns = started
+    record_span(
+        f"http.{response.request.method.lower()}", "client", start_ns, time.time_ns(), parent,
+        "error" if response.status_code >= 500 else "ok",
+        **{"http.url": str(response.request.url), "http.status_code": response.status_code},
+    )
+
+
+class JsonlSpanExporter:
+    """
+    Appends finished spans to a file, one JSON object per line.
+    """
+    def __init__(self, path: str = DEFAULT_TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span_dict: dict):
+        line = json.dumps(span_dict, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+class MemorySpanExporter:
+    """
+    Keeps finished spans in a list, for tests and benchmarks.
+    """
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span_dict: dict):
+        with self._lock:
+            self.spans.append(span_dict)
+
+
+_exporter = None
+_exporter_ready = False
+_exporter_lock = threading.Lock()
+
+def set_exporter(exporter):
+    """
+    Replaces the span exporter; None disables export.
+    """
+    global _exporter, _exporter_ready
+    with _exporter_lock:
+        _exporter = exporter
+        _exporter_ready = True
+
+
+def get_exporter():
+    """
+    Returns the span exporter, building it on first use from the TRACE_PATH
+    secret (default logs/naia_traces.jsonl). An empty TRACE_PATH disables tracing export.
+
+    Returns:
+        JsonlSpanExporter or None: The exporter.
+    """
+    global _exporter, _exporter_ready
+    if _exporter_ready:
+        return _exporter
+    with _exporter_lock:
+        if not _exporter_ready:
+            try:
+                import streamlit as st
+                path = st.secrets.get("TRACE_PATH", DEFAULT_TRACE_PATH)
+            except Exception:
+                path = DEFAULT_TRACE_PATH
+            try:
+                _exporter = JsonlSpanExporter(path) if path else None
+            except OSError as e:
+                print(f"Tracing disabled: {e}")
+                _exporter = None
+            _exporter_ready = True
+    return _exporter
+
+
+def export_span(finished: Span):
+    exporter = get_exporter()
+    if exporter is None:
+        return
+    try:
+        exporter.export(finished.to_dict())
+    except Exception as e:
+        print(f"Error exporting span: {e}")
+
+
+def summarize(spans: list) -> list:
+    """
+    Latency percentiles per span name, slowest p95 first.
+
+    Args:
+        spans (list[dict]): Exported spans.
+
+    Returns:
+        list[dict]: name, count, p50_ms, p95_ms, max_ms and, for LLM spans, total tokens.
+    """
+    durations, tokens = defaultdict(list), defaultdict(int)
+    for item in spans:
+        durations[item["name"]].append(item["duration_ms"])
+        tokens[item["name"]] += item.get("attributes", {}).get("total_tokens", 0) or 0
+    rows = []
+    for name, values in durations.items():
+        values.sort()
+        rows.append({
+            "name": name,
+            "count": len(values),
+            "p50_ms": values[len(values) // 2],
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max_ms": values[-1],
+            "tokens": tokens[name],
+        })
+    return sorted(rows, key=lambda row: -row["p95_ms"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise exported spans by name.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_TRACE_PATH)
+    args = parser.parse_args(argv)
+    with open(args.path, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    print(f"{'span':<36}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'tokens':>9}")
+    for row in summarize(spans):
+        print(f"{row['name']:<36}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+              f"{row['max_ms']:>10.1f}{row['tokens']:>9}")
+
+
+if __name__ == "__main__":
+    # python -m app.Tracing logs/naia_traces.jsonl
+    main()
@@ -1,4 +1,16 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import pandas as pd  # 🔹 Esto faltaba
+import httpx
+from pymongo import UpdateOne
+from app.Tracing import httpx_request_hook, httpx_response_hook
+
+_background_loop = None
+_background_lock = threading.Lock()
+_async_http_clients = {}
+_tracker_listeners = []
 
 def clean_string(s):
     """
@@ -19,4 +31,167 @@ def clean_dataframe_strings(df: pd.DataFrame) -> pd.DataFrame:
     """
     for col in df.select_dtypes(include=['object']).columns:
         df[col] = df[col].apply(clean_string)
-    return df
\ No newline at end of file
+    return df
+
+def to_due_at(date_str, time_str):
+    """
+    Converts a tracker 'date' (YYYY-MM-DD) and 'time' (HH:MM), both in London
+    local time, into the UTC datetime stored as 'due_at'.
+
+    Returns:
+        datetime or None: Aware UTC datetime, or None if date/time are missing or invalid.
+    """
+    if not date_str or not time_str:
+        return None
+    try:
+        local = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M").replace(tzinfo=ZoneInfo("Europe/London"))
+    except (TypeError, ValueError):
+        return None
+    return local.astimezone(timezone.utc)
+
+
+def backfill_due_at(collection, default_time=None):
+    """
+    Migration for tracker documents created before 'due_at' existed.
+    Computes 'due_at' from the stored 'date'/'time' strings and writes it
+    back in a single unordered bulk write. Documents without a usable time
+    get due_at=None so they are not scanned again.
+
+    Args:
+        collection (pymongo collection): Tracker collection to migrate.
+        default_time (str, optional): Time used when a document has none (e.g. "09:00").
+
+    Returns:
+        int: Number of documents updated.
+    """
+    updates = []
+    for doc in collection.find({"due_at": {"$exists": False}}, {"_id": 1, "date": 1, "time": 1}):
+        due_at = to_due_at(doc.get("date"), doc.get("time") or default_time)
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"due_at": due_at}}))
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def get_background_loop():
+    """
+    Returns the process-wide event loop used by the async agent graph,
+    starting it in a daemon thread on first use.
+
+    Streamlit runs each script in its own thread without a loop, so every
+    session submits its coroutines here instead of creating a loop per run.
+    Async clients (Mongo, HTTP, Groq) are bound to this loop and shared.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running background loop.
+    """
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="naia-async-loop", daemon=True).start()
+            _background_loop = loop
+    return _background_loop
+
+
+def run_coroutine(coro, timeout=None):
+    """
+    Runs a coroutine on the background loop and blocks the calling thread
+    until it finishes.
+
+    Args:
+        coro (coroutine): The coroutine to run.
+        timeout (float, optional): Seconds to wait before raising TimeoutError.
+
+    Returns:
+        Any: The coroutine's result.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    return future.result(timeout)
+
+
+def iterate_async(async_iterable, timeout=None):
+    """
+    Iterates an async iterable on the background loop from a synchronous
+    thread, yielding each item as soon as it is produced.
+
+    Args:
+        async_iterable (AsyncIterable): E.g. graph.astream(...).
+        timeout (float, optional): Seconds to wait for each item.
+
+    Returns:
+        Iterator: The items, in order.
+    """
+    iterator = async_iterable.__aiter__()
+
+    async def next_item():
+        return await iterator.__anext__()
+
+    while True:
+        try:
+            yield run_coroutine(next_item(), timeout)
+        except StopAsyncIteration:
+            return
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Returns a keep-alive httpx.AsyncClient for the running event loop.
+
+    Returns:
+        httpx.AsyncClient: Client shared by every coroutine on this loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            follow_redirects=True,
+            event_hooks={"request": [httpx_request_hook], "response": [httpx_response_hook]},
+        )
+        _async_http_clients[loop] = client
+    return client
+
+
+def estimate_tokens(text) -> int:
+    """
+    Cheap token estimate for prompt budgeting (about 4 characters per token
+    for English text with the Llama tokenizer).
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+
+def on_tracker_change(callback):
+    """
+    Registers a callback run whenever a patient's medication or appointment
+    tracker is written through its manager.
+
+    Args:
+        callback (callable): Called with the patient_id that changed.
+    """
+    if callback not in _tracker_listeners:
+        _tracker_listeners.append(callback)
+
+
+def notify_tracker_change(patient_id):
+    """
+    Tells registered listeners (e.g. the reminder scheduler) that a patient's
+    tracker changed. Listener errors are printed, never raised to the writer.
+
+    Args:
+        patient_id (str): The patient whose tracker was written.
+    """
+    for callback in list(_tracker_listeners):
+        try:
+            callback(patient_id)
+        except Exception as e:
+            print(f"Error notifying tracker change: {e}")
@@ -0,0 +1,513 @@
+"""
+Offline load test of the agent graph.
+
+Drives build_graph().invoke with synthetic patients and a mix of messages for
+every route, with no network access:
+- Groq is replaced by FakeChatModel, which answers each prompt type with a
+  canned response after a configurable latency and reports token usage;
+- MongoDB is replaced by mongomock (with a bulk_write shim for the pymongo
+  4 operation classes), each collection call counted as a span;
+- the mock NHS patients API is served by a local HTTP server, and NHS
+  guidance comes from an index built from tests/fixtures/nhs_pages.
+
+Every turn is traced with app.Tracing, so the report (throughput, p50/p95/p99
+per route, LLM/DB/HTTP calls per turn) comes from the same spans the app
+exports in production. The harness adds "setup" spans counting patient record
+loads and chat model constructions per turn.
+
+    python -m benchmarks.graph_load_test --patients 50 --turns 500 --concurrency 8 --llm-latency 0.05
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+import mongomock
+import mongomock.collection
+import streamlit as st
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+MONGO_URI = "mongodb://load-test"
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "nhs_pages")
+SURGERIES = ["Knee replacement", "Hip replacement"]
+MEDICATIONS = [
+    {"name": "Paracetamol", "dose": "500mg", "frequency": "4x/day", "duration": "7 days"},
+    {"name": "Ibuprofen", "dose": "200mg", "frequency": "2x/day", "duration": "5 days"},
+    {"name": "Enoxaparin", "dose": "40mg", "frequency": "1x/day", "duration": "14 days"},
+]
+# (message, expected route, weight)
+MESSAGE_MIX = [
+    ("I have pain and swelling in my knee since yesterday", "symptom_agent", 3),
+    ("My wound is red and feels hot", "symptom_agent", 2),
+    ("Did I take my ibuprofen today?", "reminder_medication_agent", 3),
+    ("I just took my paracetamol", "reminder_medication_agent", 2),
+    ("What stretches do I need to do today?", "reminder_recovery_agent", 2),
+    ("Do I have any allergies?", "medical_record_agent", 2),
+    ("What surgery did I have and when?", "medical_record_agent", 1),
+    ("Should I go to the hospital if my calf is swollen?", "recommendation_agent", 2),
+    ("What can I do to recover faster after my knee replacement?", "recommendation_agent", 2),
+    ("Hey, how are you today?", "chat_agent", 2),
+]
+ROUTE_BY_MESSAGE = {message: route for message, route, _ in MESSAGE_MIX}
+_MONGOMOCK_METHODS = {}
+DB_METHODS = [
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write", "find_one_and_update", "count_documents", "aggregate",
+]
+
+
+# Fake LLM
+
+def scripted_reply(prompt: str) -> str:
+    """Canned answer for each prompt type the agents send to Groq."""
+    if "routing assistant" in prompt:
+        match = re.search(r'User message: "(.*)"', prompt)
+        return ROUTE_BY_MESSAGE.get(match.group(1) if match else "", "chat_agent")
+    if "symptom triage assistant" in prompt and "Extract the symptoms" in prompt:
+        return json.dumps({"overall_severity": "moderate", "symptoms": [
+            {"name": "pain", "location": "knee", "duration_days": 1, "severity": "moderate", "onset": None}]})
+    if "Extract symptoms and metadata" in prompt:
+        return json.dumps({"overall_severity": "mild", "symptoms": [
+            {"name": "pain", "location": None, "duration_days": None, "severity": None, "onset": None}]})
+    if "symptom triage assistant" in prompt:
+        return "moderate"
+    if "how many days" in prompt:
+        return "1"
+    if "confirming that they have taken a medication" in prompt:
+        taken = [med["name"] for med in MEDICATIONS if med["name"].lower() in prompt.lower().split("user:")[-1]]
+        return taken[0] if taken else "none"
+    if "scheduled recovery activities" in prompt:
+        return "no"
+    if "recovery tasks scheduled for today" in prompt:
+        return "none"
+    if "reminder intent classifier" in prompt:
+        return "consult_existing"
+    if "reminder name matcher" in prompt or "reminder matching assistant" in prompt:
+        return "none"
+    if "extracts reminder details" in prompt:
+        return json.dumps({"activity": "Stretching", "frequency_per_day": 2, "duration_minutes": 10,
+                           "total_days": 7, "preferred_times": ["09:00", "18:00"], "notes": ""})
+    if "running summary" in prompt:
+        return "The patient is recovering from surgery and asked about symptoms and medication."
+    return "Keep resting, follow your physiotherapy plan and contact your GP if the symptoms get worse."
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Stand-in for ChatGroq: sleeps `latency` seconds and returns scripted_reply()
+    with token usage estimated from the text length.
+    """
+    model_name: str = "fake-llama"
+    temperature: float = 0.4
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    def _result(self, messages):
+        prompt = "\n".join(str(m.content) for m in messages)
+        content = scripted_reply(prompt)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        import asyncio
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+def install_fake_llm(latency: float):
+    """Makes GroqChat build FakeChatModel instances instead of ChatGroq."""
+    import app.GroqChat
+
+    def fake_chat_groq(groq_api_key=None, temperature=0.4, model="fake-llama", **kwargs):
+        setup_span("chat_model")
+        return FakeChatModel(model_name=model, temperature=temperature or 1e-08, latency=latency)
+
+    app.GroqChat.ChatGroq = fake_chat_groq
+    # Chat models are shared per process; drop any built before the patch
+    app.GroqChat._chat_models.clear()
+
+
+def setup_span(name):
+    """Exports a zero-length "setup.<name>" span, to count constructions per turn."""
+    from app.Tracing import current_context, record_span
+    parent = current_context()
+    if parent is not None:
+        now = time.time_ns()
+        record_span(f"setup.{name}", "internal", now, now, parent)
+
+
+def install_record_counter():
+    """Counts patient record loads (cache lookups included) as setup.record_load spans."""
+    from app.MedicalRecordManager import MedicalRecordManager
+    load_record, aload_record = MedicalRecordManager.load_record, MedicalRecordManager.aload_record
+
+    @functools.wraps(load_record)
+    def counted_load(self, *args, **kwargs):
+        setup_span("record_load")
+        return load_record(self, *args, **kwargs)
+
+    @functools.wraps(aload_record)
+    async def counted_aload(self, *args, **kwargs):
+        setup_span("record_load")
+        return await aload_record(self, *args, **kwargs)
+
+    MedicalRecordManager.load_record, MedicalRecordManager.aload_record = counted_load, counted_aload
+
+
+# Fake Mongo
+
+def mongomock_bulk_write(self, requests, ordered=True, **kwargs):
+    """
+    bulk_write for mongomock collections: applies pymongo 4's InsertOne,
+    UpdateOne/UpdateMany, ReplaceOne and DeleteOne/DeleteMany one by one
+    (mongomock's own implementation rejects their newer arguments).
+    """
+    # The unwrapped methods, so a bulk write counts as one DB call
+    insert_one, update_one, update_many, replace_one, delete_one, delete_many = (
+        functools.partial(_MONGOMOCK_METHODS[name], self)
+        for name in ("insert_one", "update_one", "update_many", "replace_one", "delete_one", "delete_many")
+    )
+    counts = Counter()
+    for request in requests:
+        kind = type(request).__name__
+        if kind == "InsertOne":
+            insert_one(request._doc)
+            counts["inserted"] += 1
+            continue
+        if kind in ("DeleteOne", "DeleteMany"):
+            method = delete_one if kind == "DeleteOne" else delete_many
+            counts["deleted"] += method(request._filter).deleted_count
+            continue
+        if kind == "ReplaceOne":
+            result = replace_one(request._filter, request._doc, upsert=request._upsert)
+        elif kind == "UpdateOne":
+            result = update_one(request._filter, request._doc, upsert=request._upsert)
+        else:
+            result = update_many(request._filter, request._doc, upsert=request._upsert)
+        counts["matched"] += result.matched_count
+        counts["modified"] += result.modified_count
+        counts["upserted"] += 1 if result.upserted_id is not None else 0
+    return SimpleNamespace(
+        acknowledged=True, inserted_count=counts["inserted"], matched_count=counts["matched"],
+        modified_count=counts["modified"], deleted_count=counts["deleted"], upserted_count=counts["upserted"],
+    )
+
+
+def counted(name, method):
+    """Wraps a mongomock collection method so each call is exported as a mongo.<name> span."""
+    from app.Tracing import current_context, record_span
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        parent = current_context()
+        start_ns = time.time_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            if parent is not None:
+                record_span(f"mongo.{name}", "client", start_ns, time.time_ns(), parent,
+                            **{"db.system": "mongomock", "db.collection": self.name})
+    return wrapper
+
+
+def install_mongomock():
+    """Registers a mongomock client as the shared client for MONGO_URI."""
+    from data.DataBaseManager import DatabaseManager
+    collection_class = mongomock.collection.Collection
+    if not _MONGOMOCK_METHODS:
+        _MONGOMOCK_METHODS.update({name: getattr(collection_class, name) for name in DB_METHODS})
+    collection_class.bulk_write = mongomock_bulk_write
+    for name in DB_METHODS:
+        setattr(collection_class, name, counted(name, getattr(collection_class, name)))
+    client = mongomock.MongoClient(tz_aware=True)
+    DatabaseManager._clients[MONGO_URI] = client
+    return client
+
+
+# Fake NHS patients API
+
+def synthetic_patient(i: int) -> dict:
+    surgery_date = (datetime.now(ZoneInfo("Europe/London")) - timedelta(days=2 + i % 10)).strftime("%Y-%m-%d")
+    return {
+        "patient_id": f"patient{i:04d}",
+        "name": f"Patient {i}",
+        "age": 40 + i % 40,
+        "gender": "female" if i % 2 else "male",
+        "phone": f"+4477000{i:05d}",
+        "surgery": SURGERIES[i % len(SURGERIES)],
+        "surgery_date": surgery_date,
+        "medications": MEDICATIONS,
+        "allergies": ["Penicillin"] if i % 3 == 0 else [],
+        "pre_existing_conditions": [{"name": "Hypertension"}] if i % 4 == 0 else [],
+        "past_medical_history": [],
+        "post_surgery_recommendations": {"activity": "Walk twice a day"},
+        "follow_up_appointments": [],
+    }
+
+
+class PatientAPIStandIn:
+    """
+    Threaded local server for the mock NHS patients endpoint
+    (GET /patients?patient_id=...), with ETag revalidation.
+    """
+    def __init__(self, patients: dict, latency: float = 0.0):
+        self.patients = patients
+        self.latency = latency
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                time.sleep(stand_in.latency)
+                patient_id = parse_qs(urlparse(self.path).query).get("patient_id", [""])[0]
+                record = stand_in.patients.get(patient_id)
+                body = json.dumps([record] if record else []).encode("utf-8")
+                etag = f'"{hash(body) & 0xffffffff:x}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                if self.command == "GET" and body and not self.headers.get("If-None-Match") == etag:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/patients"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Setup
+
+def configure(args, workdir):
+    """Installs fake secrets, LLM, Mongo and the NHS guidance index."""
+    from app.NHSGuidanceIndex import NHSGuidanceIndex
+    index_path = os.path.join(workdir, "nhs_guidance_index.json.gz")
+    index = NHSGuidanceIndex()
+    index.ingest_directory(FIXTURES)
+    index.save(index_path)
+    st.secrets = {
+        "MONGO_URI": MONGO_URI,
+        "GROQ_API_KEY": "offline",
+        "NHS_INDEX_PATH": index_path,
+        "NHS_HTTP_CACHE_DIR": os.path.join(workdir, "nhs_cache"),
+        "TRACE_PATH": "",
+        "SMS_TRANSPORT": "fake",
+        "INTENT_SHADOW_RATE": 0.0,
+    }
+    # There is no Streamlit script run here; its session/context warnings are expected
+    for name in ("streamlit.runtime.scriptrunner_utils.script_run_context",
+                 "streamlit.runtime.state.session_state_proxy"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    install_fake_llm(args.llm_latency)
+    install_record_counter()
+    return install_mongomock()
+
+
+def seed_patients(patient_ids):
+    """Creates the medication, routine and appointment trackers of every patient."""
+    from app.AppointmentManager import AppointmentManager
+    from app.MedicationScheduleManager import MedicationScheduleManager
+    from app.RecurrenceRule import build_rule
+    from data.DataBaseManager import DatabaseManager
+    db = DatabaseManager()
+    today = datetime.now(ZoneInfo("Europe/London"))
+    for patient_id in patient_ids:
+        MedicationScheduleManager(patient_id).create_tracker_from_history()
+        db.get_collection("routineTracker").insert_one(build_rule(
+            patient_id, today.strftime("%Y-%m-%d"), ["09:00", "14:00", today.strftime("%H:%M")], 14,
+            {"activity": "Knee stretches", "duration_minutes": 10, "type": "doctor"},
+        ))
+        AppointmentManager(patient_id).save_appointment_tracker([{
+            "date": (today + timedelta(days=1)).strftime("%Y-%m-%d"), "time": "10:30",
+            "department": "Orthopaedics", "clinician": "Dr Smith", "reason": "Wound check",
+            "completed": False, "reminder_sent": False,
+        }])
+
+
+def pick_messages(turns: int, seed: int) -> list:
+    rng = random.Random(seed)
+    population = [(message, route) for message, route, weight in MESSAGE_MIX for _ in range(weight)]
+    return [rng.choice(population) for _ in range(turns)]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+
+def run(args) -> dict:
+    """
+    Runs the load test.
+
+    Returns:
+        dict: Totals and per-route statistics.
+    """
+    from app.Tracing import MemorySpanExporter, set_exporter, span
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(args, workdir)
+        patients = {f"patient{i:04d}": synthetic_patient(i) for i in range(args.patients)}
+        with PatientAPIStandIn(patients, args.api_latency) as api:
+            import app.MedicalRecordManager
+            app.MedicalRecordManager.NHS_API_URL = api.url
+            seed_patients(list(patients))
+            from graph.LangGraph import build_graph
+            graph = build_graph()
+            messages = pick_messages(args.turns, args.seed)
+            patient_ids = list(patients)
+
+            exporter = MemorySpanExporter()
+            set_exporter(exporter)
+            errors = []
+            routed = Counter()
+
+            def turn(i):
+                message, expected = messages[i]
+                username = patient_ids[i % len(patient_ids)]
+                with span("loadtest.turn", "server", expected_route=expected) as root:
+                    try:
+                        graph.invoke({"input": message, "output": "", "username": username,
+                                      "reminder": "", "trace": root.context()})
+                    except Exception as e:
+                        errors.append(f"{expected}: {type(e).__name__}: {e}")
+                        root.status = "error"
+
+            # Keep the agents' prints out of the report
+            stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+            started = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(args.concurrency) as pool:
+                    list(pool.map(turn, range(args.turns)))
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            elapsed = time.perf_counter() - started
+            set_exporter(None)
+
+    spans = exporter.spans
+    route_of = {s["trace_id"]: s["attributes"]["route"] for s in spans
+                if s["name"] == "node:classify_intent" and "route" in s["attributes"]}
+    calls = defaultdict(Counter)
+    for s in spans:
+        kind = s["name"].split(".")[0].split(":")[0]
+        if kind == "setup":
+            calls[s["trace_id"]][s["name"]] += 1
+        elif kind in ("llm", "mongo", "http"):
+            calls[s["trace_id"]][kind] += 1
+            calls[s["trace_id"]]["tokens"] += s["attributes"].get("total_tokens", 0) or 0
+    by_route = defaultdict(list)
+    for s in spans:
+        if s["name"] == "loadtest.turn":
+            route = route_of.get(s["trace_id"], "unrouted")
+            routed[(s["attributes"]["expected_route"], route)] += 1
+            by_route[route].append((s["duration_ms"], calls[s["trace_id"]]))
+
+    routes = {}
+    for route, rows in sorted(by_route.items()):
+        durations = [ms for ms, _ in rows]
+        routes[route] = {
+            "turns": len(rows),
+            "p50_ms": round(percentile(durations, 50), 1),
+            "p95_ms": round(percentile(durations, 95), 1),
+            "p99_ms": round(percentile(durations, 99), 1),
+            "llm_calls": round(statistics.mean(c["llm"] for _, c in rows), 2),
+            "db_calls": round(statistics.mean(c["mongo"] for _, c in rows), 2),
+            "http_calls": round(statistics.mean(c["http"] for _, c in rows), 2),
+            "record_loads": round(statistics.mean(c["setup.record_load"] for _, c in rows), 2),
+            "chat_models": round(statistics.mean(c["setup.chat_model"] for _, c in rows), 2),
+            "tokens": round(statistics.mean(c["tokens"] for _, c in rows)),
+        }
+    all_durations = [ms for rows in by_route.values() for ms, _ in rows]
+    return {
+        "turns": args.turns,
+        "errors": errors,
+        "misrouted": sum(n for (expected, route), n in routed.items() if expected != route),
+        "elapsed_s": round(elapsed, 2),
+        "throughput": round(args.turns / elapsed, 1),
+        "p50_ms": round(percentile(all_durations, 50), 1),
+        "p95_ms": round(percentile(all_durations, 95), 1),
+        "p99_ms": round(percentile(all_durations, 99), 1),
+        "routes": routes,
+    }
+
+
+def print_report(result, args):
+    print(f"{args.turns} turns, {args.patients} patients, concurrency {args.concurrency}, "
+          f"LLM latency {args.llm_latency * 1000:.0f} ms, API latency {args.api_latency * 1000:.0f} ms")
+    print(f"throughput {result['throughput']} turns/s in {result['elapsed_s']} s   "
+          f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms   "
+          f"errors {len(result['errors'])}  misrouted {result['misrouted']}")
+    print(f"{'route':<28}{'turns':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'LLM/turn':>10}{'DB/turn':>9}"
+          f"{'HTTP/turn':>10}{'tokens':>8}{'records':>9}{'models':>8}")
+    for route, row in result["routes"].items():
+        print(f"{route:<28}{row['turns']:>6}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+              f"{row['llm_calls']:>10}{row['db_calls']:>9}{row['http_calls']:>10}{row['tokens']:>8}"
+              f"{row['record_loads']:>9}{row['chat_models']:>8}")
+    for error in result["errors"][:5]:
+        print("error:", error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the agent graph.")
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call.")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="Seconds per patients API request.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON.")
+    args = parser.parse_args(argv)
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, args)
+    return result
+
+
+if __name__ == "__main__":
+    main()
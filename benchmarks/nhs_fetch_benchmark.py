@@ -0,0 +1,219 @@
+"""
+Benchmarks the live NHS guidance fallback against a local stand-in for nhs.uk.
+
+The stand-in serves a search results page and the article fixtures from
+tests/fixtures/nhs_pages, padded with header/navigation/footer markup to the
+size of real nhs.uk pages, after a fixed delay per request. It sends an ETag
+and a Cache-Control header and answers If-None-Match with 304.
+
+Compared pipelines (search page + top 2 articles, parsed to text):
+- baseline: the previous code, sequential requests.get per page without a
+  session and a full html.parser parse of every page;
+- fetcher cold: NHSPageFetcher with an empty cache (keep-alive session,
+  concurrent article downloads, <article>-only parse);
+- fetcher revalidate: cached pages served after a conditional request (304);
+- fetcher warm: fresh cached pages, no request at all.
+
+    python -m benchmarks.nhs_fetch_benchmark --latency 0.08 --rounds 20
+"""
+import argparse
+import hashlib
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import requests
+from bs4 import BeautifulSoup
+
+from app.NHSGuidanceIndex import NHS_BASE_URL, NHS_RECOVERY_KEYWORDS, parse_nhs_links, parse_page_text
+from app.NHSPageFetcher import NHSPageFetcher
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "nhs_pages")
+PAGES = {
+    "/tests-and-treatments/knee-replacement/recovery/": "knee-replacement-recovery.html",
+    "/tests-and-treatments/knee-replacement/risks/": "hip-replacement-risks.html",
+    "/tests-and-treatments/wound-infection/": "wound-infection.html",
+}
+SEARCH_PATH = "/search/results"
+
+
+def site_chrome(size: int = 120_000) -> tuple:
+    """Header/navigation and footer markup of roughly `size` characters in total."""
+    links, i = [], 0
+    while sum(len(link) for link in links) < size:
+        links.append(f'<li class="nhsuk-list-item"><a href="/conditions/topic-{i}/">Health topic {i}</a></li>')
+        i += 1
+    half = len(links) // 2
+    return (
+        f'<header><nav><ul>{"".join(links[:half])}</ul></nav></header>',
+        f'<footer><ul>{"".join(links[half:])}</ul></footer>',
+    )
+
+
+def build_site(chrome_size: int = 120_000) -> dict:
+    """Returns path -> HTML for the stand-in site."""
+    header, footer = site_chrome(chrome_size)
+    site = {}
+    for path, name in PAGES.items():
+        with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+            html = f.read()
+        site[path] = html.replace("<body>", "<body>" + header).replace("</body>", footer + "</body>")
+    results = "".join(
+        f'<a class="app-search-results-item" href="/search/click?url={path}&amp;position={i}">{path}</a>'
+        for i, path in enumerate(PAGES)
+    )
+    site[SEARCH_PATH] = f"<html><body>{header}<main>{results}</main>{footer}</body></html>"
+    return site
+
+
+class NHSStandIn:
+    """
+    Threaded local HTTP server standing in for nhs.uk.
+
+    Attributes:
+        latency (float): Seconds slept before every response.
+        cache_control (str): Cache-Control header sent with every page.
+        requests (int): Number of requests served.
+    """
+    def __init__(self, latency: float = 0.08, cache_control: str = "max-age=3600", chrome_size: int = 120_000):
+        self.latency = latency
+        self.cache_control = cache_control
+        self.site = build_site(chrome_size)
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stand_in.requests += 1
+                time.sleep(stand_in.latency)
+                body = stand_in.site.get(self.path.split("?")[0])
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = '"%s"' % hashlib.md5(body.encode("utf-8")).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", stand_in.cache_control)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", stand_in.cache_control)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def local(base_url, urls):
+    return [url.replace(NHS_BASE_URL, base_url) for url in urls]
+
+
+def baseline(base_url, n=2):
+    # Previous implementation: sequential requests.get and full html.parser parses
+    html = requests.get(base_url + SEARCH_PATH + "?q=knee+replacement").text
+    links = []
+    for a in BeautifulSoup(html, "html.parser").select("a.app-search-results-item"):
+        match = re.search(r"url=([^&]+)", a.get("href", ""))
+        if match and any(kw in match.group(1) for kw in NHS_RECOVERY_KEYWORDS):
+            links.append(base_url + unquote(match.group(1)))
+        if len(links) >= n:
+            break
+    texts = []
+    for link in links:
+        page = BeautifulSoup(requests.get(link).text, "html.parser")
+        texts.append("\n".join(p.get_text(" ", strip=True) for p in page.select("article p, article li, article h2")))
+    return "\n".join(texts)
+
+
+def with_fetcher(fetcher, base_url, n=2):
+    links = local(base_url, parse_nhs_links(fetcher.fetch(base_url + SEARCH_PATH + "?q=knee+replacement"), n))
+    return "\n".join(parse_page_text(page) for page in fetcher.fetch_many(links))
+
+
+def measure(run, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name, timings, requests_served):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<22} p50 {statistics.median(timings):8.1f} ms   p95 {p95:8.1f} ms   requests/run {requests_served:5.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.08, help="Seconds the stand-in waits per request.")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with NHSStandIn(args.latency) as site:
+        print(f"Stand-in nhs.uk at {site.base_url}, {args.latency * 1000:.0f} ms per request, "
+              f"{len(site.site[SEARCH_PATH]) // 1024} KB pages")
+        expected = baseline(site.base_url)
+
+        def run(name, fn):
+            before = site.requests
+            timings = measure(fn, args.rounds)
+            report(name, timings, (site.requests - before) / args.rounds)
+
+        run("baseline", lambda: baseline(site.base_url))
+
+        def cold():
+            with tempfile.TemporaryDirectory() as cache_dir:
+                assert with_fetcher(NHSPageFetcher(cache_dir), site.base_url) == expected
+        run("fetcher cold", cold)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            site.cache_control = "no-cache"
+            fetcher = NHSPageFetcher(cache_dir)
+            with_fetcher(fetcher, site.base_url)
+            run("fetcher revalidate", lambda: with_fetcher(fetcher, site.base_url))
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            site.cache_control = "max-age=3600"
+            fetcher = NHSPageFetcher(cache_dir)
+            with_fetcher(fetcher, site.base_url)
+            run("fetcher warm", lambda: with_fetcher(fetcher, site.base_url))
+
+        html = site.site["/tests-and-treatments/knee-replacement/recovery/"]
+        full = measure(lambda: BeautifulSoup(html, "html.parser").select("article p, article li, article h2"), args.rounds)
+        strained = measure(lambda: parse_page_text(html), args.rounds)
+        print(f"parse one page         html.parser full {statistics.median(full):6.1f} ms   "
+              f"<article> only {statistics.median(strained):6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
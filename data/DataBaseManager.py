@@ -1,24 +1,291 @@
+import asyncio
+import atexit
+import threading
 import streamlit as st
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo import monitoring
+from app.Tracing import MongoCommandTracer
+
+# Default pool settings, overridable through st.secrets
+DEFAULT_MAX_POOL_SIZE = 50
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_MAX_IDLE_TIME_MS = 60000
+DEFAULT_WAIT_QUEUE_TIMEOUT_MS = 5000
+
+# Exports a span per command issued inside a traced chat turn
+COMMAND_TRACER = MongoCommandTracer()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Collects connection pool counters for a shared MongoClient.
+
+    Attributes:
+        checkouts (int): Connections successfully checked out of the pool.
+        checkout_failures (int): Check-outs that failed (timeout, pool closed, error).
+        waits (int): Check-outs that started while every open socket was in use.
+        total_wait_ms (float): Accumulated time spent waiting for a connection.
+        created (int): Sockets opened by the pool.
+        closed (int): Sockets closed by the pool (including idle reaping).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.checkout_failures = 0
+        self.waits = 0
+        self.total_wait_ms = 0.0
+        self.created = 0
+        self.closed = 0
+        self.pool_clears = 0
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the current counters.
+
+        Returns:
+            dict: Counters plus derived 'open_sockets' and 'in_use' values.
+        """
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checkout_failures": self.checkout_failures,
+                "waits": self.waits,
+                "total_wait_ms": round(self.total_wait_ms, 3),
+                "open_sockets": self.created - self.closed,
+                "in_use": self.checkouts - self.checkins,
+                "pool_clears": self.pool_clears,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            # No idle socket available: the caller has to wait for one
+            if self.checkouts - self.checkins >= self.created - self.closed:
+                self.waits += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            if event.duration is not None:
+                self.total_wait_ms += event.duration * 1000
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+
+
+def client_options() -> dict:
+    """
+    Pool and codec options shared by the sync and async clients.
+
+    Pool sizing can be tuned through the optional secrets MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS and MONGO_WAIT_QUEUE_TIMEOUT_MS.
+
+    Returns:
+        dict: Keyword arguments for MongoClient / AsyncMongoClient.
+    """
+    return {
+        "maxPoolSize": int(st.secrets.get("MONGO_MAX_POOL_SIZE", DEFAULT_MAX_POOL_SIZE)),
+        "minPoolSize": int(st.secrets.get("MONGO_MIN_POOL_SIZE", DEFAULT_MIN_POOL_SIZE)),
+        "maxIdleTimeMS": int(st.secrets.get("MONGO_MAX_IDLE_TIME_MS", DEFAULT_MAX_IDLE_TIME_MS)),
+        "waitQueueTimeoutMS": int(st.secrets.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", DEFAULT_WAIT_QUEUE_TIMEOUT_MS)),
+        "tz_aware": True,
+    }
+
 
 class DatabaseManager:
     """
     Manages the connection to the MongoDB database for the application.
 
+    A single MongoClient (and therefore a single connection pool) is shared by
+    every DatabaseManager in the process, so managers can be created per request
+    without paying a new TCP+TLS handshake each time.
+
     Attributes:
-        client (MongoClient): The MongoDB client instance.
+        client (MongoClient): The shared MongoDB client instance.
         db: The database object for 'naia_db'.
     """
-    def __init__(self):
+    _clients = {}
+    _listeners = {}
+    _lock = threading.Lock()
+    _atexit_registered = False
+
+    def __init__(self, db_name: str = "naia_db"):
         """
-        Manages the connection to the MongoDB database for the application.
+        Gets the shared client for the configured URI and opens the database.
 
-        Attributes:
-            client (MongoClient): The MongoDB client instance.
-            db: The database object for 'naia_db'.
+        Args:
+            db_name (str): Name of the database to use. Defaults to 'naia_db'.
         """
-        self.client = MongoClient(st.secrets["MONGO_URI"])
-        self.db = self.client["naia_db"]
+        self.client = DatabaseManager.get_client(st.secrets["MONGO_URI"])
+        self.db = self.client[db_name]
 
     def get_collection(self, name):
         return self.db[name]
+
+    @classmethod
+    def get_client(cls, uri: str) -> MongoClient:
+        """
+        Returns the process-wide MongoClient for a URI, creating it on first use.
+
+        Pool sizing comes from client_options(). Idle sockets are reaped by the
+        driver after MONGO_MAX_IDLE_TIME_MS.
+
+        Args:
+            uri (str): MongoDB connection string.
+
+        Returns:
+            MongoClient: The shared client.
+        """
+        client = cls._clients.get(uri)
+        if client is not None:
+            return client
+        with cls._lock:
+            client = cls._clients.get(uri)
+            if client is None:
+                listener = PoolStatsListener()
+                client = MongoClient(uri, event_listeners=[listener, COMMAND_TRACER], **client_options())
+                cls._clients[uri] = client
+                cls._listeners[uri] = listener
+                if not cls._atexit_registered:
+                    atexit.register(cls.close_all)
+                    cls._atexit_registered = True
+        return client
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """
+        Returns connection pool counters for every shared client.
+
+        Returns:
+            dict: Mapping of the URI (without credentials) to its counters.
+        """
+        with cls._lock:
+            listeners = list(cls._listeners.items())
+        return {uri.split("@")[-1]: listener.snapshot() for uri, listener in listeners}
+
+    @classmethod
+    def close_all(cls):
+        """
+        Closes every shared client and its pool. Safe to call more than once.
+        """
+        with cls._lock:
+            clients = list(cls._clients.values())
+            cls._clients.clear()
+            cls._listeners.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                print(f"Error closing MongoDB client: {e}")
+
+
+class AsyncDatabaseManager:
+    """
+    Async counterpart of DatabaseManager, backed by pymongo's AsyncMongoClient.
+
+    An AsyncMongoClient is bound to the event loop it is first used on, so the
+    registry is keyed by (URI, running loop). In practice every async node runs
+    on the single background loop from app.Utilities, so one client per URI is
+    shared by all concurrent patients.
+
+    Attributes:
+        client (AsyncMongoClient): The shared async client for the current loop.
+        db: The async database object for 'naia_db'.
+    """
+    _clients = {}
+    _listeners = {}
+    _lock = threading.Lock()
+
+    def __init__(self, db_name: str = "naia_db"):
+        """
+        Gets the shared async client for the configured URI and the running loop.
+        Must be created from inside a coroutine.
+
+        Args:
+            db_name (str): Name of the database to use. Defaults to 'naia_db'.
+        """
+        self.client = AsyncDatabaseManager.get_client(st.secrets["MONGO_URI"])
+        self.db = self.client[db_name]
+
+    def get_collection(self, name):
+        return self.db[name]
+
+    @classmethod
+    def get_client(cls, uri: str) -> AsyncMongoClient:
+        """
+        Returns the AsyncMongoClient for a URI on the running loop, creating it on first use.
+
+        Args:
+            uri (str): MongoDB connection string.
+
+        Returns:
+            AsyncMongoClient: The shared async client.
+        """
+        key = (uri, asyncio.get_running_loop())
+        with cls._lock:
+            client = cls._clients.get(key)
+            if client is None:
+                listener = PoolStatsListener()
+                client = AsyncMongoClient(uri, event_listeners=[listener, COMMAND_TRACER], **client_options())
+                cls._clients[key] = client
+                cls._listeners[key] = listener
+        return client
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """
+        Returns connection pool counters for every async client.
+
+        Returns:
+            dict: Mapping of the URI (without credentials) to its counters.
+        """
+        with cls._lock:
+            listeners = list(cls._listeners.items())
+        return {key[0].split("@")[-1]: listener.snapshot() for key, listener in listeners}
+
+    @classmethod
+    async def close_all(cls):
+        """
+        Closes the async clients bound to the running loop.
+        """
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            keys = [key for key in cls._clients if key[1] is loop]
+            clients = [cls._clients.pop(key) for key in keys]
+            for key in keys:
+                cls._listeners.pop(key, None)
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"Error closing async MongoDB client: {e}")
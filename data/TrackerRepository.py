@@ -0,0 +1,187 @@
+from datetime import datetime
+from typing import TypedDict
+from bson.raw_bson import RawBSONDocument
+from data.DataBaseManager import AsyncDatabaseManager, DatabaseManager
+
+# Fields expand_tracker needs to turn a recurrence rule into rows (app.RecurrenceRule)
+RULE_FIELDS = ("id", "patient_id", "kind", "start", "interval_days", "times", "count", "done")
+# Fields expand_rule sets on every occurrence; the other row fields come from the rule's item
+OCCURRENCE_FIELDS = ("id", "patient_id", "date", "time", "due_at", "taken", "completed")
+# Views only read by the reminder checks, decoded lazily as RawBSONDocument when the client allows it
+RAW_VIEWS = ("reminder",)
+
+
+class MedicationDose(TypedDict, total=False):
+    """One dose of the medicationTracker collection, as read or expanded from a rule."""
+    id: str
+    date: str
+    time: str
+    taken: bool
+    due_at: datetime
+    med_name: str
+    dose: str
+    frequency: str
+
+
+class RoutineEntry(TypedDict, total=False):
+    """One routine/check-up entry of the routineTracker collection."""
+    id: str
+    date: str
+    time: str
+    completed: bool
+    due_at: datetime
+    activity: str
+    duration_minutes: int
+    type: str
+    notes: str
+    created_by_patient: bool
+
+
+class AppointmentEntry(TypedDict, total=False):
+    """One follow-up appointment of the appointmentTracker collection."""
+    id: str
+    date: str
+    time: str
+    completed: bool
+    due_at: datetime
+    reason: str
+    department: str
+    clinician: str
+    location: str
+    reminder_sent: bool
+
+
+class SymptomEntry(TypedDict, total=False):
+    """One symptom report of the symptomTracker collection."""
+    timestamp: str
+    symptoms: list
+    overall_severity: str
+
+
+def projection(*fields, keep_id=False) -> dict:
+    """
+    Inclusion projection of the given fields; '_id' is left out unless keep_id.
+    """
+    return {"_id": 1 if keep_id else 0, **dict.fromkeys(fields, 1)}
+
+def rule_projection(*fields, keep_id=False) -> dict:
+    """
+    projection() for a tracker that stores recurrence rules: the rule fields
+    are kept too, and the row fields that rules hold in 'item' as item.<field>.
+    """
+    item_fields = [f"item.{field}" for field in fields if field not in OCCURRENCE_FIELDS]
+    return projection(*RULE_FIELDS, *fields, *item_fields, keep_id=keep_id)
+
+
+# Fields read per collection and use case. The pages edit and display whole
+# rows, so they only drop '_id'. The reminder views keep '_id' where the
+# reminder scheduler falls back to it for rows stored without an 'id'.
+PROJECTIONS = {
+    "medicationTracker": {
+        "reminder": rule_projection("date", "time", "taken", "due_at", "med_name", "dose", keep_id=True),
+        "prompt": rule_projection("date", "time", "taken", "med_name", "dose"),
+        "page": {"_id": 0},
+    },
+    "routineTracker": {
+        "reminder": rule_projection("date", "time", "completed", "due_at", "activity", "duration_minutes"),
+        "prompt": rule_projection(
+            "date", "time", "completed", "activity", "duration_minutes", "type", "notes", "created_by_patient"
+        ),
+        "page": {"_id": 0},
+    },
+    "appointmentTracker": {
+        "reminder": projection(
+            "id", "date", "time", "completed", "due_at", "reason", "department", "clinician", "location",
+            "reminder_sent", keep_id=True,
+        ),
+        "page": {"_id": 0},
+    },
+    "symptomTracker": {
+        "prompt": projection("timestamp", "symptoms", "overall_severity"),
+        "page": {"_id": 0},
+    },
+}
+
+
+def raw_collection(collection):
+    """
+    Returns the collection decoding documents as RawBSONDocument, which keeps
+    the BSON bytes and only decodes a document (and each embedded document)
+    when it is first read. Clients without custom document classes (mongomock)
+    get the collection back unchanged.
+
+    Args:
+        collection: A pymongo Collection or AsyncCollection.
+
+    Returns:
+        The raw-decoding collection, or `collection` itself.
+    """
+    try:
+        codec_options = collection.codec_options.with_options(document_class=RawBSONDocument)
+        return collection.with_options(codec_options=codec_options)
+    except NotImplementedError:
+        return collection
+
+
+class TrackerRepository:
+    """
+    Projected reads of one patient data collection.
+
+    Each read names a view ('reminder', 'prompt' or 'page', see PROJECTIONS)
+    so only the fields that use case needs cross the network, without '_id'.
+    The reminder views are read-only and decoded lazily (see raw_collection).
+    Writes still go through the managers' collections.
+
+    Attributes:
+        name (str): Collection name, a key of PROJECTIONS.
+        collection (pymongo.collection.Collection): Sync handle on the collection.
+    """
+    def __init__(self, name: str, collection=None):
+        """
+        Args:
+            name (str): Collection name, e.g. 'medicationTracker'.
+            collection (optional): Sync collection to read from; defaults to the
+                shared DatabaseManager one.
+        """
+        self.name = name
+        self.collection = collection if collection is not None else DatabaseManager().get_collection(name)
+        self._raw_collection = None
+
+    def projection(self, view: str) -> dict:
+        """The projection of a view of this collection; raises KeyError for unknown views."""
+        return PROJECTIONS[self.name][view]
+
+    def find(self, query: dict, view: str, sort=None) -> list:
+        """
+        Reads the documents matching a query with the projection of a view.
+
+        Args:
+            query (dict): MongoDB filter.
+            view (str): 'reminder', 'prompt' or 'page'.
+            sort (list[tuple], optional): Sort specification, e.g. [("due_at", 1)].
+
+        Returns:
+            list: The projected documents (RawBSONDocument for the reminder views
+                when the client supports it, dicts otherwise).
+        """
+        cursor = self._sync_collection(view).find(query, self.projection(view))
+        if sort:
+            cursor = cursor.sort(sort)
+        return list(cursor)
+
+    async def afind(self, query: dict, view: str, sort=None) -> list:
+        """Async version of find; only usable inside a coroutine."""
+        collection = AsyncDatabaseManager().get_collection(self.name)
+        if view in RAW_VIEWS:
+            collection = raw_collection(collection)
+        cursor = collection.find(query, self.projection(view))
+        if sort:
+            cursor = cursor.sort(sort)
+        return await cursor.to_list(None)
+
+    def _sync_collection(self, view: str):
+        if view not in RAW_VIEWS:
+            return self.collection
+        if self._raw_collection is None:
+            self._raw_collection = raw_collection(self.collection)
+        return self._raw_collection
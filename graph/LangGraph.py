@@ -1,40 +1,50 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import pymongo
 from langgraph.graph import StateGraph
-from agents.NaiaAgent import classify_intent
-
-from agents.ReminderAgent import handle_reminder_medication_query
-from agents.ReminderAgent import handle_reminder_recovery_query
-from agents.ChatAgent import handle_chat
-from agents.SymptomAgent import handle_symptom_query
-from agents.MedicalRecordAgent import handle_medical_record_query
-from agents.HealthRecommendationAgent import handle_recommendation_query
+from agents.NaiaAgent import classify_intent, aclassify_intent
+
+from agents.ReminderAgent import handle_reminder_medication_query, ahandle_reminder_medication_query
+from agents.ReminderAgent import handle_reminder_recovery_query, ahandle_reminder_recovery_query
+from agents.ChatAgent import handle_chat, ahandle_chat
+from agents.SymptomAgent import handle_symptom_query, ahandle_symptom_query
+from agents.MedicalRecordAgent import handle_medical_record_query, ahandle_medical_record_query
+from agents.HealthRecommendationAgent import handle_recommendation_query, ahandle_recommendation_query
 from typing import TypedDict
 from agents.AgentState import AgentState
+from app.Tracing import traced_node
 
-from app.MedicationScheduleManager import MedicationScheduleManager
-from app.RecoveryCheckUpScheduleManager import RecoveryCheckUpScheduleManager
-from app.AppointmentManager import AppointmentManager
+from app.DatabaseSetup import ensure_database_ready
+from app.RequestContext import get_request_context
     
 # the node acts as a router: should be declared before the nodes it routes to
 def router_node(state: AgentState) -> AgentState:
     # Just pass the state so that LangGraph can use classify_intent to decide which node to go to
     return state
 
+async def arouter_node(state: AgentState) -> AgentState:
+    return state
+
 def build_graph():
+    # Indexes and migrations are prepared here, before the first turn, not inside one
+    ensure_database_ready()
     builder = StateGraph(AgentState)
 
     # Node that checks for pending medication reminders
-    builder.add_node("check_reminder", check_reminder_node)
+    builder.add_node("check_reminder", traced_node("check_reminder", check_reminder_node))
 
     # Add the router node
-    builder.add_node("router", router_node)
+    builder.add_node("router", traced_node("router", router_node))
 
     # Agent nodes
-    builder.add_node("symptom_agent", handle_symptom_query)
-    builder.add_node("recommendation_agent", handle_recommendation_query)
-    builder.add_node("medical_record_agent", handle_medical_record_query)
-    builder.add_node("reminder_medication_agent", handle_reminder_medication_query)
-    builder.add_node("reminder_recovery_agent", handle_reminder_recovery_query)
-    builder.add_node("chat_agent", handle_chat)
+    builder.add_node("symptom_agent", traced_node("symptom_agent", handle_symptom_query))
+    builder.add_node("recommendation_agent", traced_node("recommendation_agent", handle_recommendation_query))
+    builder.add_node("medical_record_agent", traced_node("medical_record_agent", handle_medical_record_query))
+    builder.add_node("reminder_medication_agent", traced_node("reminder_medication_agent", handle_reminder_medication_query))
+    builder.add_node("reminder_recovery_agent", traced_node("reminder_recovery_agent", handle_reminder_recovery_query))
+    builder.add_node("chat_agent", traced_node("chat_agent", handle_chat))
 
     # The conditional decision comes from the router
     #builder.add_conditional_edges("router", classify_intent)
@@ -42,7 +52,7 @@ def build_graph():
     # Connections
     builder.add_edge("check_reminder", "router")  # check_reminder runs first
     # Define entry and exit points
-    builder.add_conditional_edges("router", classify_intent)    
+    builder.add_conditional_edges("router", traced_node("classify_intent", classify_intent))
     #builder.set_entry_point("router")
     builder.set_entry_point("check_reminder")
 
@@ -55,26 +65,177 @@ def build_graph():
 
     return builder.compile()
 
+def build_async_graph():
+    """
+    Builds the same graph as build_graph with coroutine nodes.
+
+    Nodes use Groq's ainvoke, the async Mongo driver and httpx, so one
+    process can serve many patients concurrently on a single event loop.
+    Run it with `await graph.ainvoke(state)`, e.g. through
+    app.Utilities.run_coroutine from a Streamlit script.
+
+    Call it outside the event loop: it prepares the database indexes first
+    (see app.DatabaseSetup), which blocks on the first call.
+
+    Returns:
+        CompiledStateGraph: The compiled async graph.
+    """
+    ensure_database_ready()
+    builder = StateGraph(AgentState)
+    builder.add_node("check_reminder", traced_node("check_reminder", acheck_reminder_node))
+    builder.add_node("router", traced_node("router", arouter_node))
+    builder.add_node("symptom_agent", traced_node("symptom_agent", ahandle_symptom_query))
+    builder.add_node("recommendation_agent", traced_node("recommendation_agent", ahandle_recommendation_query))
+    builder.add_node("medical_record_agent", traced_node("medical_record_agent", ahandle_medical_record_query))
+    builder.add_node("reminder_medication_agent", traced_node("reminder_medication_agent", ahandle_reminder_medication_query))
+    builder.add_node("reminder_recovery_agent", traced_node("reminder_recovery_agent", ahandle_reminder_recovery_query))
+    builder.add_node("chat_agent", traced_node("chat_agent", ahandle_chat))
+
+    builder.add_edge("check_reminder", "router")
+    builder.add_conditional_edges("router", traced_node("classify_intent", aclassify_intent))
+    builder.set_entry_point("check_reminder")
+
+    builder.set_finish_point("symptom_agent")
+    builder.set_finish_point("medical_record_agent")
+    builder.set_finish_point("recommendation_agent")
+    builder.set_finish_point("reminder_medication_agent")
+    builder.set_finish_point("reminder_recovery_agent")
+    builder.set_finish_point("chat_agent")
+
+    return builder.compile()
+
+# The checks take the turn's RequestContext, so the managers they build are
+# reused by the reminder agents later in the same turn
+def _check_medications(context):
+    return context.medication_manager.check_pending_medications()
+
+def _check_routines(context):
+    return context.recovery_manager.check_pending_routines()
+
+def _check_appointments(context):
+    return context.appointment_manager.check_upcoming_appointments()
+
+async def _acheck_medications(context):
+    return await context.medication_manager.acheck_pending_medications()
+
+async def _acheck_routines(context):
+    return await context.recovery_manager.acheck_pending_routines()
+
+async def _acheck_appointments(context):
+    return await context.appointment_manager.acheck_upcoming_appointments()
+
+# (source name, check function, heading shown above its reminders)
+REMINDER_SOURCES = [
+    ("medication", _check_medications, "💊 **Reminder**:\n"),
+    ("recovery", _check_routines, "🧘 **Recovery Tasks Due**:\n"),
+    ("appointment", _check_appointments, "📅 **Appointment Tomorrow**:\n"),
+]
+ASYNC_REMINDER_CHECKS = {
+    "medication": _acheck_medications,
+    "recovery": _acheck_routines,
+    "appointment": _acheck_appointments,
+}
+# A source slower than this is reported as "no reminder" for the current turn
+REMINDER_SOURCE_TIMEOUT_SECONDS = 2.0
+_reminder_executor = ThreadPoolExecutor(max_workers=12, thread_name_prefix="naia-reminders")
+
+def _timed_check(check_fn, context):
+    start = time.perf_counter()
+    # The Mongo calls share the source's deadline, so a timed-out check gives its worker back
+    with pymongo.timeout(REMINDER_SOURCE_TIMEOUT_SECONDS):
+        upcoming = check_fn(context)
+    return upcoming, (time.perf_counter() - start) * 1000
+
 def check_reminder_node(state: AgentState) -> AgentState:
-    username = state.get("username")
+    """
+    Checks medication, recovery and appointment reminders concurrently.
+
+    Each source runs in the shared reminder thread pool and gets
+    REMINDER_SOURCE_TIMEOUT_SECONDS to answer; a source that times out or
+    fails contributes no reminder instead of blocking the turn. The budget
+    only covers the due-window queries: indexes and migrations are prepared
+    before the first turn (app.DatabaseSetup).
+
+    Args:
+        state (AgentState): Current state containing the username.
+
+    Returns:
+        AgentState: State with 'reminder' text and per-source 'reminder_timings'
+                    ({source: {"status": "ok" | "timeout" | "error", "ms": float}}),
+                    and the turn's 'context' (created here if the caller passed none).
+    """
+    context = get_request_context(state)
+    futures = {
+        # copy_context keeps the pool threads' Mongo calls in this turn's trace
+        name: _reminder_executor.submit(contextvars.copy_context().run, _timed_check, check_fn, context)
+        for name, check_fn, _ in REMINDER_SOURCES
+    }
+    wait_start = time.perf_counter()
+    done, _ = wait(futures.values(), timeout=REMINDER_SOURCE_TIMEOUT_SECONDS)
+    waited_ms = round((time.perf_counter() - wait_start) * 1000, 1)
+
     reminder_msg = ""
-    
-    # Medication reminders
-    medicationScheduleManager = MedicationScheduleManager(username)
-    upcoming_medicines = medicationScheduleManager.check_pending_medications()
-    if upcoming_medicines:
-        reminder_msg = "💊 **Reminder**:\n" + "\n".join(upcoming_medicines) + "\n\n"
-    # Recovery reminders
-    recoveryCheckUpScheduleManager = RecoveryCheckUpScheduleManager(username)
-    upcoming_check_ups = recoveryCheckUpScheduleManager.check_pending_routines()
-    if upcoming_check_ups:
-        reminder_msg += "🧘 **Recovery Tasks Due**:\n" + "\n".join(upcoming_check_ups) + "\n\n"
-    # Appointments reminders
-    appointmentManager = AppointmentManager(username)
-    upcoming_appointments = appointmentManager.check_upcoming_appointments()
-    if upcoming_appointments:
-        reminder_msg += "📅 **Appointment Tomorrow**:\n" + "\n".join(upcoming_appointments) + "\n\n"
+    timings = {}
+    for name, _, heading in REMINDER_SOURCES:
+        future = futures[name]
+        if future not in done:
+            # Not started yet (pool busy): drop it instead of running it for nobody
+            future.cancel()
+            print(f"Reminder source '{name}' timed out after {REMINDER_SOURCE_TIMEOUT_SECONDS}s")
+            timings[name] = {"status": "timeout", "ms": waited_ms}
+            continue
+        try:
+            upcoming, elapsed_ms = future.result()
+        except Exception as e:
+            print(f"Error checking {name} reminders: {e}")
+            timings[name] = {"status": "error", "ms": waited_ms}
+            continue
+        timings[name] = {"status": "ok", "ms": round(elapsed_ms, 1)}
+        if upcoming:
+            reminder_msg += heading + "\n".join(upcoming) + "\n\n"
+
+    state["reminder"] = reminder_msg
+    state["reminder_timings"] = timings
+    state["context"] = context
+    return state
 
+async def _atimed_check(check_fn, context):
+    start = time.perf_counter()
+    try:
+        upcoming = await asyncio.wait_for(check_fn(context), REMINDER_SOURCE_TIMEOUT_SECONDS)
+        status = "ok"
+    except asyncio.TimeoutError:
+        upcoming, status = [], "timeout"
+    except Exception as e:
+        print(f"Error checking reminders: {e}")
+        upcoming, status = [], "error"
+    return upcoming, status, (time.perf_counter() - start) * 1000
+
+async def acheck_reminder_node(state: AgentState) -> AgentState:
+    """
+    Async version of check_reminder_node: the three sources run concurrently
+    on the event loop, each bounded by REMINDER_SOURCE_TIMEOUT_SECONDS.
+
+    Args:
+        state (AgentState): Current state containing the username.
+
+    Returns:
+        AgentState: State with 'reminder' text and per-source 'reminder_timings'.
+    """
+    context = get_request_context(state)
+    results = await asyncio.gather(*(
+        _atimed_check(ASYNC_REMINDER_CHECKS[name], context) for name, _, _ in REMINDER_SOURCES
+    ))
+    reminder_msg = ""
+    timings = {}
+    for (name, _, heading), (upcoming, status, elapsed_ms) in zip(REMINDER_SOURCES, results):
+        if status == "timeout":
+            print(f"Reminder source '{name}' timed out after {REMINDER_SOURCE_TIMEOUT_SECONDS}s")
+        timings[name] = {"status": status, "ms": round(elapsed_ms, 1)}
+        if upcoming:
+            reminder_msg += heading + "\n".join(upcoming) + "\n\n"
     state["reminder"] = reminder_msg
+    state["reminder_timings"] = timings
+    state["context"] = context
     return state
 
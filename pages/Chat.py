@@ -10,10 +10,54 @@ import os
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 import streamlit.components.v1 as components
 
-from app.GroqChat import GroqChat
 from app.ChatHistoryManager import ChatHistoryManager
+from app.GroqChat import REPLY_TAG
 from app.MedicalRecordManager import MedicalRecordManager
-from graph.LangGraph import build_graph
+from app.RequestContext import RequestContext
+from app.Tracing import span
+from app.Utilities import iterate_async
+from graph.LangGraph import build_async_graph
+
+CHAT_HISTORY_PAGE_SIZE = 50
+
+
+def stream_reply(graph, agent_state, placeholder):
+    """
+    Runs the agent graph and renders the reply tokens as they are generated.
+
+    Tokens come from LLM calls tagged REPLY_TAG (stream_mode "messages"). The
+    final state ("values") holds the complete output, which may add prefixes
+    or reminders to the streamed text, so it replaces the partial text at the end.
+
+    Args:
+        graph: Compiled async agent graph.
+        agent_state (dict): Initial graph state.
+        placeholder: st.empty() slot inside the assistant chat message.
+
+    Returns:
+        str: The complete assistant reply.
+    """
+    streamed = ""
+    final_state = agent_state
+    # Nodes run on the shared background event loop; this script thread only renders
+    for mode, chunk in iterate_async(graph.astream(agent_state, stream_mode=["messages", "values"])):
+        if mode == "messages":
+            message, metadata = chunk
+            if REPLY_TAG in metadata.get("tags", []) and message.content:
+                streamed += message.content
+                placeholder.markdown(streamed + "▌")
+        else:
+            final_state = chunk
+    placeholder.markdown(final_state["output"])
+    return final_state["output"]
+
+
+def render_message(msg):
+    if isinstance(msg, SystemMessage):
+        return
+    role = "user" if msg.type == "human" else "assistant"
+    with st.chat_message(role):
+        st.markdown(msg.content)
 
 
 def play_audio(text: str, filename: str = "voice.mp3", voice: str = "shimmer"):
@@ -80,11 +124,11 @@ st.title(":orange[NAIA]")
 st.subheader("Your post-surgery assistant")
 
 #Initialize variables
-groqChat = GroqChat()
 chatHistoryManager = ChatHistoryManager(user_id=username)  # Use a default user ID for simplicity
 # Estado del chat
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = chatHistoryManager.load()
+    # Only the visible tail is read; new messages are appended by save()
+    st.session_state.chat_history = chatHistoryManager.load(limit=CHAT_HISTORY_PAGE_SIZE)
 
 medical_record_manager = MedicalRecordManager(username)
 if not medical_record_manager.record:
@@ -118,7 +162,7 @@ if "welcome_shown" not in st.session_state:
     play_audio(welcome_message, filename="welcome_audio.mp3")
 
 if "agent_graph" not in st.session_state:
-    st.session_state.agent_graph = build_graph()
+    st.session_state.agent_graph = build_async_graph()
 
 
 # Container for the chat history
@@ -154,40 +198,37 @@ if response:
                 st.warning("It cannot be transcripted the audio.")
         except Exception as e:
             st.error(f"Transcription error: {e}")
-    # Get response if the input is a valid text from the user
-    if user_text:
-        # Build a LLM history
-        messages = groqChat.get_initial_messages()
-        for msg in st.session_state.chat_history:
-            if isinstance(msg, HumanMessage):
-                messages.append(groqChat.human_message(msg.content))
-            elif isinstance(msg, AIMessage):
-                messages.append(groqChat.ai_message(msg.content))
 
+# Show chat history, including the message just sent, before the reply is generated
+with chat_box:
+    for msg in st.session_state.chat_history:
+        render_message(msg)
+
+# Get response if the input is a valid text from the user
+if response and user_text:
+    # One trace per turn; node, LLM, Mongo and HTTP spans are exported under it
+    with span("chat.turn", "server", user=username, voice=is_voice_input) as turn:
         agent_state = {
             "input": user_text,
             "output": "",
             "username": username,
-            "reminder": ""
+            "reminder": "",
+            "trace": turn.context(),
+            # The record loaded above is reused by every node of the turn
+            "context": RequestContext(username, medical_record_manager=medical_record_manager,
+                                      chat_history=chatHistoryManager),
         }
-        final_state = st.session_state.agent_graph.invoke(agent_state)
-        assistant_reply = final_state["output"]
+        with chat_box:
+            with st.chat_message("assistant"):
+                assistant_reply = stream_reply(st.session_state.agent_graph, agent_state, st.empty())
 
-        st.session_state.chat_history.append(AIMessage(content=assistant_reply))
-        chatHistoryManager.save(st.session_state.chat_history)
+    # The complete reply is persisted once streaming has finished
+    st.session_state.chat_history.append(AIMessage(content=assistant_reply))
+    chatHistoryManager.save(st.session_state.chat_history)
 
-        # Speak response if the input was voice 
-        if is_voice_input:
-            play_audio(assistant_reply, filename="assistant_reply.mp3")
-
-# Show chat history after processing the input
-with chat_box:
-    for msg in st.session_state.chat_history:
-        if isinstance(msg, SystemMessage):
-            continue
-        role = "user" if msg.type == "human" else "assistant"
-        with st.chat_message(role):
-            st.markdown(msg.content)    
+    # Speak response if the input was voice 
+    if is_voice_input:
+        play_audio(assistant_reply, filename="assistant_reply.mp3")
 
 st.markdown("""
     <style>
@@ -1,7 +1,7 @@
 import streamlit as st 
 from PIL import Image
 
-from app import SendReminder
+from app.ReminderScheduler import get_reminder_scheduler
 from app.MedicalRecordManager import MedicalRecordManager
 
 
@@ -59,7 +59,8 @@ if not phone:
         st.toast("No phone number is linked to the client for receiving reminders. Please visit the NHS portal and update your details.", icon="❗")
         st.session_state.no_phone_toast_shown = True    
 else:
-    SendReminder.start_monitoring_thread(username)
+    # One shared scheduler sends reminders for every logged-in patient
+    get_reminder_scheduler().register(username)
 
 
 
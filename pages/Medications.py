@@ -40,8 +40,8 @@ today = datetime.now(zn).date()
 past_df = df[df["datetime"].dt.date < today].copy()
 future_df = df[df["datetime"].dt.date >= today].copy()
 
-past_df = past_df.drop(columns=["_id"], errors="ignore")
-future_df = future_df.drop(columns=["_id"], errors="ignore")
+past_df = past_df.drop(columns=["due_at"], errors="ignore")
+future_df = future_df.drop(columns=["due_at"], errors="ignore")
 
 # To preserve past dates, show "taken_status" column
 past_df["taken_status"] = past_df["taken"].apply(lambda x: "✅" if x else "❌")
@@ -81,8 +81,12 @@ else:
         updated_tracker = pd.concat([past_df, pd.DataFrame(updated_df)]).drop(columns=["taken_status", "datetime"], errors='ignore')
         updated_tracker = updated_tracker.sort_values(by=["date", "time"])
         # medicationScheduleManager.save_tracker(updated_tracker.to_dict(orient='records'))
-        medicationScheduleManager.update_taken_status(updated_df.to_dict(orient='records'))
-        st.success("Changes saved!")
+        # Only the rows whose checkbox changed are written, in one bulk write
+        result = medicationScheduleManager.update_taken_status(
+            pd.DataFrame(updated_df).to_dict(orient='records'),
+            original_records=future_df.to_dict(orient='records'),
+        )
+        st.success(f"Changes saved! ({result['changed']} updated in {result['latency_ms']} ms)")
 
 
 past_df_display_sorted = past_df_display.sort_values(by=["date", "time"], ascending=False)
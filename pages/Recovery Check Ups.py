@@ -64,8 +64,8 @@ today = datetime.now(zn).date()
 past_df = scheduled_df[scheduled_df["datetime"].dt.date < today].copy()
 future_df = scheduled_df[scheduled_df["datetime"].dt.date >= today].copy()
 
-past_df = past_df.drop(columns=["_id"], errors="ignore")
-future_df = future_df.drop(columns=["_id"], errors="ignore")
+past_df = past_df.drop(columns=["due_at"], errors="ignore")
+future_df = future_df.drop(columns=["due_at"], errors="ignore")
 
 columns_to_exclude = ["is_ongoing", "total_days", "preferred_times", "frequency", "type"]
 future_df = future_df.drop(columns=[col for col in columns_to_exclude if col in future_df.columns], errors="ignore")
@@ -104,8 +104,12 @@ else:
         updated_tracker = pd.concat([past_df, pd.DataFrame(updated_df)]).drop(columns=["completed_status", "datetime"], errors='ignore')
         updated_tracker = updated_tracker.sort_values(by=["date", "time"])
         # recoveryCheckUpScheduleManager.save_routine_tracker(updated_tracker.to_dict(orient="records"))
-        recoveryCheckUpScheduleManager.update_completed_status(updated_df.to_dict(orient='records'))
-        st.success("Routine tracker updated!")
+        # Only the rows whose checkbox changed are written, in one bulk write
+        result = recoveryCheckUpScheduleManager.update_completed_status(
+            pd.DataFrame(updated_df).to_dict(orient='records'),
+            original_records=future_df.to_dict(orient='records'),
+        )
+        st.success(f"Routine tracker updated! ({result['changed']} updated in {result['latency_ms']} ms)")
 
 # Historical
 past_df_display_sorted = past_df_display.sort_values(by=["date", "time"], ascending=False)
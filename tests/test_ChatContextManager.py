@@ -0,0 +1,82 @@
+from langchain.schema import HumanMessage, AIMessage
+from app.ChatContextManager import SUMMARY_CHUNK_TOKENS, ChatContextManager
+
+
+class FakeHistory:
+    def __init__(self, count):
+        self.messages = [
+            (HumanMessage if i % 2 else AIMessage)(content=f"message {i}", id=f"u1:{i}")
+            for i in range(1, count + 1)
+        ]
+        self.summary, self.summary_seq = "", 0
+
+    def get_summary(self):
+        return self.summary, self.summary_seq
+
+    def load_since(self, after_seq):
+        return [m for m in self.messages if int(m.id.split(":")[1]) > after_seq]
+
+    def save_summary(self, summary, summary_seq, previous_seq):
+        if self.summary_seq != previous_seq:
+            return False
+        self.summary, self.summary_seq = summary, summary_seq
+        return True
+
+
+class FakeGroq:
+    def __init__(self, fail_after=None):
+        self.calls = []
+        self.fail_after = fail_after
+
+    def summarize_conversation(self, previous_summary, transcript, max_words):
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise RuntimeError("413 prompt too long")
+        self.calls.append(transcript)
+        return (previous_summary + " | " + transcript.replace("\n", "; ")).strip(" |")
+
+
+def make_manager(history, **kwargs):
+    manager = ChatContextManager("u1", history=history, **kwargs)
+    manager._groq = FakeGroq()
+    return manager
+
+
+def test_keeps_last_turns_and_summarises_older_ones_incrementally():
+    history = FakeHistory(10)
+    manager = make_manager(history, max_turns=2, token_budget=1000)
+    context = manager.build_context()
+    assert history.summary_seq == 6
+    assert "message 6" in context.split("Recent messages:")[0]
+    assert "message 7" in context.split("Recent messages:")[1]
+    # Only messages that left the window since the last call are summarised again
+    history.messages.append(HumanMessage(content="message 11", id="u1:11"))
+    manager.build_context()
+    assert manager.groq.calls[-1] == "user: message 7"
+    assert history.summary_seq == 7
+
+def test_short_conversation_needs_no_summary():
+    history = FakeHistory(3)
+    manager = make_manager(history, max_turns=2, token_budget=1000)
+    context = manager.build_context()
+    assert manager.groq.calls == []
+    assert context.startswith("Recent messages:")
+
+def test_token_budget_limits_verbatim_turns():
+    history = FakeHistory(6)
+    manager = make_manager(history, max_turns=10, token_budget=12)
+    recent, older = manager.split(history.messages)
+    assert recent == history.messages[-2:]
+    assert older == history.messages[:-2]
+
+def test_long_backlog_is_summarised_in_chunks_and_survives_llm_errors():
+    history = FakeHistory(40)
+    for message in history.messages:
+        message.content = "x" * (SUMMARY_CHUNK_TOKENS * 4 // 3)
+    manager = make_manager(history, max_turns=1, token_budget=SUMMARY_CHUNK_TOKENS * 2)
+    manager._groq = FakeGroq(fail_after=3)
+    context = manager.build_context()
+    assert len(manager.groq.calls) == 3
+    assert all(len(call) <= SUMMARY_CHUNK_TOKENS * 4 for call in manager.groq.calls)
+    # Progress is saved per chunk, and the turn still gets the recent messages
+    assert history.summary_seq == 6
+    assert "Recent messages:" in context
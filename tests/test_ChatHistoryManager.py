@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+import mongomock
+from langchain.schema import HumanMessage, AIMessage
+from app.ChatHistoryManager import ChatHistoryManager
+
+
+def _manager():
+    db = mongomock.MongoClient(tz_aware=True).naia_db
+    manager = ChatHistoryManager(f"test-{uuid4()}", db.chat_history, db.chat_messages)
+    manager.ensure_indexes()
+    return manager
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args):
+        self.cursor = self.cursor.sort(*args)
+        return self
+
+    async def to_list(self, length):
+        return list(self.cursor)
+
+
+def _cleanup(manager):
+    manager.collection.delete_many({"patient_id": manager.user_id})
+    manager.messages_collection.delete_many({"patient_id": manager.user_id})
+
+def test_save_appends_only_new_messages():
+    manager = _manager()
+    try:
+        history = [HumanMessage(content="hi"), AIMessage(content="hello")]
+        manager.save(history)
+        history.append(HumanMessage(content="I have pain"))
+        manager.save(history)
+        assert manager.messages_collection.count_documents({"patient_id": manager.user_id}) == 3
+        assert [ChatHistoryManager.seq_of(m) for m in history] == [1, 2, 3]
+    finally:
+        _cleanup(manager)
+
+def test_load_pages_back_through_history():
+    manager = _manager()
+    try:
+        manager.append([HumanMessage(content=f"m{i}") for i in range(5)])
+        tail = manager.load(limit=2)
+        assert [m.content for m in tail] == ["m3", "m4"]
+        older = manager.load(limit=2, before=ChatHistoryManager.seq_of(tail[0]))
+        assert [m.content for m in older] == ["m1", "m2"]
+    finally:
+        _cleanup(manager)
+
+def test_legacy_history_array_is_migrated_once():
+    manager = _manager()
+    try:
+        manager.collection.insert_one({"patient_id": manager.user_id, "history": [
+            {"role": "user", "content": "old question"}, {"role": "assistant", "content": "old answer"},
+        ]})
+        assert [m.content for m in manager.load()] == ["old question", "old answer"]
+        manager.append([HumanMessage(content="new")])
+        assert [m.content for m in manager.load()] == ["old question", "old answer", "new"]
+        assert "history" not in manager.collection.find_one({"patient_id": manager.user_id})
+    finally:
+        _cleanup(manager)
+
+def test_failed_legacy_copy_keeps_the_history_array(monkeypatch):
+    manager = _manager()
+    try:
+        legacy = [{"role": "user", "content": "old question"}, {"content": "answer without a role"}]
+        manager.collection.insert_one({"patient_id": manager.user_id, "history": legacy})
+
+        def failing_insert(*args, **kwargs):
+            raise RuntimeError("connection reset")
+
+        monkeypatch.setattr(manager.messages_collection, "insert_many", failing_insert)
+        manager.load()
+        assert manager.collection.find_one({"patient_id": manager.user_id})["history"] == legacy
+        monkeypatch.undo()
+        assert [m.content for m in manager.load()] == ["old question", "answer without a role"]
+        assert "history" not in manager.collection.find_one({"patient_id": manager.user_id})
+    finally:
+        _cleanup(manager)
+
+def test_async_reads_migrate_the_legacy_history_array(monkeypatch):
+    manager = _manager()
+    collections = {"chat_messages": manager.messages_collection}
+    async_db = SimpleNamespace(get_collection=lambda name: SimpleNamespace(
+        find=lambda *args: AsyncCursor(collections[name].find(*args))
+    ))
+    monkeypatch.setattr("app.ChatHistoryManager.AsyncDatabaseManager", lambda: async_db)
+    try:
+        manager.collection.insert_one({"patient_id": manager.user_id, "history": [
+            {"role": "user", "content": "old question"}, {"role": "assistant", "content": "old answer"},
+        ]})
+        messages = asyncio.run(manager.aload_since(0))
+        assert [m.content for m in messages] == ["old question", "old answer"]
+    finally:
+        _cleanup(manager)
@@ -9,3 +9,10 @@ def test_get_collection_returns_mongo_collection(monkeypatch):
     assert isinstance(collection, Collection)
     doc_count = collection.count_documents({})
     assert isinstance(doc_count, int)
+
+def test_database_managers_share_one_client():
+    first = DatabaseManager()
+    second = DatabaseManager()
+    assert first.client is second.client
+    stats = DatabaseManager.pool_stats()
+    assert all("open_sockets" in s for s in stats.values())
@@ -0,0 +1,30 @@
+import app.DatabaseSetup as database_setup
+
+
+class FakeManager:
+    calls = 0
+    fail = False
+
+    @staticmethod
+    def ensure_indexes():
+        FakeManager.calls += 1
+        if FakeManager.fail:
+            raise RuntimeError("server selection timeout")
+
+
+def test_setup_runs_once_per_process(monkeypatch):
+    monkeypatch.setattr(database_setup, "TRACKER_MANAGERS", [FakeManager, FakeManager])
+    monkeypatch.setattr(database_setup, "_database_ready", False)
+    FakeManager.calls, FakeManager.fail = 0, False
+    assert database_setup.ensure_database_ready() is True
+    assert database_setup.ensure_database_ready() is True
+    assert FakeManager.calls == 2
+
+def test_failed_setup_is_retried(monkeypatch):
+    monkeypatch.setattr(database_setup, "TRACKER_MANAGERS", [FakeManager])
+    monkeypatch.setattr(database_setup, "_database_ready", False)
+    FakeManager.calls, FakeManager.fail = 0, True
+    assert database_setup.ensure_database_ready() is False
+    FakeManager.fail = False
+    assert database_setup.ensure_database_ready() is True
+    assert FakeManager.calls == 2
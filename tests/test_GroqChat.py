@@ -1,6 +1,9 @@
+import asyncio
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
-from app.GroqChat import GroqChat
+import app.GroqChat as groq_chat
+from app.GroqChat import GroqChat, LoopLocalTransport, get_chat_model
 
 
 @pytest.fixture
@@ -124,3 +127,65 @@ def test_extract_reminder_info_simple_none(groq):
     assert '"total_days": 0' in result
     assert '"preferred_times": []' in result
 
+
+def test_triage_symptoms_returns_validated_schema(groq):
+    patient = {"surgery": "knee replacement", "medications": [], "pre_existing_conditions": []}
+    result = groq.triage_symptoms("My knee has been hurting for 3 days", patient)
+    assert result["overall_severity"] in ("mild", "moderate", "severe")
+    assert result["detected_symptoms"]
+    assert all(isinstance(s["duration_days"], int) for s in result["symptoms"])
+
+def test_validate_triage_rejects_invalid_schema():
+    groq = GroqChat.__new__(GroqChat)  # validation needs no API key
+    assert groq._validate_triage({"overall_severity": "unknown", "symptoms": []}) is None
+    assert groq._validate_triage({"overall_severity": "mild", "symptoms": [{"name": "pain", "duration_days": "3"}]}) is None
+    valid = groq._validate_triage({"overall_severity": "Mild", "symptoms": [{"name": "pain", "duration_days": None}]})
+    assert valid["overall_severity"] == "mild"
+    assert valid["symptoms"][0]["duration_days"] == 1
+    assert valid["detected_symptoms"] == ["pain"]
+
+def test_get_reminder_information_without_reminders_skips_the_llm():
+    groq = GroqChat.__new__(GroqChat)  # no LLM is called, so no API key is needed
+    assert groq.get_reminder_information("delete my walking reminder", []) == "NO"
+    assert asyncio.run(groq.aget_reminder_information("delete my walking reminder", [])) == "NO"
+
+def test_chat_models_are_shared_per_model_and_temperature(monkeypatch):
+    built = []
+
+    def fake_chat_groq(**kwargs):
+        built.append(kwargs)
+        return object()
+
+    monkeypatch.setattr(groq_chat, "ChatGroq", fake_chat_groq)
+    monkeypatch.setattr(groq_chat, "_chat_models", {})
+    monkeypatch.setattr(groq_chat.st, "secrets", {"GROQ_API_KEY": "test"})
+    with ThreadPoolExecutor(8) as pool:
+        models = set(pool.map(lambda _: id(get_chat_model(0.0)), range(32)))
+    first, second = GroqChat(), GroqChat()
+    assert len(models) == 1
+    assert first.classifier_llm is second.classifier_llm and first.chat_llm is not first.llm
+    assert sorted(kwargs["temperature"] for kwargs in built) == [0.0, 0.4, 0.5]
+    assert len({id(kwargs["http_client"]) for kwargs in built}) == 1
+    assert len({id(kwargs["http_async_client"]) for kwargs in built}) == 1
+
+def test_loop_local_transport_keeps_one_pool_per_loop(monkeypatch):
+    pools = []
+
+    class FakePool:
+        def __init__(self, **kwargs):
+            pools.append(self)
+            self.requests = 0
+
+        async def handle_async_request(self, request):
+            self.requests += 1
+            return request
+
+    monkeypatch.setattr(groq_chat.httpx, "AsyncHTTPTransport", FakePool)
+    transport = LoopLocalTransport(http2=True)
+
+    async def send_twice():
+        await asyncio.gather(transport.handle_async_request("a"), transport.handle_async_request("b"))
+
+    asyncio.run(send_twice())
+    asyncio.run(send_twice())
+    assert [pool.requests for pool in pools] == [2, 2]
@@ -0,0 +1,71 @@
+from app.IntentPreClassifier import IntentPreClassifier
+
+
+class FakeCursor(list):
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        return FakeCursor(self[:n])
+
+
+class FakeCollection:
+    def __init__(self, docs=None):
+        self.docs = list(docs or [])
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self.docs)
+
+    def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+def test_rules_route_prompt_examples_without_llm():
+    classifier = IntentPreClassifier()
+    calls = []
+    assert classifier.classify("I have pain in my leg", calls.append) == "symptom_agent"
+    assert classifier.classify("Did I take my ibuprofen?", calls.append) == "reminder_medication_agent"
+    assert classifier.classify("Should I go to the ER?", calls.append) == "recommendation_agent"
+    assert calls == []
+    assert classifier.metrics()["hit_rate"] == 1.0
+
+def test_low_confidence_falls_back_to_llm_and_is_logged():
+    collection = FakeCollection()
+    classifier = IntentPreClassifier(threshold=0.999, collection=collection)
+    label = classifier.classify("what time is my physio", lambda text: "reminder_recovery_agent")
+    assert label == "reminder_recovery_agent"
+    assert collection.docs[0]["label"] == "reminder_recovery_agent"
+    metrics = classifier.metrics()
+    assert metrics["llm_calls"] == 1
+    assert metrics["compared"] == 1
+
+def test_logged_traffic_is_used_for_training():
+    docs = [{"text": "how is my physio going", "label": "reminder_recovery_agent"}] * 20
+    classifier = IntentPreClassifier(collection=FakeCollection(docs))
+    label, confidence, source = classifier.predict("my physio")
+    assert (label, source) == ("reminder_recovery_agent", "model")
+    assert confidence >= 0.9
+
+def test_record_and_symptom_wording_is_not_taken_by_rules():
+    classifier = IntentPreClassifier()
+    cases = {
+        "what medications am I allergic to": "medical_record_agent",
+        "what medications was I on before surgery": "medical_record_agent",
+        "is it normal to have pain at night": "symptom_agent",
+    }
+    for text, expected in cases.items():
+        assert classifier.predict(text)[2] == "model"
+        assert classifier.classify(text, lambda _: expected) == expected
+    assert classifier.predict("what meds do I take tonight")[:2] == ("reminder_medication_agent", 1.0)
+
+def test_invalid_llm_labels_are_not_returned():
+    collection = FakeCollection()
+    classifier = IntentPreClassifier(threshold=1.1, collection=collection)
+    assert classifier.classify("I have pain in my leg", lambda _: "the symptom agent") == "symptom_agent"
+    assert classifier.classify("ok", lambda _: '"medical_record_agent".') == "medical_record_agent"
+    assert classifier.resolve_label("none", (None, 0.0, "model")) == ("chat_agent", False)
+    # The fallback for an invalid answer is not logged as a training label
+    assert [doc["label"] for doc in collection.docs] == ["medical_record_agent"]
+    metrics = classifier.metrics()
+    assert metrics["invalid_llm_labels"] == 2
+    assert metrics["compared"] == 1
@@ -0,0 +1,53 @@
+import time
+from app.LLMCache import LLMCache, make_cache_key
+from langchain.schema import HumanMessage
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc and doc["expires_at"] > query["expires_at"]["$gt"]:
+            return doc
+        return None
+
+    def update_one(self, query, update, upsert=False):
+        self.docs[query["_id"]] = dict(update["$set"], _id=query["_id"])
+
+
+def test_key_depends_on_model_temperature_and_prompt():
+    base = make_cache_key("m", 0.0, [HumanMessage(content="did I take my ibuprofen?")])
+    assert base == make_cache_key("m", 0.0, [HumanMessage(content="did I take my ibuprofen?")])
+    assert base != make_cache_key("m2", 0.0, [HumanMessage(content="did I take my ibuprofen?")])
+    assert base != make_cache_key("m", 0.0, [HumanMessage(content="did I take my paracetamol?")])
+
+def test_lru_evicts_least_recently_used():
+    cache = LLMCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats["evictions"] == 1
+
+def test_expired_entries_are_misses():
+    cache = LLMCache(ttl_seconds=0.01)
+    cache.set("a", "1")
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.metrics()["misses"] == 1
+
+def test_persistent_tier_is_shared_between_caches():
+    collection = FakeCollection()
+    LLMCache(collection=collection).set("a", "yes")
+    other = LLMCache(collection=collection)
+    assert other.get("a") == "yes"
+    assert other.get("a") == "yes"
+    assert other.stats["persistent_hits"] == 1
+    assert other.stats["memory_hits"] == 1
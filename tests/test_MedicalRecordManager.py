@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from app.MedicalRecordManager import MedicalRecordCache
+
+API_URL = "http://mock-nhs/patients"
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self._data
+
+
+class FakeSession:
+    """Returns one record per patient and honours If-None-Match."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        with self._lock:
+            self.calls.append(dict(headers or {}))
+        time.sleep(self.delay)
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, [{"patient_id": params["patient_id"], "name": "Ana"}], {"ETag": '"v1"'})
+
+
+def test_fresh_entry_is_served_from_memory():
+    session = FakeSession()
+    cache = MedicalRecordCache(ttl_seconds=60, session=session)
+    first = cache.get(API_URL, "p1")
+    second = cache.get(API_URL, "p1")
+    assert first["name"] == "Ana"
+    assert second is first
+    assert len(session.calls) == 1
+    assert cache.stats["hits"] == 1
+
+def test_force_refresh_revalidates_with_etag():
+    session = FakeSession()
+    cache = MedicalRecordCache(ttl_seconds=60, session=session)
+    first = cache.get(API_URL, "p1")
+    second = cache.get(API_URL, "p1", force_refresh=True)
+    assert second is first
+    assert session.calls[1]["If-None-Match"] == '"v1"'
+    assert cache.stats["not_modified"] == 1
+
+def test_stale_entry_is_served_while_revalidating():
+    session = FakeSession()
+    cache = MedicalRecordCache(ttl_seconds=0, stale_seconds=60, session=session)
+    first = cache.get(API_URL, "p1")
+    stale = cache.get(API_URL, "p1")
+    assert stale is first
+    assert cache.stats["stale_hits"] == 1
+    deadline = time.time() + 2
+    while len(session.calls) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(session.calls) == 2
+
+def test_concurrent_misses_share_one_request():
+    session = FakeSession(delay=0.1)
+    cache = MedicalRecordCache(ttl_seconds=60, session=session)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(API_URL, "p1"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(session.calls) == 1
+    assert all(r["name"] == "Ana" for r in results)
+
+class FakeAsyncClient:
+    """Async variant of FakeSession, shaped like httpx.AsyncClient.get."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append(dict(headers or {}))
+        await asyncio.sleep(self.delay)
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, [{"patient_id": params["patient_id"], "name": "Ana"}], {"ETag": '"v1"'})
+
+def test_async_concurrent_misses_share_one_request():
+    client = FakeAsyncClient(delay=0.05)
+    cache = MedicalRecordCache(ttl_seconds=60, async_client=client)
+
+    async def run():
+        return await asyncio.gather(*(cache.aget(API_URL, "p1") for _ in range(8)))
+
+    results = asyncio.run(run())
+    assert len(client.calls) == 1
+    assert all(r["name"] == "Ana" for r in results)
+    assert cache.get(API_URL, "p1")["name"] == "Ana"
+    assert cache.stats["hits"] == 1
@@ -0,0 +1,36 @@
+import os
+from app.NHSGuidanceIndex import NHSGuidanceIndex, chunk_text, main
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "nhs_pages")
+
+
+def build_index():
+    index = NHSGuidanceIndex()
+    index.ingest_directory(FIXTURES)
+    return index
+
+
+def test_top_passage_matches_surgery_and_symptoms():
+    index = build_index()
+    score, passage = index.search("hip replacement swollen painful calf", k=1)[0]
+    assert passage["url"] == "https://www.nhs.uk/tests-and-treatments/hip-replacement/risks/"
+    assert "blood clot" in passage["text"].lower()
+    _, passage = index.search("knee replacement swelling", k=1)[0]
+    assert "knee" in passage["url"]
+    assert index.search("quantum chromodynamics") == []
+
+def test_index_round_trips_through_disk(tmp_path):
+    path = str(tmp_path / "index.json.gz")
+    main(["--from-dir", FIXTURES, "--out", path])
+    loaded = NHSGuidanceIndex.load(path)
+    original = build_index()
+    assert loaded.search("wound infection redness") == original.search("wound infection redness")
+    context = loaded.context_for("wound infection redness", k=2, max_chars=400)
+    assert "wound-infection" in context and len(context) <= 400
+
+def test_chunks_respect_size_and_overlap():
+    text = "\n".join(f"line {i} " + "word " * 30 for i in range(10))
+    chunks = chunk_text(text, max_words=100, overlap=10)
+    assert len(chunks) > 1
+    assert all(len(c.split()) <= 200 for c in chunks)
+    assert chunks[0].split()[-10:] == chunks[1].split()[:10]
@@ -0,0 +1,47 @@
+import threading
+import time
+from types import SimpleNamespace
+from app.NHSPageFetcher import NHSPageFetcher, freshness_lifetime
+
+
+class FakeSession:
+    def __init__(self, headers):
+        self.headers = headers
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        with self._lock:
+            self.requests.append((url, dict(headers or {})))
+        time.sleep(0.05)
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return SimpleNamespace(status_code=304, headers=self.headers, text="", raise_for_status=lambda: None)
+        return SimpleNamespace(status_code=200, headers=self.headers, text=f"<html>{url}</html>", raise_for_status=lambda: None)
+
+
+def test_fresh_pages_are_served_from_disk(tmp_path):
+    session = FakeSession({"Cache-Control": "max-age=600", "ETag": '"v1"'})
+    fetcher = NHSPageFetcher(str(tmp_path), session=session)
+    assert fetcher.fetch("https://www.nhs.uk/a") == "<html>https://www.nhs.uk/a</html>"
+    # A new fetcher on the same folder (e.g. after a restart) still hits the cache
+    again = NHSPageFetcher(str(tmp_path), session=session)
+    assert again.fetch("https://www.nhs.uk/a") == "<html>https://www.nhs.uk/a</html>"
+    assert len(session.requests) == 1 and again.stats["hits"] == 1
+
+def test_stale_pages_are_revalidated_with_etag(tmp_path):
+    session = FakeSession({"Cache-Control": "no-cache", "ETag": '"v1"'})
+    fetcher = NHSPageFetcher(str(tmp_path), session=session)
+    fetcher.fetch("https://www.nhs.uk/a")
+    assert fetcher.fetch("https://www.nhs.uk/a") == "<html>https://www.nhs.uk/a</html>"
+    assert session.requests[1][1] == {"If-None-Match": '"v1"'}
+    assert fetcher.stats["revalidated"] == 1
+    assert freshness_lifetime({"Cache-Control": "no-store"}) is None
+
+def test_fetch_many_runs_concurrently(tmp_path):
+    session = FakeSession({})
+    fetcher = NHSPageFetcher(None, session=session, workers=4)
+    urls = [f"https://www.nhs.uk/{i}" for i in range(4)]
+    started = time.perf_counter()
+    pages = fetcher.fetch_many(urls)
+    assert pages == [f"<html>{url}</html>" for url in urls]
+    assert time.perf_counter() - started < 0.15
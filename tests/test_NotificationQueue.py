@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+from pymongo.errors import DuplicateKeyError
+from app.NotificationQueue import FakeTransport, NotificationError, NotificationQueue, TokenBucket
+
+
+class FakeLog:
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate key")
+        self.docs[doc["_id"]] = dict(doc)
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc and "$or" not in query:
+            doc.update(update["$set"])
+            return SimpleNamespace(modified_count=1)
+        return SimpleNamespace(modified_count=0)
+
+    def update_many(self, query, update):
+        for key in query["_id"]["$in"]:
+            self.docs[key].update(update["$set"])
+
+
+class FlakyTransport(FakeTransport):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, to, body):
+        if self.failures:
+            self.failures -= 1
+            raise NotificationError("503")
+        return super().send(to, body)
+
+
+def test_idempotency_key_is_sent_once():
+    log = FakeLog()
+    transport = FakeTransport()
+    notifications = NotificationQueue(transport, log, workers=2, rate_per_second=100)
+    assert notifications.enqueue("medication:p1:a", "+441234567890", "Take Ibuprofen")
+    assert not notifications.enqueue("medication:p1:a", "+441234567890", "Take Ibuprofen")
+    assert not notifications.enqueue("medication:p1:b", "12345", "Invalid number")
+    notifications.flush()
+    assert transport.sent == [("+441234567890", "Take Ibuprofen")]
+    assert log.docs["medication:p1:a"]["status"] == "sent"
+
+def test_claimed_keys_share_the_delivery_status_of_their_sms():
+    log = FakeLog()
+    transport = FakeTransport()
+    notifications = NotificationQueue(transport, log, workers=1, rate_per_second=100)
+    assert notifications.claim(["medication:p1:a"], "+441234567890") == ["medication:p1:a"]
+    claimed = notifications.claim(["medication:p1:a", "medication:p1:b"], "+441234567890")
+    assert claimed == ["medication:p1:b"]
+    assert notifications.enqueue_claimed(claimed, "+441234567890", "Take Paracetamol")
+    notifications.flush()
+    assert transport.sent == [("+441234567890", "Take Paracetamol")]
+    assert log.docs["medication:p1:b"]["status"] == "sent"
+    assert log.docs["medication:p1:a"]["status"] == "queued"
+
+def test_retryable_errors_are_retried_with_backoff():
+    log = FakeLog()
+    notifications = NotificationQueue(FlakyTransport(failures=2), log, workers=1, rate_per_second=100, backoff=0.01)
+    notifications.enqueue("k", "+441234567890", "hello")
+    notifications.flush()
+    assert notifications.metrics()["retries"] == 2
+    assert log.docs["k"]["attempts"] == 3
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.18
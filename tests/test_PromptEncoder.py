@@ -0,0 +1,42 @@
+from app.PromptEncoder import PromptEncoder
+from app.Utilities import estimate_tokens
+
+
+def dose(name, dose_text, time, taken=False, date="2026-10-18"):
+    return {"id": f"rule-{name}|{date}|{time}", "patient_id": "patient0001", "med_name": name, "dose": dose_text,
+            "frequency": "3x/day", "date": date, "time": time, "taken": taken, "due_at": f"{date}T{time}:00+01:00"}
+
+
+def test_doses_are_grouped_per_medication_without_internal_fields():
+    rows = [dose("Ibuprofen", "200mg", "14:00"), dose("Ibuprofen", "200mg", "08:00", taken=True),
+            dose("Paracetamol", "500mg", "12:00")]
+    text = PromptEncoder().medication_schedule(rows)
+    assert text.splitlines() == [
+        "date | medication | dose | doses",
+        "2026-10-18 | Ibuprofen | 200mg | 08:00 taken, 14:00 pending",
+        "2026-10-18 | Paracetamol | 500mg | 12:00 pending",
+    ]
+    assert "patient0001" not in text and "3x/day" not in text
+    assert PromptEncoder().medication_schedule([]) == "No medications scheduled."
+
+def test_sections_are_cut_to_the_token_budget():
+    encoder = PromptEncoder(token_budget=60)
+    rows = [dose(f"Medicine {i}", "10mg", "09:00") for i in range(20)]
+    text = encoder.medication_schedule(rows)
+    assert estimate_tokens(text) <= 60
+    assert text.endswith("more rows not shown")
+    shown = len(text.splitlines()) - 2
+    assert encoder.stats["lines_dropped"] == 20 - shown and encoder.stats["truncated"] == 1
+    assert encoder.stats["tokens"] == estimate_tokens(text)
+
+def test_recovery_rows_keep_duration_notes_and_ongoing_tasks():
+    rows = [
+        {"activity": "Knee stretches", "date": "2026-10-18", "time": "14:00", "completed": False, "duration_minutes": 10},
+        {"activity": "Knee stretches", "date": "2026-10-18", "time": "09:00", "completed": True, "duration_minutes": 10},
+        {"activity": "Drink | water", "date": "2026-10-18", "time": None, "completed": False, "notes": "2 litres"},
+    ]
+    lines = PromptEncoder().recovery_schedule(rows).splitlines()
+    assert lines[1:] == [
+        "2026-10-18 | Drink / water | - | ongoing pending | 2 litres",
+        "2026-10-18 | Knee stretches | 10 | 09:00 done, 14:00 pending | -",
+    ]
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from app.RecurrenceRule import (
+    build_rule, changed_rows, expand_rule, expand_tracker, occurrence_update, write_status_changes
+)
+
+
+def make_rule():
+    return build_rule("p1", "2025-03-01", ["09:00", "21:00"], 10, {"med_name": "Ibuprofen", "dose": "200mg"})
+
+
+def test_rule_expands_to_one_row_per_dose():
+    rule = make_rule()
+    rows = expand_rule(rule, "taken")
+    assert len(rows) == 20
+    assert rows[0]["id"] == f"{rule['id']}|2025-03-01|09:00"
+    assert rows[-1]["date"] == "2025-03-10" and rows[-1]["time"] == "21:00"
+    assert rows[0]["med_name"] == "Ibuprofen" and rows[0]["taken"] is False
+    assert rule["start_at"] == rows[0]["due_at"] and rule["end_at"] == rows[-1]["due_at"]
+
+def test_window_expansion_only_returns_doses_inside_it():
+    rule = make_rule()
+    start = datetime(2025, 3, 5, 8, 30, tzinfo=timezone.utc)
+    end = datetime(2025, 3, 5, 9, 30, tzinfo=timezone.utc)
+    rows = expand_rule(rule, "taken", start, end)
+    assert [(r["date"], r["time"]) for r in rows] == [("2025-03-05", "09:00")]
+
+def test_completion_is_stored_as_sparse_exception():
+    rule = make_rule()
+    row_id = f"{rule['id']}|2025-03-02|21:00"
+    query, update = occurrence_update(row_id, "taken", True)
+    assert query == {"id": rule["id"], "kind": "rule"}
+    assert update == {"$addToSet": {"done": "2025-03-02|21:00"}}
+    rule["done"].append("2025-03-02|21:00")
+    taken = [r["id"] for r in expand_tracker([rule], "taken") if r["taken"]]
+    assert taken == [row_id]
+    # Rows stored one per dose are still updated in place
+    assert occurrence_update("legacy-id", "taken", False) == ({"id": "legacy-id"}, {"$set": {"taken": False}})
+
+def test_only_changed_rows_are_written_in_one_bulk_write():
+    rows = expand_rule(make_rule(), "taken")
+    edited = [dict(row) for row in rows]
+    edited[3]["taken"] = True
+    calls = []
+    collection = SimpleNamespace(bulk_write=lambda ops, ordered: calls.append((ops, ordered)) or SimpleNamespace(modified_count=len(ops)))
+    result = write_status_changes(collection, changed_rows(rows, edited, "taken"), "taken")
+    assert result["changed"] == 1 and result["modified"] == 1
+    assert len(calls) == 1 and calls[0][1] is False
+    assert write_status_changes(collection, changed_rows(rows, rows, "taken"), "taken")["changed"] == 0
+    assert len(calls) == 1
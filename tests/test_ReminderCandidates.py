@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+from app.PromptEncoder import PromptEncoder
+from app.ReminderCandidates import mentioned_dates, select_candidates, select_rows
+
+TODAY = date(2026, 10, 18)  # a Sunday
+ACTIVITIES = ["Knee stretches", "Apply ice to the knee", "Walk around the house", "Wound dressing check",
+              "Ankle pumps", "Quad sets", "Drink water", "Heel slides", "Breathing exercises", "Elevate the leg"]
+
+
+def schedule(days):
+    return [
+        {"activity": activity, "date": (TODAY + timedelta(days=day)).isoformat(), "time": time,
+         "completed": False, "type": "doctor", "_id": f"{activity}{day}{time}"}
+        for day in range(-days, days) for activity in ACTIVITIES for time in ("09:00", "14:00", "19:00")
+    ]
+
+
+def test_fuzzy_match_ranks_the_named_activity_first():
+    candidates = select_candidates("I did my knee strech", schedule(15), k=4, today=TODAY)
+    assert candidates[0]["activity"] == "Knee stretches"
+    assert len(candidates) == 4
+    # The representative row is the next occurrence
+    assert candidates[0]["date"] == TODAY.isoformat()
+    assert select_candidates("applied the ice", schedule(15), k=4, today=TODAY)[0]["activity"] == "Apply ice to the knee"
+
+def test_candidates_stay_bounded_as_the_schedule_grows():
+    short = select_candidates("what are my heel slides", schedule(1), today=TODAY)
+    long = select_candidates("what are my heel slides", schedule(200), today=TODAY)
+    assert [r["activity"] for r in short] == [r["activity"] for r in long]
+    assert len(long) == 8 and long[0]["activity"] == "Heel slides"
+
+def test_rows_follow_the_dates_and_activities_named():
+    assert mentioned_dates("anything on friday?", TODAY) == {"2026-10-23"}
+    rows = select_rows("when are my ankle pumps tomorrow?", schedule(30), today=TODAY)
+    assert [(r["activity"], r["date"], r["time"]) for r in rows] == [
+        ("Ankle pumps", "2026-10-19", t) for t in ("09:00", "14:00", "19:00")
+    ]
+    assert "_id" not in rows[0]
+    assert len(select_rows("what do I have today?", schedule(30), today=TODAY)) == 30
+
+def test_a_busy_day_is_not_cut_before_the_prompt_budget():
+    rows = select_rows("what do I have today?", schedule(2), today=TODAY)
+    assert len(rows) == len(ACTIVITIES) * 3 > 24
+    table = PromptEncoder().recovery_schedule(rows)
+    assert all(activity in table for activity in ACTIVITIES)
+    small = PromptEncoder(token_budget=60).recovery_schedule(rows)
+    assert small.endswith("more rows not shown")
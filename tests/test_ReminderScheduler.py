@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+from app.ReminderScheduler import ReminderScheduler
+
+NOW = datetime(2025, 1, 1, 8, 0, tzinfo=timezone.utc)
+
+
+class FakeScheduler(ReminderScheduler):
+    def __init__(self, meds, claims=None):
+        self.sms = []
+        self.meds = meds
+        self.claims = claims if claims is not None else set()
+        self.load_calls = 0
+        super().__init__(horizon=timedelta(hours=6), sender=lambda phone, msg, key: self.sms.append(msg) or True, clock=lambda: NOW)
+
+    def load_medications(self, patient_id, start, end):
+        self.load_calls += 1
+        return [m for m in self.meds if start <= m["due_at"] <= end and not m.get("taken")]
+
+    def load_appointments(self, patient_id, start, end):
+        return []
+
+    def load_patient(self, patient_id):
+        return {"name": "Ana", "phone": "+441234567890"}
+
+    def claim_reminders(self, phone, keys):
+        claimed = [key for key in keys if key not in self.claims]
+        self.claims.update(claimed)
+        return claimed
+
+
+def med(med_id, minutes, name="Ibuprofen"):
+    return {"id": med_id, "med_name": name, "dose": "200mg", "due_at": NOW + timedelta(minutes=minutes)}
+
+
+def test_due_doses_are_batched_into_one_sms():
+    scheduler = FakeScheduler([med("1", 30), med("2", 30, "Paracetamol"), med("3", 120)])
+    scheduler.register("p1")
+    scheduler.run_pending(NOW)
+    assert scheduler.sms == []
+    assert scheduler.run_pending(NOW + timedelta(minutes=30)) == 1
+    assert "Ibuprofen" in scheduler.sms[0] and "Paracetamol" in scheduler.sms[0]
+    # Nothing is reloaded or re-sent until the next dose
+    assert scheduler.run_pending(NOW + timedelta(minutes=31)) == 0
+    assert scheduler.load_calls == 1
+
+def test_invalidate_drops_reminders_for_changed_tracker():
+    meds = [med("1", 30)]
+    scheduler = FakeScheduler(meds)
+    scheduler.register("p1")
+    scheduler.run_pending(NOW)
+    meds[0]["taken"] = True
+    scheduler.invalidate("p1")
+    assert scheduler.run_pending(NOW + timedelta(minutes=30)) == 0
+    assert scheduler.sms == []
+    assert scheduler.stats["stale"] >= 1
+
+def test_a_restart_does_not_resend_doses_in_a_different_batch():
+    claims = set()
+    meds = [med("1", 30)]
+    scheduler = FakeScheduler(meds, claims)
+    scheduler.register("p1")
+    scheduler.run_pending(NOW)
+    assert scheduler.run_pending(NOW + timedelta(minutes=30)) == 1
+    # A fresh process sees the same dose batched with one added since
+    meds.append(med("2", 30, "Paracetamol"))
+    restarted = FakeScheduler(meds, claims)
+    restarted.register("p1")
+    restarted.run_pending(NOW)
+    assert restarted.run_pending(NOW + timedelta(minutes=30)) == 1
+    assert "Paracetamol" in restarted.sms[0] and "Ibuprofen" not in restarted.sms[0]
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import app.RequestContext as request_context
+from app.RequestContext import RequestContext, get_request_context
+
+
+class FakeRecordManager:
+    loads = 0
+
+    def __init__(self, username, load=True):
+        self.username = username
+        self.record = None
+        if load:
+            FakeRecordManager.loads += 1
+            self.record = {"name": username}
+
+    @classmethod
+    async def acreate(cls, username):
+        await asyncio.sleep(0.01)
+        return cls(username)
+
+
+class FakeManager:
+    built = 0
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        with FakeManager._lock:
+            FakeManager.built += 1
+
+
+def test_resources_are_built_once_per_turn(monkeypatch):
+    monkeypatch.setattr(request_context, "GroqChat", FakeManager)
+    monkeypatch.setattr(request_context, "MedicationScheduleManager", FakeManager)
+    FakeManager.built = 0
+    context = RequestContext("u1")
+    with ThreadPoolExecutor(8) as pool:
+        clients = set(pool.map(lambda _: id(context.groq), range(16)))
+        managers = set(pool.map(lambda _: id(context.medication_manager), range(16)))
+    assert len(clients) == 1 and len(managers) == 1
+    assert FakeManager.built == 2
+    assert context.created == {"groq": 1, "medication_manager": 1}
+
+def test_concurrent_async_record_loads_share_one_request(monkeypatch):
+    monkeypatch.setattr(request_context, "MedicalRecordManager", FakeRecordManager)
+    FakeRecordManager.loads = 0
+    context = RequestContext("u1")
+
+    async def load_twice():
+        return await asyncio.gather(context.amedical_record_manager(), context.amedical_record_manager())
+
+    first, second = asyncio.run(load_twice())
+    assert first is second is context.medical_record_manager
+    assert FakeRecordManager.loads == 1
+    assert context.record == {"name": "u1"}
+
+def test_state_context_is_reused_and_page_record_is_not_reloaded(monkeypatch):
+    monkeypatch.setattr(request_context, "MedicalRecordManager", FakeRecordManager)
+    FakeRecordManager.loads = 0
+    page_manager = FakeRecordManager("u1")
+    context = RequestContext("u1", medical_record_manager=page_manager)
+    assert get_request_context({"username": "u1", "context": context}) is context
+    assert context.medical_record_manager is page_manager
+    assert FakeRecordManager.loads == 1
+    assert get_request_context({"username": "u2"}).username == "u2"
+
+def test_different_objects_are_built_in_parallel(monkeypatch):
+    barrier = threading.Barrier(2, timeout=2)
+
+    class SlowManager:
+        def __init__(self, *args):
+            # Both constructors must be running at once to get past the barrier
+            barrier.wait()
+
+    monkeypatch.setattr(request_context, "MedicationScheduleManager", SlowManager)
+    monkeypatch.setattr(request_context, "RecoveryCheckUpScheduleManager", SlowManager)
+    context = RequestContext("u1")
+    with ThreadPoolExecutor(2) as pool:
+        medication = pool.submit(lambda: context.medication_manager)
+        recovery = pool.submit(lambda: context.recovery_manager)
+        assert isinstance(medication.result(), SlowManager) and isinstance(recovery.result(), SlowManager)
+    assert context.created == {"medication_manager": 1, "recovery_manager": 1}
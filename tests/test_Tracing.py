@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+from app.Tracing import MemorySpanExporter, MongoCommandTracer, set_exporter, span, summarize, traced_node
+
+
+def test_spans_nest_across_tasks_and_graph_state():
+    exporter = MemorySpanExporter()
+    set_exporter(exporter)
+
+    async def child(i):
+        with span("child", index=i):
+            await asyncio.sleep(0.01)
+
+    async def node(state):
+        await asyncio.gather(child(0), child(1))
+        return "chat_agent"
+
+    try:
+        with span("chat.turn") as turn:
+            route = asyncio.run(traced_node("classify_intent", node)({"trace": turn.context()}))
+    finally:
+        set_exporter(None)
+    spans = {s["name"]: s for s in exporter.spans}
+    assert route == "chat_agent"
+    assert spans["node:classify_intent"]["parent_span_id"] == spans["chat.turn"]["span_id"]
+    assert spans["node:classify_intent"]["attributes"]["route"] == "chat_agent"
+    children = [s for s in exporter.spans if s["name"] == "child"]
+    assert len(children) == 2
+    assert all(s["parent_span_id"] == spans["node:classify_intent"]["span_id"] for s in children)
+    assert len({s["trace_id"] for s in exporter.spans}) == 1
+
+def test_mongo_commands_are_traced_only_inside_a_span():
+    exporter = MemorySpanExporter()
+    set_exporter(exporter)
+    tracer = MongoCommandTracer()
+
+    def command(request_id):
+        started = SimpleNamespace(request_id=request_id, connection_id=("db", 27017),
+                                  command_name="find", command={"find": "medicationTracker"})
+        tracer.started(started)
+        tracer.succeeded(SimpleNamespace(request_id=request_id, connection_id=("db", 27017), command_name="find",
+                                         database_name="naia_db", duration_micros=2500))
+
+    try:
+        command(1)
+        with span("node:check_reminder"):
+            command(2)
+    finally:
+        set_exporter(None)
+    mongo = [s for s in exporter.spans if s["name"] == "mongo.find"]
+    assert len(mongo) == 1
+    assert mongo[0]["duration_ms"] == 2.5
+    assert mongo[0]["attributes"]["db.collection"] == "medicationTracker"
+
+def test_summary_ranks_by_p95():
+    spans = [{"name": "node:chat_agent", "duration_ms": ms, "attributes": {}} for ms in (10, 12, 11)]
+    spans += [{"name": "llm.chat", "duration_ms": ms, "attributes": {"total_tokens": 40}} for ms in (300, 900)]
+    rows = summarize(spans)
+    assert rows[0]["name"] == "llm.chat" and rows[0]["p95_ms"] == 900 and rows[0]["tokens"] == 80
+    assert rows[1]["count"] == 3
@@ -0,0 +1,47 @@
+import mongomock
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+from app.RecurrenceRule import build_rule, expand_tracker
+from data.TrackerRepository import TrackerRepository, raw_collection
+
+
+def medication_collection():
+    collection = mongomock.MongoClient(tz_aware=True).naia_db.medicationTracker
+    collection.insert_one(build_rule("p1", "2026-10-18", ["08:00", "20:00"], 2,
+                                     {"med_name": "Ibuprofen", "dose": "200mg", "frequency": "2x/day"}))
+    collection.insert_one({"id": "row-1", "patient_id": "p1", "med_name": "Paracetamol", "dose": "500mg",
+                           "frequency": "1x/day", "date": "2026-10-18", "time": "12:00", "taken": True})
+    return collection
+
+
+def test_prompt_view_drops_id_and_unused_fields_but_keeps_rules_expandable():
+    repository = TrackerRepository("medicationTracker", medication_collection())
+    rows = expand_tracker(repository.find({"patient_id": "p1"}, "prompt"), "taken")
+    assert len(rows) == 5
+    assert all("_id" not in row and "frequency" not in row for row in rows)
+    assert {(row["med_name"], row["dose"]) for row in rows} == {("Ibuprofen", "200mg"), ("Paracetamol", "500mg")}
+    page = repository.find({"patient_id": "p1"}, "page")
+    assert all("_id" not in doc for doc in page) and page[1]["frequency"] == "1x/day"
+
+def test_reminder_view_sorts_and_keeps_the_scheduler_fallback_key():
+    collection = mongomock.MongoClient(tz_aware=True).naia_db.appointmentTracker
+    collection.insert_many([
+        {"patient_id": "p1", "date": "2026-10-20", "time": "10:00", "due_at": 2, "department": "Ortho", "notes": "x"},
+        {"patient_id": "p1", "date": "2026-10-19", "time": "09:00", "due_at": 1, "department": "Physio"},
+    ])
+    appointments = TrackerRepository("appointmentTracker", collection).find({"patient_id": "p1"}, "reminder",
+                                                                            sort=[("due_at", 1)])
+    assert [appt["department"] for appt in appointments] == ["Physio", "Ortho"]
+    assert "_id" in appointments[0] and "notes" not in appointments[1] and "patient_id" not in appointments[0]
+
+def test_reminder_reads_decode_lazily_where_the_client_supports_it():
+    mocked = mongomock.MongoClient().naia_db.medicationTracker
+    assert raw_collection(mocked) is mocked
+    real = MongoClient("mongodb://localhost", connect=False, tz_aware=True).naia_db.medicationTracker
+    raw = raw_collection(real)
+    assert raw.codec_options.document_class is RawBSONDocument and raw.codec_options.tz_aware
+    rule = build_rule("p1", "2026-10-18", ["08:00"], 3, {"med_name": "Ibuprofen", "dose": "200mg"})
+    rows = expand_tracker([RawBSONDocument(encode(rule), raw.codec_options)], "taken")
+    assert [row["date"] for row in rows] == ["2026-10-18", "2026-10-19", "2026-10-20"]
+    assert rows[0]["med_name"] == "Ibuprofen" and rows[0]["due_at"].tzinfo is not None
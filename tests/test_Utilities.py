@@ -0,0 +1,13 @@
+from datetime import datetime, timezone
+from app.Utilities import to_due_at
+
+
+def test_to_due_at_converts_london_summer_time_to_utc():
+    assert to_due_at("2025-07-01", "09:00") == datetime(2025, 7, 1, 8, 0, tzinfo=timezone.utc)
+
+def test_to_due_at_converts_london_winter_time_to_utc():
+    assert to_due_at("2025-01-15", "09:00") == datetime(2025, 1, 15, 9, 0, tzinfo=timezone.utc)
+
+def test_to_due_at_returns_none_without_time():
+    assert to_due_at("2025-01-15", None) is None
+    assert to_due_at("2025-01-15", "soon") is None